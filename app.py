@@ -26,7 +26,8 @@ from src.utils.template_utils import extract_placeholders, extract_placeholder_c
 from src.utils.llm_handler import configure_gemini_client, get_machine_specific_fields_via_llm, answer_pdf_question
 from src.utils.doc_filler import fill_word_document_from_llm_data
 from src.utils.html_doc_filler import fill_and_generate_html
-from src.utils.form_generator import generate_goa_form, extract_schema_from_excel, OUTPUT_HTML_PATH
+from src.utils.form_generator import generate_goa_form, OUTPUT_HTML_PATH
+from src.utils.template_registry import get_excel_schema, get_docx_schema
 from src.utils.crm_utils import (
     init_db, save_client_info, load_all_clients, get_client_by_id, 
     update_client_record, save_priced_items, load_priced_items_for_quote, 
@@ -36,6 +37,7 @@ from src.utils.crm_utils import (
     load_goa_modifications, load_machine_templates_with_modifications, 
     update_template_after_modifications, find_machines_by_name, load_all_processed_machines
 )
+from src.utils.warmup import start_background_warmup
 
 # Define Template File Constants
 TEMPLATE_FILE = os.path.join("templates", "template.docx")
@@ -411,7 +413,7 @@ def process_machine_specific_data(machine_data):
                 fill_word_document_from_llm_data(template_file_path, machine_filled_data, machine_specific_output_path)
             else:
                 # Use HTML logic for standard GOA
-                # 1. Regenerate form to ensure it's up to date
+                # 1. Regenerate the form only if the Excel template changed
                 if not generate_goa_form():
                     st.error("Failed to generate HTML form template.")
                     return False
@@ -670,13 +672,11 @@ def get_contexts_for_machine(machine_record: Dict[str, Any]) -> Tuple[Dict[str,
     if source_exists:
         try:
             if config_key == "default":
-                # For default GOA, extract schema from Excel source of truth
-                print("Extracting schema from Excel for default config")
-                contexts = extract_schema_from_excel()
+                # For default GOA, use the schema compiled from the Excel source of truth
+                contexts = get_excel_schema()
             else:
-                # Use the unified function from template_utils
-                # The schema extraction is more robust and suitable for both types
-                contexts = template_utils.extract_placeholder_schema(
+                # Compiled once per template version by the template registry
+                contexts = get_docx_schema(
                     template_path=active_template_file,
                     explicit_mappings=config["explicit_mappings"],
                     is_sortstar=config["is_sortstar"]
@@ -765,6 +765,7 @@ def main():
     st.set_page_config(layout="wide", page_title="QuoteFlow Document Assistant")
     initialize_session_state()
     init_db() 
+    start_background_warmup()  # no-op unless GOA_WARMUP=1; never blocks the first render
     if not st.session_state.crm_data_loaded: load_crm_data()
     
     if st.session_state.error_message: st.error(st.session_state.error_message); st.session_state.error_message = ""
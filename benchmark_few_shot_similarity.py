@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Benchmark for get_similar_examples.
+Compares the inverted token index against the previous full scan with Python
+Jaccard scoring on synthetic few-shot stores of 10k and 100k examples.
+"""
+
+import itertools
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from src.utils.crm_utils import init_db, save_few_shot_examples_bulk, get_similar_examples
+
+VOCABULARY = [f"term{i}" for i in range(50_000)]
+ZIPF_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+QUERIES = 20
+
+
+def synthetic_context(rng: random.Random) -> str:
+    # Zipfian word frequencies, 60 words per context like a field context excerpt
+    return " ".join(rng.choices(VOCABULARY, cum_weights=ZIPF_WEIGHTS, k=60))
+
+
+def full_scan_similar(input_text: str, machine_type: str, template_type: str, limit: int, db_path: str):
+    """The previous implementation: read every row, tokenize and score in Python."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("""
+    SELECT e.id, c.input_context, e.expected_output, e.field_name, e.confidence_score,
+           e.usage_count, e.success_count
+    FROM few_shot_examples e LEFT JOIN few_shot_contexts c ON c.id = e.context_id
+    WHERE e.machine_type = ? AND e.template_type = ?
+    """, (machine_type, template_type)).fetchall()
+    conn.close()
+    input_words = set(input_text.lower().split())
+    examples = []
+    for row in rows:
+        context_words = set(row["input_context"].lower().split())
+        union = len(input_words | context_words)
+        similarity = len(input_words & context_words) / union if union else 0
+        if similarity > 0.1:
+            examples.append(dict(row, similarity=similarity))
+    examples.sort(key=lambda x: (x["similarity"], x["confidence_score"], x["success_count"]), reverse=True)
+    return examples[:limit]
+
+
+if __name__ == "__main__":
+    workdir = tempfile.mkdtemp(prefix="similar_bench_")
+    rng = random.Random(3)
+    for size in (10_000, 100_000):
+        db_path = os.path.join(workdir, f"bench_{size}.db")
+        init_db(db_path)
+        examples = [{
+            "machine_type": "filling", "template_type": "default", "field_name": f"field_{i % 200}",
+            "input_context": synthetic_context(rng), "expected_output": "YES",
+        } for i in range(size)]
+        start = time.perf_counter()
+        save_few_shot_examples_bulk(examples, db_path=db_path)
+        insert_seconds = time.perf_counter() - start
+
+        queries = [" ".join(ex["input_context"].split()[:12]) for ex in rng.sample(examples, QUERIES)]
+        start = time.perf_counter()
+        scan_results = [full_scan_similar(query, "filling", "default", 5, db_path) for query in queries]
+        scan_ms = (time.perf_counter() - start) / QUERIES * 1000
+        start = time.perf_counter()
+        index_results = [get_similar_examples(query, "filling", "default", limit=5, db_path=db_path) for query in queries]
+        index_ms = (time.perf_counter() - start) / QUERIES * 1000
+        agreeing = sum([round(r["similarity"], 9) for r in a] == [round(r["similarity"], 9) for r in b]
+                       for a, b in zip(scan_results, index_results))
+
+        print(f"\n--- {size} examples (bulk insert incl. token index: {insert_seconds:.1f}s) ---")
+        print(f"Full scan     : {scan_ms:.1f}ms per query")
+        print(f"Token index   : {index_ms:.1f}ms per query")
+        print(f"Same top-5 similarities as the full scan: {agreeing}/{QUERIES} queries")
+    shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+"""
+Script to compact the few-shot example store.
+Merges near-duplicate examples, caps the examples kept per field and rebuilds
+the example index once. Run it periodically as the example volume grows.
+"""
+
+import os
+import sys
+
+from src.utils.crm_utils import init_db, DB_PATH, FEW_SHOT_MAX_EXAMPLES_PER_FIELD
+from src.utils.few_shot_enhanced import compact_few_shot_store
+
+if __name__ == "__main__":
+    max_per_field = int(sys.argv[1]) if len(sys.argv) > 1 else FEW_SHOT_MAX_EXAMPLES_PER_FIELD
+    print(f"Compacting few-shot examples in {os.path.abspath(DB_PATH)} (max {max_per_field} per field)...")
+    init_db()
+    stats = compact_few_shot_store(max_per_field=max_per_field)
+    print(f"Examined {stats['examined']} example(s): merged {stats['merged']}, evicted {stats['evicted']}, "
+          f"{stats['remaining']} remaining.")
+    print(f"Removed {stats['contexts_removed']} unused context(s).")
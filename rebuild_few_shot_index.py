@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+"""
+Script to rebuild the few-shot example index of every field in one job.
+Embeds the stored examples in batched, rate-limited requests, writes the new
+index next to the current one and swaps it in atomically, so the app never
+re-indexes fields on the request path. Run it after bulk imports or compaction.
+"""
+
+import os
+import sys
+
+from src.utils.crm_utils import init_db, DB_PATH
+from src.utils.few_shot_enhanced import rebuild_few_shot_indexes, FEW_SHOT_REBUILD_BATCH_SIZE
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else FEW_SHOT_REBUILD_BATCH_SIZE
+    print(f"Rebuilding few-shot indexes from {os.path.abspath(DB_PATH)} ({batch_size} texts per request)...")
+    init_db()
+    stats = rebuild_few_shot_indexes(batch_size=batch_size)
+    print(f"Indexed {stats['examples']} example(s) of {stats['fields']} field(s) "
+          f"with {stats['embedding_requests']} embedding request(s) for {stats['texts']} distinct context(s).")
+    print(f"Active build: {stats['build']}")
@@ -12,7 +12,8 @@ import numpy as np
 import time
 import random
 from src.utils.template_utils import DEFAULT_EXPLICIT_MAPPINGS, SORTSTAR_EXPLICIT_MAPPINGS, parse_full_fields_outline
-from src.utils.form_generator import get_all_fields_from_excel, OUTPUT_HTML_PATH
+from src.utils.form_generator import OUTPUT_HTML_PATH
+from src.utils.template_registry import get_excel_fields
 from src.utils.html_doc_filler import fill_html_template, fill_and_generate_html
 from bs4 import BeautifulSoup
 from src.utils.few_shot_learning import (
@@ -1089,7 +1090,7 @@ def display_template_editor(template, machine_id: Optional[int] = None, machine_
                 is_sortstar_machine = True
                 st.info(f"SortStar machine template editor active for: {machine_name}")
         
-        current_explicit_mappings = SORTSTAR_EXPLICIT_MAPPINGS if is_sortstar_machine else get_all_fields_from_excel()
+        current_explicit_mappings = SORTSTAR_EXPLICIT_MAPPINGS if is_sortstar_machine else get_excel_fields()
         
         # Create rank maps to preserve source order (Excel or SortStar mappings)
         field_rank = {key: i for i, key in enumerate(current_explicit_mappings.keys())}
@@ -1710,7 +1711,7 @@ def display_template_editor(template, machine_id: Optional[int] = None, machine_
                     all_possible_fields = current_explicit_mappings
                 else:
                     # Use Excel source of truth for GOA
-                    all_possible_fields = get_all_fields_from_excel()
+                    all_possible_fields = get_excel_fields()
                 
                 # Filter out fields that are already in the template
                 available_fields = {k: v for k, v in all_possible_fields.items()
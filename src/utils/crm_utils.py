@@ -1,9 +1,13 @@
 import sqlite3
 import os
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
+from collections import OrderedDict
+import atexit
 import json
 import re
+import hashlib
+import threading
 
 # Import for document regeneration
 from src.utils.html_doc_filler import fill_and_generate_pdf, fill_and_generate_html
@@ -11,6 +15,7 @@ from src.utils.doc_filler import fill_word_document_from_llm_data
 from src.utils.form_generator import OUTPUT_HTML_PATH
 import subprocess
 import sys
+from src.utils.text_similarity import near_duplicate_clusters, tokenize
 
 # Define database connection
 DB_PATH = os.path.join("data", "crm_data.db")
@@ -19,6 +24,18 @@ HTML_TEMPLATE_PATH = OUTPUT_HTML_PATH
 DOCX_TEMPLATE_PATH = os.path.join("templates", "template.docx")
 # Legacy constant kept for compatibility if needed, but should rely on extension check
 TEMPLATE_FILE_PATH = os.path.join("templates", "template.docx") 
+# Few-shot store compaction: examples kept per field and near-duplicate context threshold
+FEW_SHOT_MAX_EXAMPLES_PER_FIELD = int(os.getenv("FEW_SHOT_MAX_EXAMPLES_PER_FIELD", "50"))
+FEW_SHOT_DUPLICATE_THRESHOLD = float(os.getenv("FEW_SHOT_DUPLICATE_THRESHOLD", "0.9"))
+# Similar-example lookup on larger stores: words found in more than this fraction of
+# contexts do not generate candidates (they still count towards the candidates' score)
+FEW_SHOT_CANDIDATE_MAX_DF = 0.2
+FEW_SHOT_CANDIDATE_MIN_CONTEXTS = 1000
+# Example retrieval: usage counters are buffered and flushed in one transaction at
+# most every FEW_SHOT_USAGE_FLUSH_SECONDS; retrieved examples are cached in memory
+FEW_SHOT_USAGE_FLUSH_SECONDS = float(os.getenv("FEW_SHOT_USAGE_FLUSH_SECONDS", "30"))
+FEW_SHOT_USAGE_MAX_PENDING = 1000
+FEW_SHOT_EXAMPLE_CACHE_SIZE = 2048
 
 def init_db(db_path: str = DB_PATH):
     """
@@ -130,6 +147,73 @@ def init_db(db_path: str = DB_PATH):
         )
         """)
         
+        # Schema migration: content hash of input_context, used to dedupe examples
+        cursor.execute("PRAGMA table_info(few_shot_examples)")
+        few_shot_columns = [row[1] for row in cursor.fetchall()]
+        if "context_hash" not in few_shot_columns:
+            cursor.execute("ALTER TABLE few_shot_examples ADD COLUMN context_hash TEXT")
+            print("Added column 'context_hash' to 'few_shot_examples' table.")
+        cursor.execute("SELECT id, input_context FROM few_shot_examples WHERE context_hash IS NULL")
+        legacy_rows = cursor.fetchall()
+        if legacy_rows:
+            cursor.executemany("UPDATE few_shot_examples SET context_hash = ? WHERE id = ?",
+                               [(compute_context_hash(context), row_id) for row_id, context in legacy_rows])
+            print(f"Backfilled context_hash for {len(legacy_rows)} few-shot example(s).")
+        
+        # Example contexts are stored once per content hash; examples reference them by id
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS few_shot_contexts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            context_hash TEXT UNIQUE NOT NULL,    -- SHA-256 of the whitespace-normalized context
+            input_context TEXT NOT NULL,
+            created_date TEXT NOT NULL
+        )
+        """)
+        if "context_id" not in few_shot_columns:
+            cursor.execute("ALTER TABLE few_shot_examples ADD COLUMN context_id INTEGER REFERENCES few_shot_contexts (id)")
+            print("Added column 'context_id' to 'few_shot_examples' table.")
+        
+        # Move inline contexts of legacy rows into few_shot_contexts
+        cursor.execute("""
+        INSERT OR IGNORE INTO few_shot_contexts (context_hash, input_context, created_date)
+        SELECT context_hash, input_context, created_date FROM few_shot_examples
+        WHERE context_id IS NULL AND context_hash IS NOT NULL
+        """)
+        cursor.execute("""
+        UPDATE few_shot_examples
+        SET context_id = (SELECT c.id FROM few_shot_contexts c WHERE c.context_hash = few_shot_examples.context_hash),
+            input_context = ''
+        WHERE context_id IS NULL AND context_hash IS NOT NULL
+        """)
+        if cursor.rowcount > 0:
+            print(f"Moved {cursor.rowcount} few-shot example context(s) into 'few_shot_contexts'.")
+        # Inverted token index over contexts: postings per token plus each context's
+        # distinct token count, so get_similar_examples scores exact Jaccard from postings
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS few_shot_context_tokens (
+            token TEXT NOT NULL,
+            context_id INTEGER NOT NULL REFERENCES few_shot_contexts (id) ON DELETE CASCADE,
+            PRIMARY KEY (token, context_id)
+        ) WITHOUT ROWID
+        """)
+        cursor.execute("PRAGMA table_info(few_shot_contexts)")
+        if "token_count" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE few_shot_contexts ADD COLUMN token_count INTEGER")
+            print("Added column 'token_count' to 'few_shot_contexts' table.")
+        cursor.execute("SELECT id, input_context FROM few_shot_contexts WHERE token_count IS NULL")
+        unindexed_contexts = dict(cursor.fetchall())
+        if unindexed_contexts:
+            _index_context_tokens(cursor, unindexed_contexts)
+            print(f"Indexed tokens of {len(unindexed_contexts)} few-shot context(s).")
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_few_shot_examples_context
+        ON few_shot_examples (context_id)
+        """)
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_few_shot_examples_dedupe
+        ON few_shot_examples (machine_type, template_type, field_name, context_hash, expected_output)
+        """)
+        
         # Create few_shot_feedback table to track user corrections and improvements
         cursor.execute("""
         CREATE TABLE IF NOT EXISTS few_shot_feedback (
@@ -1456,6 +1540,179 @@ def load_all_processed_machines(db_path: str = DB_PATH) -> List[Dict]:
 
 # --- Few-Shot Learning Functions ---
 
+def compute_context_hash(input_context: str) -> str:
+    """Returns the SHA-256 of an example context with whitespace collapsed."""
+    return hashlib.sha256(" ".join((input_context or "").split()).encode("utf-8")).hexdigest()
+
+# Reads resolve the example context through few_shot_contexts; legacy rows without
+# a context_id still carry their context inline.
+FEW_SHOT_CONTEXT_JOIN = "LEFT JOIN few_shot_contexts c ON c.id = e.context_id"
+FEW_SHOT_CONTEXT_COLUMN = "COALESCE(c.input_context, e.input_context) AS input_context"
+
+def _index_context_tokens(cursor: sqlite3.Cursor, contexts_by_id: Dict[int, str]) -> None:
+    """Adds contexts to the inverted token index and records their token counts."""
+    postings = []
+    counts = []
+    for context_id, context in contexts_by_id.items():
+        tokens = tokenize(context)
+        postings.extend((token, context_id) for token in tokens)
+        counts.append((len(tokens), context_id))
+    cursor.executemany("INSERT OR IGNORE INTO few_shot_context_tokens (token, context_id) VALUES (?, ?)", postings)
+    cursor.executemany("UPDATE few_shot_contexts SET token_count = ? WHERE id = ?", counts)
+
+def _get_context_ids(cursor: sqlite3.Cursor, contexts: List[str]) -> Dict[str, int]:
+    """
+    Stores each distinct context once and returns the context id per context hash.
+    
+    Args:
+        cursor: Cursor inside the caller's transaction
+        contexts: Example contexts (duplicates allowed)
+    
+    Returns:
+        Dict of context hash to few_shot_contexts.id
+    """
+    created_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    by_hash = {}
+    for context in contexts:
+        by_hash.setdefault(compute_context_hash(context), context)
+    
+    cursor.executemany(
+        "INSERT OR IGNORE INTO few_shot_contexts (context_hash, input_context, created_date) VALUES (?, ?, ?)",
+        [(context_hash, context, created_date) for context_hash, context in by_hash.items()]
+    )
+    
+    context_ids = {}
+    hashes = list(by_hash)
+    for start in range(0, len(hashes), 500):
+        chunk = hashes[start:start + 500]
+        placeholders = ",".join("?" for _ in chunk)
+        cursor.execute(f"""
+        SELECT context_hash, id, token_count FROM few_shot_contexts WHERE context_hash IN ({placeholders})
+        """, chunk)
+        rows = cursor.fetchall()
+        context_ids.update({context_hash: context_id for context_hash, context_id, _ in rows})
+        # Contexts inserted just now are not in the token index yet
+        new_contexts = {context_id: by_hash[context_hash] for context_hash, context_id, token_count in rows
+                        if token_count is None}
+        if new_contexts:
+            _index_context_tokens(cursor, new_contexts)
+    return context_ids
+
+class UsageCounterBuffer:
+    """
+    Write-behind buffer for few-shot example usage counters.
+    
+    Retrievals only record increments in memory; a daemon thread applies them
+    every FEW_SHOT_USAGE_FLUSH_SECONDS in one transaction per database, so reads
+    on the GOA path never wait on the SQLite write lock. Pending increments are
+    also flushed when the buffer grows large and at interpreter exit.
+    """
+    
+    def __init__(self, interval_seconds: float = FEW_SHOT_USAGE_FLUSH_SECONDS,
+                 max_pending: int = FEW_SHOT_USAGE_MAX_PENDING):
+        self.interval_seconds = interval_seconds
+        self.max_pending = max_pending
+        # db_path -> example id -> [increment, latest use]
+        self._pending: Dict[str, Dict[int, List[Any]]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+    
+    def record(self, example_ids: List[int], db_path: str = DB_PATH) -> None:
+        """Buffers one use of each example."""
+        used_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            pending = self._pending.setdefault(db_path, {})
+            for example_id in example_ids:
+                entry = pending.setdefault(example_id, [0, used_at])
+                entry[0] += 1
+                entry[1] = used_at
+            pending_count = sum(len(entries) for entries in self._pending.values())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="few-shot-usage-flush", daemon=True)
+                self._thread.start()
+        if pending_count >= self.max_pending:
+            self.flush()
+    
+    def pending_count(self) -> int:
+        """Number of examples with buffered increments."""
+        with self._lock:
+            return sum(len(entries) for entries in self._pending.values())
+    
+    def flush(self, db_path: Optional[str] = None) -> int:
+        """
+        Applies buffered increments in one transaction per database.
+        
+        Args:
+            db_path: Flush only this database (all databases if None)
+        
+        Returns:
+            int: Number of examples updated
+        """
+        with self._flush_lock:
+            with self._lock:
+                paths = [db_path] if db_path is not None else list(self._pending)
+                batches = {path: self._pending.pop(path) for path in paths if self._pending.get(path)}
+            
+            updated = 0
+            for path, entries in batches.items():
+                conn = None
+                try:
+                    conn = sqlite3.connect(path)
+                    with conn:
+                        conn.executemany("""
+                        UPDATE few_shot_examples
+                        SET usage_count = usage_count + ?,
+                            last_used_date = MAX(COALESCE(last_used_date, ''), ?)
+                        WHERE id = ?
+                        """, [(count, used_at, example_id) for example_id, (count, used_at) in entries.items()])
+                    updated += len(entries)
+                    # Usage counts take part in the example ranking
+                    invalidate_few_shot_example_cache(path)
+                except sqlite3.Error as e:
+                    # e.g. "database is locked": keep the increments for the next flush
+                    print(f"Error flushing few-shot usage counters, will retry: {e}")
+                    self._requeue(path, entries)
+                finally:
+                    if conn:
+                        conn.close()
+            return updated
+    
+    def _requeue(self, db_path: str, entries: Dict[int, List[Any]]) -> None:
+        """Merges a batch that failed to flush back into the pending increments."""
+        with self._lock:
+            pending = self._pending.setdefault(db_path, {})
+            for example_id, (count, used_at) in entries.items():
+                entry = pending.setdefault(example_id, [0, used_at])
+                entry[0] += count
+                entry[1] = max(entry[1], used_at)
+    
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self.flush()
+
+
+FEW_SHOT_USAGE_BUFFER = UsageCounterBuffer()
+atexit.register(FEW_SHOT_USAGE_BUFFER.flush)
+
+def flush_few_shot_usage(db_path: Optional[str] = None) -> int:
+    """Writes buffered few-shot usage counters now (e.g., before reading statistics)."""
+    return FEW_SHOT_USAGE_BUFFER.flush(db_path)
+
+# (db_path, machine_type, template_type, field_name, limit) -> ranked example rows
+_FEW_SHOT_EXAMPLE_CACHE: "OrderedDict[Tuple[str, str, str, str, int], List[Dict]]" = OrderedDict()
+_FEW_SHOT_EXAMPLE_CACHE_LOCK = threading.Lock()
+
+def invalidate_few_shot_example_cache(db_path: Optional[str] = None) -> None:
+    """Drops cached example rows of one database (all databases if None)."""
+    with _FEW_SHOT_EXAMPLE_CACHE_LOCK:
+        if db_path is None:
+            _FEW_SHOT_EXAMPLE_CACHE.clear()
+            return
+        for key in [key for key in _FEW_SHOT_EXAMPLE_CACHE if key[0] == db_path]:
+            del _FEW_SHOT_EXAMPLE_CACHE[key]
+
 def save_few_shot_example(machine_type: str, template_type: str, field_name: str, 
                          input_context: str, expected_output: str, 
                          source_machine_id: Optional[int] = None, 
@@ -1481,16 +1738,19 @@ def save_few_shot_example(machine_type: str, template_type: str, field_name: str
         cursor = conn.cursor()
         
         created_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        context_hash = compute_context_hash(input_context)
+        context_id = _get_context_ids(cursor, [input_context])[context_hash]
         
         cursor.execute("""
         INSERT INTO few_shot_examples 
         (machine_type, template_type, field_name, input_context, expected_output, 
-         confidence_score, source_machine_id, created_date)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (machine_type, template_type, field_name, input_context, expected_output,
-              confidence_score, source_machine_id, created_date))
+         confidence_score, source_machine_id, created_date, context_hash, context_id)
+        VALUES (?, ?, ?, '', ?, ?, ?, ?, ?, ?)
+        """, (machine_type, template_type, field_name, expected_output,
+              confidence_score, source_machine_id, created_date, context_hash, context_id))
         
         conn.commit()
+        invalidate_few_shot_example_cache(db_path)
         return True
         
     except sqlite3.Error as e:
@@ -1500,61 +1760,146 @@ def save_few_shot_example(machine_type: str, template_type: str, field_name: str
         if conn:
             conn.close()
 
-def get_few_shot_examples(machine_type: str, template_type: str, field_name: str, 
-                         limit: int = 3, db_path: str = DB_PATH) -> List[Dict]:
+def save_few_shot_examples_bulk(examples: List[Dict[str, Any]], db_path: str = DB_PATH) -> int:
     """
-    Retrieves the best few-shot examples for a specific machine type and field.
+    Saves many few-shot examples with one connection and a single transaction.
+    
+    See insert_few_shot_examples.
+    
+    Returns:
+        int: Number of examples inserted
+    """
+    return len(insert_few_shot_examples(examples, db_path))
+
+def insert_few_shot_examples(examples: List[Dict[str, Any]], db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """
+    Saves many few-shot examples with one connection and a single transaction.
+    
+    An example is skipped if the same (machine_type, template_type, field_name,
+    context hash, expected_output) is already stored, so re-processing a machine
+    does not duplicate its examples. Each distinct context is stored once in
+    few_shot_contexts, however many fields share it.
     
     Args:
-        machine_type: Type of machine
-        template_type: Template type
-        field_name: Specific field name
-        limit: Maximum number of examples to return
+        examples: Dicts with machine_type, template_type, field_name, input_context,
+                  expected_output and optionally confidence_score, source_machine_id
     
     Returns:
-        List of example dictionaries sorted by quality and success rate
+        The examples actually inserted (duplicates are left out)
     """
+    if not examples:
+        return []
+    
     conn = None
     try:
         conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Query for examples matching the criteria, ordered by quality metrics
-        cursor.execute("""
-        SELECT input_context, expected_output, confidence_score, 
-               usage_count, success_count, id
-        FROM few_shot_examples 
-        WHERE machine_type = ? AND template_type = ? AND field_name = ?
-        ORDER BY 
-            confidence_score DESC,
-            CASE WHEN usage_count > 0 THEN success_count * 1.0 / usage_count ELSE 0 END DESC,
-            usage_count DESC
-        LIMIT ?
-        """, (machine_type, template_type, field_name, limit))
-        
-        rows = cursor.fetchall()
-        
-        # Update usage count for retrieved examples
-        if rows:
-            example_ids = [row['id'] for row in rows]
-            placeholders = ','.join(['?' for _ in example_ids])
-            cursor.execute(f"""
-            UPDATE few_shot_examples 
-            SET usage_count = usage_count + 1, last_used_date = ?
-            WHERE id IN ({placeholders})
-            """, [datetime.now().strftime("%Y-%m-%d %H:%M:%S")] + example_ids)
-            conn.commit()
+        created_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        return [dict(row) for row in rows]
+        with conn:  # one transaction, committed once
+            cursor = conn.cursor()
+            context_ids = _get_context_ids(cursor, [ex["input_context"] for ex in examples])
+            
+            rows = []
+            for ex in examples:
+                context_hash = compute_context_hash(ex["input_context"])
+                key = (ex["machine_type"], ex["template_type"], ex["field_name"], context_hash, ex["expected_output"])
+                rows.append((
+                    ex["machine_type"], ex["template_type"], ex["field_name"],
+                    ex["expected_output"], ex.get("confidence_score", 1.0), ex.get("source_machine_id"),
+                    created_date, context_hash, context_ids[context_hash]
+                ) + key)
+            
+            # One statement per row (same transaction) to know which rows were inserted
+            inserted = []
+            for ex, row in zip(examples, rows):
+                cursor.execute("""
+                INSERT INTO few_shot_examples 
+                (machine_type, template_type, field_name, input_context, expected_output, 
+                 confidence_score, source_machine_id, created_date, context_hash, context_id)
+                SELECT ?, ?, ?, '', ?, ?, ?, ?, ?, ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM few_shot_examples
+                    WHERE machine_type = ? AND template_type = ? AND field_name = ?
+                      AND context_hash = ? AND expected_output = ?
+                )
+                """, row)
+                if cursor.rowcount > 0:
+                    inserted.append(ex)
+        if inserted:
+            invalidate_few_shot_example_cache(db_path)
+        return inserted
         
     except sqlite3.Error as e:
-        print(f"Error retrieving few-shot examples: {e}")
+        print(f"Error saving few-shot examples in bulk: {e}")
         return []
     finally:
         if conn:
             conn.close()
 
+def get_few_shot_examples(machine_type: str, template_type: str, field_name: str, 
+                         limit: int = 3, db_path: str = DB_PATH) -> List[Dict]:
+    """
+    Retrieves the best few-shot examples for a specific machine type and field.
+    
+    Results are served from an in-memory cache that is dropped whenever examples
+    are written. The usage count of the returned examples is incremented through
+    the write-behind FEW_SHOT_USAGE_BUFFER rather than with an UPDATE per read.
+    
+    Args:
+        machine_type: Type of machine
+        template_type: Template type
+        field_name: Specific field name
+        limit: Maximum number of examples to return
+    
+    Returns:
+        List of example dictionaries sorted by quality and success rate
+    """
+    cache_key = (db_path, machine_type, template_type, field_name, limit)
+    with _FEW_SHOT_EXAMPLE_CACHE_LOCK:
+        rows = _FEW_SHOT_EXAMPLE_CACHE.get(cache_key)
+        if rows is not None:
+            _FEW_SHOT_EXAMPLE_CACHE.move_to_end(cache_key)
+    
+    if rows is None:
+        conn = None
+        try:
+            conn = sqlite3.connect(db_path)
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            
+            # Query for examples matching the criteria, ordered by quality metrics
+            cursor.execute(f"""
+            SELECT {FEW_SHOT_CONTEXT_COLUMN}, e.expected_output, e.confidence_score, 
+                   e.usage_count, e.success_count, e.id, e.context_id
+            FROM few_shot_examples e
+            {FEW_SHOT_CONTEXT_JOIN}
+            WHERE e.machine_type = ? AND e.template_type = ? AND e.field_name = ?
+            ORDER BY 
+                e.confidence_score DESC,
+                CASE WHEN e.usage_count > 0 THEN e.success_count * 1.0 / e.usage_count ELSE 0 END DESC,
+                e.usage_count DESC
+            LIMIT ?
+            """, (machine_type, template_type, field_name, limit))
+            rows = [dict(row) for row in cursor.fetchall()]
+            
+        except sqlite3.Error as e:
+            print(f"Error retrieving few-shot examples: {e}")
+            return []
+        finally:
+            if conn:
+                conn.close()
+        
+        with _FEW_SHOT_EXAMPLE_CACHE_LOCK:
+            _FEW_SHOT_EXAMPLE_CACHE[cache_key] = rows
+            while len(_FEW_SHOT_EXAMPLE_CACHE) > FEW_SHOT_EXAMPLE_CACHE_SIZE:
+                _FEW_SHOT_EXAMPLE_CACHE.popitem(last=False)
+    
+    # Update usage count for retrieved examples (buffered)
+    if rows:
+        FEW_SHOT_USAGE_BUFFER.record([row['id'] for row in rows], db_path)
+    
+    return [dict(row) for row in rows]
+
 def add_few_shot_feedback(example_id: int, feedback_type: str, 
                          original_prediction: str = None, corrected_value: str = None,
                          user_context: str = None, db_path: str = DB_PATH) -> bool:
@@ -1595,6 +1940,7 @@ def add_few_shot_feedback(example_id: int, feedback_type: str,
             """, (example_id,))
         
         conn.commit()
+        invalidate_few_shot_example_cache(db_path)
         return True
         
     except sqlite3.Error as e:
@@ -1611,6 +1957,7 @@ def get_few_shot_statistics(db_path: str = DB_PATH) -> Dict[str, Any]:
     Returns:
         Dictionary containing various statistics about the few-shot learning system
     """
+    flush_few_shot_usage(db_path)
     conn = None
     try:
         conn = sqlite3.connect(db_path)
@@ -1712,6 +2059,7 @@ def get_field_examples(machine_type: str = None, template_type: str = None,
     Returns:
         List of example dictionaries
     """
+    flush_few_shot_usage(db_path)
     conn = None
     try:
         conn = sqlite3.connect(db_path)
@@ -1739,12 +2087,13 @@ def get_field_examples(machine_type: str = None, template_type: str = None,
             where_clause = "WHERE " + " AND ".join(where_conditions)
         
         query = f"""
-        SELECT id, machine_type, template_type, field_name, input_context, 
-               expected_output, confidence_score, usage_count, success_count, 
-               created_date, last_used_date
-        FROM few_shot_examples 
+        SELECT e.id, e.machine_type, e.template_type, e.field_name, {FEW_SHOT_CONTEXT_COLUMN}, 
+               e.expected_output, e.confidence_score, e.usage_count, e.success_count, 
+               e.created_date, e.last_used_date
+        FROM few_shot_examples e
+        {FEW_SHOT_CONTEXT_JOIN}
         {where_clause}
-        ORDER BY confidence_score DESC, usage_count DESC
+        ORDER BY e.confidence_score DESC, e.usage_count DESC
         LIMIT ?
         """
         
@@ -1782,6 +2131,133 @@ def get_all_field_names(db_path: str = DB_PATH) -> List[str]:
         if conn:
             conn.close()
 
+def get_all_few_shot_examples(
+    limit_per_field: int = 50,
+    machine_type: Optional[str] = None,
+    template_type: Optional[str] = None,
+    field_names: Optional[List[str]] = None,
+    db_path: str = DB_PATH
+) -> List[Dict]:
+    """
+    Gets the best examples of every field in one query, e.g. to build the example indexes.
+    
+    Examples are ranked per field like get_few_shot_examples, but reading them
+    here does not count as usage, so indexing never changes usage statistics.
+    
+    Args:
+        limit_per_field: Maximum examples per (machine_type, template_type, field_name)
+        machine_type: Only this machine type (all if None)
+        template_type: Only this template type (all if None)
+        field_names: Only these fields (all if None)
+    
+    Returns:
+        List of example dictionaries including machine_type, template_type and field_name
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        conditions, params = [], []
+        if machine_type is not None:
+            conditions.append("e.machine_type = ?")
+            params.append(machine_type)
+        if template_type is not None:
+            conditions.append("e.template_type = ?")
+            params.append(template_type)
+        if field_names is not None:
+            conditions.append(f"e.field_name IN ({', '.join('?' for _ in field_names)})")
+            params.extend(field_names)
+        where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        cursor.execute(f"""
+        SELECT * FROM (
+            SELECT e.machine_type, e.template_type, e.field_name, {FEW_SHOT_CONTEXT_COLUMN},
+                   e.expected_output, e.confidence_score, e.usage_count, e.success_count, e.id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY e.machine_type, e.template_type, e.field_name
+                       ORDER BY
+                           e.confidence_score DESC,
+                           CASE WHEN e.usage_count > 0 THEN e.success_count * 1.0 / e.usage_count ELSE 0 END DESC,
+                           e.usage_count DESC
+                   ) AS field_rank
+            FROM few_shot_examples e
+            {FEW_SHOT_CONTEXT_JOIN}
+            {where_sql}
+        )
+        WHERE field_rank <= ?
+        ORDER BY machine_type, template_type, field_name, field_rank
+        """, (*params, limit_per_field))
+        return [dict(row) for row in cursor.fetchall()]
+        
+    except sqlite3.Error as e:
+        print(f"Error getting all few-shot examples: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+def get_most_used_few_shot_fields(limit: int = 50, db_path: str = DB_PATH) -> List[Dict[str, Any]]:
+    """
+    Gets the fields whose examples have been retrieved most often.
+    
+    Args:
+        limit: Maximum number of fields to return
+    
+    Returns:
+        List of dicts with machine_type, template_type, field_name and usage_count,
+        most used first
+    """
+    flush_few_shot_usage(db_path)
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+        SELECT machine_type, template_type, field_name, SUM(usage_count) AS usage_count
+        FROM few_shot_examples
+        GROUP BY machine_type, template_type, field_name
+        ORDER BY usage_count DESC, machine_type, template_type, field_name
+        LIMIT ?
+        """, (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+        
+    except sqlite3.Error as e:
+        print(f"Error getting most used few-shot fields: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+def get_few_shot_contexts(db_path: str = DB_PATH) -> List[str]:
+    """
+    Gets every distinct few-shot example context (e.g., to fit a local embedding model).
+    
+    Returns:
+        List of context texts
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+        SELECT DISTINCT {FEW_SHOT_CONTEXT_COLUMN}
+        FROM few_shot_examples e
+        {FEW_SHOT_CONTEXT_JOIN}
+        """)
+        return [row[0] for row in cursor.fetchall() if row[0]]
+        
+    except sqlite3.Error as e:
+        print(f"Error getting few-shot contexts: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
 def create_sample_few_shot_data(db_path: str = DB_PATH) -> bool:
     """
     Creates sample few-shot learning data for testing and demonstration purposes.
@@ -1867,23 +2343,27 @@ def create_sample_few_shot_data(db_path: str = DB_PATH) -> bool:
         ]
         
         # Insert sample examples
+        context_ids = _get_context_ids(cursor, [example['input_context'] for example in sample_examples])
         for example in sample_examples:
+            context_hash = compute_context_hash(example['input_context'])
             cursor.execute("""
             INSERT INTO few_shot_examples 
             (machine_type, template_type, field_name, input_context, expected_output, 
-             confidence_score, usage_count, success_count, created_date, last_used_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+             confidence_score, usage_count, success_count, created_date, last_used_date,
+             context_hash, context_id)
+            VALUES (?, ?, ?, '', ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 example['machine_type'],
                 example['template_type'],
                 example['field_name'],
-                example['input_context'],
                 example['expected_output'],
                 example['confidence_score'],
                 example['usage_count'],
                 example['success_count'],
                 example['created_date'],
-                example['last_used_date']
+                example['last_used_date'],
+                context_hash,
+                context_ids[context_hash]
             ))
         
         # Create sample feedback
@@ -1923,6 +2403,7 @@ def create_sample_few_shot_data(db_path: str = DB_PATH) -> bool:
             ))
         
         conn.commit()
+        invalidate_few_shot_example_cache(db_path)
         print(f"Created {len(sample_examples)} sample examples and {len(sample_feedback)} sample feedback records")
         return True
         
@@ -1933,11 +2414,39 @@ def create_sample_few_shot_data(db_path: str = DB_PATH) -> bool:
         if conn:
             conn.close()
 
+def _selective_tokens(cursor: sqlite3.Cursor, tokens: List[str]) -> List[str]:
+    """
+    Returns the query words whose postings are short enough to generate candidates.
+    
+    Small stores use every word. Otherwise words in more than FEW_SHOT_CANDIDATE_MAX_DF
+    of the contexts are dropped (postings are counted only up to that bound); if
+    every word is that common, all of them are used.
+    """
+    cursor.execute("SELECT COUNT(*) FROM few_shot_contexts")
+    total_contexts = cursor.fetchone()[0]
+    if total_contexts < FEW_SHOT_CANDIDATE_MIN_CONTEXTS:
+        return tokens
+    
+    max_postings = int(total_contexts * FEW_SHOT_CANDIDATE_MAX_DF)
+    selective = []
+    for token in tokens:
+        cursor.execute("""
+        SELECT COUNT(*) FROM (SELECT 1 FROM few_shot_context_tokens WHERE token = ? LIMIT ?)
+        """, (token, max_postings + 1))
+        if cursor.fetchone()[0] <= max_postings:
+            selective.append(token)
+    return selective or tokens
+
 def get_similar_examples(input_text: str, machine_type: str, template_type: str,
                         limit: int = 5, db_path: str = DB_PATH) -> List[Dict]:
     """
-    Finds examples similar to the input text using simple text similarity.
-    This could be enhanced with more sophisticated similarity matching.
+    Finds examples similar to the input text using word-level Jaccard similarity.
+    
+    Candidates are the contexts found in the inverted token index
+    (few_shot_context_tokens) under the input's selective words (see
+    _selective_tokens). Only candidates are scored: shared words are counted with
+    primary-key lookups and combined with the stored token counts in SQL, so
+    contexts are never read back or tokenized.
     
     Args:
         input_text: Text to find similar examples for
@@ -1948,47 +2457,185 @@ def get_similar_examples(input_text: str, machine_type: str, template_type: str,
     Returns:
         List of similar example dictionaries
     """
+    input_words = sorted(tokenize(input_text))
+    if not input_words:
+        return []
+    
     conn = None
     try:
         conn = sqlite3.connect(db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
-        # Simple similarity based on common words
-        # This could be enhanced with embeddings or more sophisticated matching
-        input_words = set(input_text.lower().split())
+        candidate_words = _selective_tokens(cursor, input_words)
+        if candidate_words == input_words:
+            # Every context sharing a word is a candidate: count shared words from the postings
+            matches_sql = """
+            SELECT context_id, COUNT(*) AS shared
+            FROM few_shot_context_tokens
+            WHERE token IN (SELECT token FROM query_tokens)
+            GROUP BY context_id
+            """
+        else:
+            # Candidates from the selective postings; their shared words are primary-key lookups
+            matches_sql = """
+            SELECT cand.context_id, COUNT(*) AS shared
+            FROM (SELECT DISTINCT context_id FROM few_shot_context_tokens
+                  WHERE token IN (SELECT value FROM json_each(?))) cand
+            CROSS JOIN query_tokens q
+            JOIN few_shot_context_tokens p ON p.token = q.token AND p.context_id = cand.context_id
+            GROUP BY cand.context_id
+            """
+        params = [json.dumps(input_words)]
+        if candidate_words != input_words:
+            params.append(json.dumps(candidate_words))
+        params += [len(input_words), machine_type, template_type, limit]
+        
+        cursor.execute(f"""
+        WITH query_tokens(token) AS (
+            SELECT value FROM json_each(?)
+        ), matches AS ({matches_sql}
+        ), scored AS (
+            SELECT m.context_id, c.input_context,
+                   m.shared * 1.0 / (? + c.token_count - m.shared) AS similarity
+            FROM matches m
+            CROSS JOIN few_shot_contexts c ON c.id = m.context_id
+        )
+        SELECT e.id, s.input_context, e.expected_output, e.field_name, e.confidence_score,
+               e.usage_count, e.success_count, s.similarity
+        FROM scored s
+        CROSS JOIN few_shot_examples e INDEXED BY idx_few_shot_examples_context
+            ON e.context_id = s.context_id  -- drive from the candidates, not from every example
+        WHERE e.machine_type = ? AND e.template_type = ? AND s.similarity > 0.1  -- Threshold for similarity
+        ORDER BY s.similarity DESC, e.confidence_score DESC, e.success_count DESC, e.id
+        LIMIT ?
+        """, params)
         
-        cursor.execute("""
-        SELECT id, input_context, expected_output, field_name, confidence_score,
-               usage_count, success_count
-        FROM few_shot_examples 
-        WHERE machine_type = ? AND template_type = ?
-        """, (machine_type, template_type))
+        return [dict(row) for row in cursor.fetchall()]
         
-        rows = cursor.fetchall()
-        examples = []
+    except sqlite3.Error as e:
+        print(f"Error finding similar examples: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+def _example_quality(example: Dict[str, Any]) -> tuple:
+    """Sort key matching the retrieval order: confidence, success rate, usage."""
+    usage = example["usage_count"] or 0
+    success_rate = (example["success_count"] or 0) / usage if usage > 0 else 0
+    return (example["confidence_score"] or 0, success_rate, usage, -example["id"])
+
+def compact_few_shot_examples(max_per_field: int = FEW_SHOT_MAX_EXAMPLES_PER_FIELD,
+                              similarity_threshold: float = FEW_SHOT_DUPLICATE_THRESHOLD,
+                              db_path: str = DB_PATH) -> Dict[str, int]:
+    """
+    Merges near-duplicate few-shot examples and caps the number of examples per field.
+    
+    Examples of the same field with the same expected output whose contexts are
+    near-duplicates (MinHash estimate of Jaccard similarity >= similarity_threshold)
+    are merged into the best one: usage and success counts are summed, the highest
+    confidence and latest use are kept, and feedback is moved to the survivor. Each
+    field is then trimmed to max_per_field examples by confidence and success rate;
+    feedback of an evicted example moves to the field's best remaining example, so
+    user corrections are never lost. Contexts no longer referenced are removed. Everything runs in one transaction.
+    
+    Args:
+        max_per_field: Maximum examples kept per (machine_type, template_type, field_name)
+        similarity_threshold: Minimum context similarity for two examples to be merged
+    
+    Returns:
+        Dict with counts: examined, merged, evicted, contexts_removed, remaining
+    """
+    stats = {"examined": 0, "merged": 0, "evicted": 0, "contexts_removed": 0, "remaining": 0}
+    flush_few_shot_usage(db_path)
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
         
-        for row in rows:
-            context_words = set(row['input_context'].lower().split())
-            # Calculate simple Jaccard similarity
-            intersection = len(input_words.intersection(context_words))
-            union = len(input_words.union(context_words))
-            similarity = intersection / union if union > 0 else 0
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+            SELECT e.id, e.machine_type, e.template_type, e.field_name, e.expected_output,
+                   e.confidence_score, e.usage_count, e.success_count, e.last_used_date,
+                   {FEW_SHOT_CONTEXT_COLUMN}
+            FROM few_shot_examples e
+            {FEW_SHOT_CONTEXT_JOIN}
+            """)
+            examples = {row["id"]: dict(row) for row in cursor.fetchall()}
+            stats["examined"] = len(examples)
             
-            if similarity > 0.1:  # Threshold for similarity
-                example_dict = dict(row)
-                example_dict['similarity'] = similarity
-                examples.append(example_dict)
-        
-        # Sort by similarity and quality metrics
-        examples.sort(key=lambda x: (x['similarity'], x['confidence_score'], 
-                                   x.get('success_count', 0)), reverse=True)
+            by_output: Dict[tuple, Dict[int, str]] = {}
+            for ex in examples.values():
+                key = (ex["machine_type"], ex["template_type"], ex["field_name"], ex["expected_output"].strip())
+                by_output.setdefault(key, {})[ex["id"]] = ex["input_context"]
+            
+            removed_ids = []
+            for contexts in by_output.values():
+                if len(contexts) < 2:
+                    continue
+                for cluster in near_duplicate_clusters(contexts, similarity_threshold):
+                    members = [examples[example_id] for example_id in cluster]
+                    survivor = max(members, key=_example_quality)
+                    duplicate_ids = [m["id"] for m in members if m["id"] != survivor["id"]]
+                    last_used = max((m["last_used_date"] for m in members if m["last_used_date"]), default=None)
+                    
+                    cursor.execute("""
+                    UPDATE few_shot_examples
+                    SET usage_count = ?, success_count = ?, confidence_score = ?, last_used_date = ?
+                    WHERE id = ?
+                    """, (sum(m["usage_count"] or 0 for m in members),
+                          sum(m["success_count"] or 0 for m in members),
+                          max(m["confidence_score"] or 0 for m in members),
+                          last_used, survivor["id"]))
+                    placeholders = ",".join("?" for _ in duplicate_ids)
+                    cursor.execute(f"UPDATE few_shot_feedback SET example_id = ? WHERE example_id IN ({placeholders})",
+                                   [survivor["id"]] + duplicate_ids)
+                    removed_ids.extend(duplicate_ids)
+                    stats["merged"] += len(duplicate_ids)
+            
+            cursor.executemany("DELETE FROM few_shot_examples WHERE id = ?", [(i,) for i in removed_ids])
+            
+            # Enforce the per-field cap on the merged rows
+            cursor.execute("""
+            SELECT id, machine_type, template_type, field_name, confidence_score, usage_count, success_count
+            FROM few_shot_examples
+            """)
+            by_field: Dict[tuple, List[Dict[str, Any]]] = {}
+            for row in cursor.fetchall():
+                by_field.setdefault((row["machine_type"], row["template_type"], row["field_name"]), []).append(dict(row))
+            
+            evicted_ids = []
+            for field_examples in by_field.values():
+                if len(field_examples) > max_per_field:
+                    field_examples.sort(key=_example_quality, reverse=True)
+                    field_evicted_ids = [ex["id"] for ex in field_examples[max_per_field:]]
+                    placeholders = ",".join("?" for _ in field_evicted_ids)
+                    cursor.execute(f"UPDATE few_shot_feedback SET example_id = ? WHERE example_id IN ({placeholders})",
+                                   [field_examples[0]["id"]] + field_evicted_ids)
+                    evicted_ids.extend(field_evicted_ids)
+            cursor.executemany("DELETE FROM few_shot_examples WHERE id = ?", [(i,) for i in evicted_ids])
+            stats["evicted"] = len(evicted_ids)
+            
+            cursor.execute("""
+            DELETE FROM few_shot_contexts
+            WHERE id NOT IN (SELECT context_id FROM few_shot_examples WHERE context_id IS NOT NULL)
+            """)
+            stats["contexts_removed"] = cursor.rowcount
+            cursor.execute("""
+            DELETE FROM few_shot_context_tokens
+            WHERE context_id NOT IN (SELECT id FROM few_shot_contexts)
+            """)
+            stats["remaining"] = stats["examined"] - stats["merged"] - stats["evicted"]
         
-        return examples[:limit]
+        invalidate_few_shot_example_cache(db_path)
+        print(f"Compacted few-shot examples: {stats}")
+        return stats
         
     except sqlite3.Error as e:
-        print(f"Error finding similar examples: {e}")
-        return []
+        print(f"Error compacting few-shot examples: {e}")
+        return stats
     finally:
         if conn:
             conn.close()
@@ -1,8 +1,188 @@
+import copy
+import io
+import os
 import re
-from typing import Dict
+import threading
+import zipfile
+from typing import Dict, List, NamedTuple, Tuple
 
 from docx import Document
+from docx.opc.oxml import serialize_part_xml
+from docx.oxml.ns import qn
 from docx.shared import Pt, RGBColor
+from docx.table import Table, _Cell
+
+# One pattern finds every placeholder in a cell; keys are resolved by dict lookup
+PLACEHOLDER_PATTERN = re.compile(r"{{\s*(.*?)\s*}}")
+CHECKED_SYMBOL = "☑"  # Unicode ballot box with check (U+2611)
+UNCHECKED_SYMBOL = "☐"  # Unicode ballot box (U+2610)
+
+
+class CellPlan(NamedTuple):
+    """A template table cell with placeholders, tokenized once per template version."""
+    tc_index: int  # position of the cell's <w:tc> among all cells of the document body
+    text: str  # the cell's text in the template
+    tokens: List[Tuple[str, str, str]]  # (literal text before, key, placeholder as written)
+    tail: str  # literal text after the last placeholder
+
+
+# Template path -> parsed template (see DocxTemplate)
+_DOCX_TEMPLATES: Dict[str, "DocxTemplate"] = {}
+_DOCX_TEMPLATES_LOCK = threading.Lock()
+
+
+def tokenize_placeholders(text: str) -> Tuple[List[Tuple[str, str, str]], str]:
+    """
+    Splits text into literal runs and placeholders with a single pattern scan.
+    
+    Returns:
+        Tuple of ([(literal before, key, placeholder text)], literal tail)
+    """
+    tokens = []
+    position = 0
+    for match in PLACEHOLDER_PATTERN.finditer(text):
+        tokens.append((text[position:match.start()], match.group(1), match.group(0)))
+        position = match.end()
+    return tokens, text[position:]
+
+
+def compile_cell_plans(doc) -> List[CellPlan]:
+    """Finds the table cells of a document that contain placeholders, in fill order."""
+    tc_indexes = {tc: i for i, tc in enumerate(doc.element.body.iter(qn("w:tc")))}
+    plans = []
+    seen = set()
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                tc_index = tc_indexes[cell._tc]
+                if tc_index in seen:
+                    continue  # horizontally merged cells are returned once per grid column
+                seen.add(tc_index)
+                text = cell.text
+                if "{{" not in text:
+                    continue
+                tokens, tail = tokenize_placeholders(text)
+                if tokens:
+                    plans.append(CellPlan(tc_index, text, tokens, tail))
+    return plans
+
+
+def _replacement(key: str, value) -> str:
+    if key.endswith("_check"):
+        return CHECKED_SYMBOL if str(value).upper() == "YES" else UNCHECKED_SYMBOL
+    return str(value)
+
+
+def render_cell_text(plan: CellPlan, data: Dict[str, str]) -> str:
+    """The cell's text with every placeholder that has data replaced; others are kept."""
+    parts = []
+    for literal, key, placeholder in plan.tokens:
+        parts.append(literal)
+        parts.append(_replacement(key, data[key]) if key in data else placeholder)
+    parts.append(plan.tail)
+    return "".join(parts)
+
+
+def fill_cells(body, plans: List[CellPlan], data: Dict[str, str], parent) -> int:
+    """
+    Writes the filled text into the planned cells of a copy of the template's body.
+    
+    Args:
+        body: The <w:body> element to fill
+        plans: The template's cell plans
+        data: Placeholder key to value
+        parent: Document providing the part for the cell proxies
+    
+    Returns:
+        Number of cells modified
+    """
+    tcs = list(body.iter(qn("w:tc")))
+    modified = 0
+    for plan in plans:
+        modified_cell_text = render_cell_text(plan, data)
+        if modified_cell_text == plan.text:
+            continue
+        tc = tcs[plan.tc_index]
+        cell = _Cell(tc, Table(tc.getparent().getparent(), parent))
+        cell.text = modified_cell_text
+        for paragraph in cell.paragraphs:
+            for run in paragraph.runs:
+                run.font.color.rgb = RGBColor(0, 0, 0)
+                run.bold = True
+                run.font.size = Pt(12)
+        modified += 1
+    return modified
+
+
+def _file_stamp(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class DocxTemplate:
+    """
+    A DOCX template parsed once per process.
+    
+    Keeps the parsed main document part, its cell plans and a zip of every other
+    part. A fill deep-copies the XML tree, fills the copy and writes it as the
+    only new part next to the unchanged ones, so the template is never unzipped
+    or parsed again.
+    """
+    
+    def __init__(self, template_path: str):
+        """
+        Parse the template.
+        
+        Args:
+            template_path: Path to the .docx template
+        """
+        self.template_path = template_path
+        self.stamp = _file_stamp(template_path)
+        self._document = Document(template_path)
+        self.document_part_name = self._document.part.partname.lstrip("/")
+        self.cell_plans = compile_cell_plans(self._document)
+        
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(template_path) as source, zipfile.ZipFile(buffer, "w") as base:
+            for info in source.infolist():
+                if info.filename != self.document_part_name:
+                    base.writestr(info, source.read(info))  # keeps each part's compression
+        self.base_zip = buffer.getvalue()
+    
+    def fill(self, data: Dict[str, str], output_path: str) -> int:
+        """
+        Writes a filled copy of the template.
+        
+        Args:
+            data: Placeholder key to value
+            output_path: Where to save the filled .docx
+        
+        Returns:
+            Number of cells modified
+        """
+        root = copy.deepcopy(self._document.element)
+        modified = fill_cells(root.body, self.cell_plans, data, self._document)
+        
+        buffer = io.BytesIO(self.base_zip)
+        with zipfile.ZipFile(buffer, "a", compression=zipfile.ZIP_DEFLATED) as package:
+            package.writestr(self.document_part_name, serialize_part_xml(root))
+        with open(output_path, "wb") as f:
+            f.write(buffer.getvalue())
+        return modified
+
+
+def get_docx_template(template_path: str) -> DocxTemplate:
+    """Returns the parsed template, parsing it again only if the file changed."""
+    cache_key = os.path.abspath(template_path)
+    stamp = _file_stamp(template_path)
+    with _DOCX_TEMPLATES_LOCK:
+        template = _DOCX_TEMPLATES.get(cache_key)
+        if template is not None and template.stamp == stamp:
+            return template
+    template = DocxTemplate(template_path)
+    with _DOCX_TEMPLATES_LOCK:
+        _DOCX_TEMPLATES[cache_key] = template
+    return template
 
 
 def fill_word_document_from_llm_data(template_path: str, data: Dict[str, str], output_path: str) -> None:
@@ -10,45 +190,13 @@ def fill_word_document_from_llm_data(template_path: str, data: Dict[str, str], o
     Fills placeholders in a Word document with provided data.
     Checkbox placeholders end with "_check" and are rendered as checked/unchecked symbols.
     Modified cells are bolded in black without background highlight.
+    
+    The template is parsed and its placeholder cells are tokenized once per
+    template version (see DocxTemplate); each fill copies the parsed tree and
+    only resolves keys by dict lookup.
     """
     try:
-        doc = Document(template_path)
-        checked_symbol = "☑"  # Unicode ballot box with check (U+2611)
-        unchecked_symbol = "☐"  # Unicode ballot box (U+2610)
-
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    if "{{" not in cell.text:
-                        continue
-
-                    original_cell_text = cell.text
-                    modified_cell_text = original_cell_text
-
-                    for key, value_str in data.items():
-                        placeholder_regex = re.compile(r"{{\s*" + re.escape(key) + r"\s*}}")
-                        if not placeholder_regex.search(modified_cell_text):
-                            continue
-
-                        is_check_field = key.endswith("_check")
-                        is_checked_yes = is_check_field and str(value_str).upper() == "YES"
-
-                        if is_check_field:
-                            replacement = checked_symbol if is_checked_yes else unchecked_symbol
-                        else:
-                            replacement = str(value_str)
-
-                        modified_cell_text, _ = placeholder_regex.subn(replacement, modified_cell_text)
-
-                    if original_cell_text != modified_cell_text:
-                        cell.text = modified_cell_text
-                        for paragraph in cell.paragraphs:
-                            for run in paragraph.runs:
-                                run.font.color.rgb = RGBColor(0, 0, 0)
-                                run.bold = True
-                                run.font.size = Pt(12)
-
-        doc.save(output_path)
+        get_docx_template(template_path).fill(data, output_path)
         print(f"Successfully created filled document: {output_path}")
 
     except Exception as e:
@@ -57,8 +205,6 @@ def fill_word_document_from_llm_data(template_path: str, data: Dict[str, str], o
 
 
 if __name__ == '__main__':
-    import os
-
     mock_data_for_filler = {
         "plc_b&r_check": "YES",
         "hmi_size10_check": "YES",
@@ -7,12 +7,19 @@ and semantic similarity for better example selection.
 
 import os
 import time
-import gc
-from typing import Dict, List, Optional, Any, Tuple
+import shutil
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Any, Tuple, Set
 from datetime import datetime
 import numpy as np
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
+from langchain_core.rate_limiters import BaseRateLimiter, InMemoryRateLimiter
 from langchain_core.example_selectors.semantic_similarity import SemanticSimilarityExampleSelector
 
 from langchain_community.vectorstores import Chroma
@@ -20,12 +27,291 @@ from langchain_community.vectorstores import Chroma
 from langchain_core.example_selectors.base import BaseExampleSelector
 
 from src.utils.crm_utils import (
-    get_few_shot_examples, save_few_shot_example, add_few_shot_feedback
+    get_few_shot_examples, get_all_few_shot_examples, save_few_shot_example, add_few_shot_feedback, get_few_shot_contexts,
+    compact_few_shot_examples, FEW_SHOT_MAX_EXAMPLES_PER_FIELD, FEW_SHOT_DUPLICATE_THRESHOLD
 )
 from src.utils.few_shot_learning import determine_machine_type
+from src.utils.numpy_vector_index import NumpyVectorIndex, NumpyExampleSelector, search_open_index
+from src.utils.local_embeddings import HashedTfidfEmbeddings
+from src.utils.rw_lock import ReadWriteLock
 
 # Singleton instance cache so we reuse embeddings/vector stores across requests
 _MANAGER_INSTANCE: Optional["FewShotManager"] = None
+_MANAGER_LOCK = threading.Lock()
+
+# All examples live in one consolidated Chroma collection; machine_type,
+# template_type and field_name are stored as filterable metadata.
+FEW_SHOT_INDEX_DIRECTORY = os.path.join("src", "cache", "few_shot_index")
+FEW_SHOT_COLLECTION_NAME = "few_shot_examples"
+
+# Pre-consolidation layout: one Chroma store per field. The consolidated index is
+# rebuilt from the few_shot_examples table, so the old stores are simply deleted.
+LEGACY_FEW_SHOT_STORE_DIRECTORY = os.path.join("src", "cache", "few_shot_embeddings")
+
+# Example index backend: "chroma" (consolidated Chroma collection) or "numpy"
+# (one memory-mapped float32 matrix per field, see numpy_vector_index.py)
+FEW_SHOT_INDEX_BACKEND = os.getenv("FEW_SHOT_INDEX_BACKEND", "chroma").lower()
+FEW_SHOT_NUMPY_INDEX_DIRECTORY = os.path.join("src", "cache", "few_shot_numpy")
+
+# Open per-field NumPy indexes are kept in an LRU bounded by count and by resident
+# bytes; the least recently used index is closed (its memory map released) first
+FEW_SHOT_MAX_OPEN_INDEXES = int(os.getenv("FEW_SHOT_MAX_OPEN_INDEXES", "256"))
+FEW_SHOT_MAX_RESIDENT_BYTES = int(os.getenv("FEW_SHOT_MAX_RESIDENT_MB", "256")) * 1024 * 1024
+
+# Examples indexed per field (the best ones by confidence and success rate)
+FEW_SHOT_INDEX_EXAMPLES_PER_FIELD = 50
+
+# Offline rebuilds write a complete index under <index root>/builds/<name> and
+# switch to it by atomically replacing the CURRENT pointer file. Running managers
+# pick up the new build on their next request; the previous build is kept for
+# processes that have not switched yet.
+FEW_SHOT_INDEX_BUILDS_DIRECTORY = "builds"
+FEW_SHOT_INDEX_POINTER_FILE = "CURRENT"
+FEW_SHOT_INDEX_BUILDS_KEPT = 2
+
+# Each manager holds a lease file in <build>/leases on the build it serves and
+# renews it while serving requests; builds with a live lease are never pruned
+FEW_SHOT_BUILD_LEASES_DIRECTORY = "leases"
+FEW_SHOT_BUILD_LEASE_SECONDS = float(os.getenv("FEW_SHOT_BUILD_LEASE_SECONDS", "3600"))
+
+# Texts per embedding request during a rebuild (the embedding API accepts at
+# most 100 per batch request) and the request budget the rebuild stays under
+FEW_SHOT_REBUILD_BATCH_SIZE = int(os.getenv("FEW_SHOT_REBUILD_BATCH_SIZE", "100"))
+FEW_SHOT_EMBEDDING_REQUESTS_PER_MINUTE = float(os.getenv("FEW_SHOT_EMBEDDING_RPM", "60"))
+CHROMA_UPSERT_BATCH_SIZE = 1000
+
+# Keys returned to callers for each selected example
+EXAMPLE_KEYS = ["input_context", "expected_output", "confidence_score", "example_id"]
+
+
+# Persistent embedding cache shared by indexing and queries
+EMBEDDING_MODEL_NAME = "models/embedding-001"
+EMBEDDING_CACHE_PATH = os.path.join("src", "cache", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY_SIZE = 4096
+
+# Embedding backend: "google" (remote model behind the cache) or "local" (hashed
+# character n-gram TF-IDF fitted on the stored contexts, see local_embeddings.py)
+FEW_SHOT_EMBEDDING_BACKEND = os.getenv("FEW_SHOT_EMBEDDING_BACKEND", "google").lower()
+LOCAL_EMBEDDING_IDF_PATH = os.path.join("src", "cache", "local_embedding_idf.npy")
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model with a content-hash cache.
+    
+    Vectors are keyed by (model, SHA-256 of the whitespace-normalized text), kept in
+    an in-memory LRU and persisted in SQLite, so index rebuilds and repeated queries
+    only embed texts that were never seen before. Document and query embeddings are
+    cached separately because the model embeds them with different task types.
+    """
+    
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        cache_path: str = EMBEDDING_CACHE_PATH,
+        memory_size: int = EMBEDDING_CACHE_MEMORY_SIZE
+    ):
+        """
+        Initialize the cache.
+        
+        Args:
+            embeddings: The underlying embeddings model
+            model_name: Model name, part of the cache key
+            cache_path: SQLite file for persisted vectors
+            memory_size: Maximum vectors kept in the in-memory LRU
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        with sqlite3.connect(cache_path) as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """)
+    
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """SHA-256 of the text with whitespace collapsed."""
+        return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+    
+    def _lookup(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Returns cached vectors for the given hashes, checking memory first, then SQLite."""
+        found = {}
+        missing = []
+        with self._lock:
+            for text_hash in hashes:
+                vector = self._memory.get((model, text_hash))
+                if vector is not None:
+                    self._memory.move_to_end((model, text_hash))
+                    found[text_hash] = vector
+                else:
+                    missing.append(text_hash)
+        
+        if missing:
+            with sqlite3.connect(self.cache_path) as conn:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    placeholders = ",".join("?" for _ in chunk)
+                    rows = conn.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                        [model] + chunk
+                    ).fetchall()
+                    for text_hash, blob in rows:
+                        found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+            self._remember(model, {h: found[h] for h in missing if h in found})
+        return found
+    
+    def _remember(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """Adds vectors to the in-memory LRU, evicting the least recently used."""
+        with self._lock:
+            for text_hash, vector in vectors.items():
+                self._memory[(model, text_hash)] = vector
+                self._memory.move_to_end((model, text_hash))
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+    
+    def _store(self, model: str, vectors: Dict[str, List[float]]) -> None:
+        """Persists new vectors and adds them to the in-memory LRU."""
+        self._remember(model, vectors)
+        try:
+            with sqlite3.connect(self.cache_path) as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                    [(model, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in vectors.items()]
+                )
+        except sqlite3.Error as e:
+            print(f"Error persisting embeddings to cache: {e}")
+    
+    def _embed_cached(self, texts: List[str], kind: str, embed_fn) -> List[List[float]]:
+        """Embeds only the texts missing from the cache; returns vectors in input order."""
+        model = f"{self.model_name}:{kind}"
+        hashes = [self.text_hash(text) for text in texts]
+        found = self._lookup(model, list(dict.fromkeys(hashes)))
+        
+        # Embed each missing text once, even if it occurs several times
+        to_embed = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in found and text_hash not in to_embed:
+                to_embed[text_hash] = text
+        self.hits += len(texts) - len(to_embed)
+        self.misses += len(to_embed)
+        
+        if to_embed:
+            new_vectors = embed_fn(list(to_embed.values()))
+            # Rounded to float32 so fresh results match what a later cache hit returns
+            computed = {h: np.asarray(v, dtype=np.float32).tolist() for h, v in zip(to_embed.keys(), new_vectors)}
+            self._store(model, computed)
+            found.update(computed)
+        return [list(found[text_hash]) for text_hash in hashes]
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds documents, reusing cached vectors."""
+        return self._embed_cached(texts, "document", self.embeddings.embed_documents)
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Embeds a query, reusing a cached vector."""
+        return self._embed_cached([text], "query", lambda batch: [self.embeddings.embed_query(batch[0])])[0]
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Embeds documents in fixed-size batches, one rate-limited request per batch.
+    
+    Used by offline index rebuilds behind CachedEmbeddings, so only texts missing
+    from the cache reach the model and count against the request budget.
+    """
+    
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        rate_limiter: Optional[BaseRateLimiter] = None,
+        batch_size: int = FEW_SHOT_REBUILD_BATCH_SIZE
+    ):
+        """
+        Initialize the wrapper.
+        
+        Args:
+            embeddings: The underlying embeddings model
+            rate_limiter: Limiter acquired before every request (None for no limit)
+            batch_size: Texts per request
+        """
+        self.embeddings = embeddings
+        self.rate_limiter = rate_limiter
+        self.batch_size = max(1, batch_size)
+        self.requests = 0
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(blocking=True)
+            vectors.extend(self.embeddings.embed_documents(texts[start:start + self.batch_size]))
+            self.requests += 1
+        return vectors
+    
+    def embed_query(self, text: str) -> List[float]:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(blocking=True)
+        self.requests += 1
+        return self.embeddings.embed_query(text)
+
+
+def make_index_key(machine_type: str, template_type: str, field_name: str) -> str:
+    """Builds the metadata key identifying one field's examples in the consolidated index."""
+    return f"{machine_type}_{template_type}_{field_name}"
+
+
+def read_active_build(index_root: str) -> Optional[str]:
+    """Name of the index build selected by the CURRENT pointer, or None for the lazily built index."""
+    try:
+        with open(os.path.join(index_root, FEW_SHOT_INDEX_POINTER_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _write_active_build(index_root: str, build_name: str) -> None:
+    """Points CURRENT at a build; os.replace makes the switch atomic for readers."""
+    pointer_path = os.path.join(index_root, FEW_SHOT_INDEX_POINTER_FILE)
+    tmp_path = pointer_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(build_name)
+    os.replace(tmp_path, pointer_path)
+
+
+def _build_directory(index_root: str, build_name: Optional[str]) -> str:
+    if build_name is None:
+        return index_root
+    return os.path.join(index_root, FEW_SHOT_INDEX_BUILDS_DIRECTORY, build_name)
+
+
+def _build_is_leased(build_directory: str) -> bool:
+    """True if a manager renewed its lease on the build within FEW_SHOT_BUILD_LEASE_SECONDS."""
+    lease_directory = os.path.join(build_directory, FEW_SHOT_BUILD_LEASES_DIRECTORY)
+    try:
+        lease_names = os.listdir(lease_directory)
+    except OSError:
+        return False
+    now = time.time()
+    for name in lease_names:
+        try:
+            if now - os.path.getmtime(os.path.join(lease_directory, name)) < FEW_SHOT_BUILD_LEASE_SECONDS:
+                return True
+        except OSError:
+            continue
+    return False
 
 
 class FewShotManager:
@@ -39,47 +325,306 @@ class FewShotManager:
             api_key: Google API key for embeddings (uses env var if not provided)
         """
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
-        if not self.api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment")
+        self.embedding_backend = FEW_SHOT_EMBEDDING_BACKEND
         
-        # Initialize embeddings
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=self.api_key
-        )
+        if self.embedding_backend == "local":
+            # CPU-only vectors: no API key or network round trip needed
+            self.embeddings = self._load_local_embeddings()
+        else:
+            if not self.api_key:
+                raise ValueError("GOOGLE_API_KEY not found in environment")
+            
+            # Initialize embeddings behind the content-hash cache
+            self.embeddings = CachedEmbeddings(
+                GoogleGenerativeAIEmbeddings(
+                    model=EMBEDDING_MODEL_NAME,
+                    google_api_key=self.api_key
+                ),
+                model_name=EMBEDDING_MODEL_NAME,
+                cache_path=EMBEDDING_CACHE_PATH
+            )
+        
+        # Single consolidated vector store, opened lazily on first use
+        self._vectorstore: Optional[Chroma] = None
+        
+        # Example ids already present in the store, per index key
+        self._indexed_ids: Dict[str, Set[str]] = {}
         
-        # Cache for vector stores by field
-        self._vectorstore_cache: Dict[str, Chroma] = {}
+        # Open per-field NumPy indexes (numpy backend only), least recently used first
+        self._numpy_indexes: "OrderedDict[str, NumpyVectorIndex]" = OrderedDict()
+        self.max_open_indexes = FEW_SHOT_MAX_OPEN_INDEXES
+        self.max_resident_bytes = FEW_SHOT_MAX_RESIDENT_BYTES
+        self.store_opens = 0
+        self.store_evictions = 0
+        
+        # Concurrency: _state_lock guards the dicts above. The store lock is held
+        # shared by every index operation and exclusively to close or drop the
+        # index. Each field's lock is held shared to search the field and
+        # exclusively to append to it, so concurrent requests index a field once.
+        self._state_lock = threading.RLock()
+        self._store_lock = ReadWriteLock()
+        self._index_locks: Dict[str, ReadWriteLock] = {}
         
         # Directory for persistent storage
-        self.persist_directory = os.path.join("src", "cache", "few_shot_embeddings")
+        self.index_backend = FEW_SHOT_INDEX_BACKEND
+        if self.index_backend == "numpy":
+            self.persist_directory = FEW_SHOT_NUMPY_INDEX_DIRECTORY
+        else:
+            self.persist_directory = FEW_SHOT_INDEX_DIRECTORY
+        if self.embedding_backend == "local":
+            # Local vectors have a different dimension, so they get their own index
+            self.persist_directory = os.path.join(self.persist_directory, "local")
         os.makedirs(self.persist_directory, exist_ok=True)
+        
+        # A completed offline rebuild replaces the lazily built index
+        self.index_root = self.persist_directory
+        self._active_build = read_active_build(self.index_root)
+        self.persist_directory = _build_directory(self.index_root, self._active_build)
+        self._lease_path: Optional[str] = None
+        self._lease_renewed = 0.0
+        self._take_build_lease(self._active_build)
     
-    def get_example_selector(
-        self, 
-        machine_type: str, 
-        template_type: str, 
-        field_name: str,
-        k: int = 2
-    ) -> Optional[SemanticSimilarityExampleSelector]:
+    def _load_local_embeddings(self, refit: bool = False) -> HashedTfidfEmbeddings:
         """
-        Creates or retrieves a semantic similarity example selector for a specific field.
+        Loads the local embedding weights, fitting them on the stored contexts if needed.
+        
+        With no stored contexts yet the weights stay unfitted (plain TF) and are
+        not saved, so the first load or rebuild with examples fits them.
+        
+        Args:
+            refit: Refit the IDF weights even if weights are stored
+        """
+        embeddings = None if refit else HashedTfidfEmbeddings.load(LOCAL_EMBEDDING_IDF_PATH)
+        if embeddings is None:
+            contexts = get_few_shot_contexts()
+            embeddings = HashedTfidfEmbeddings()
+            if contexts:
+                embeddings.fit(contexts)
+                embeddings.save(LOCAL_EMBEDDING_IDF_PATH)
+                print(f"Fitted local embeddings on {len(contexts)} few-shot context(s).")
+        return embeddings
+    
+    def get_numpy_index(self, index_key: str) -> NumpyVectorIndex:
+        """Returns the open NumPy index for one field, opening it (and evicting others) if needed."""
+        with self._state_lock:
+            index = self._numpy_indexes.get(index_key)
+            if index is not None:
+                self._numpy_indexes.move_to_end(index_key)
+                return index
+            index = NumpyVectorIndex(self.persist_directory, index_key)
+            self._numpy_indexes[index_key] = index
+            self.store_opens += 1
+            self._evict_open_indexes()
+            return index
+    
+    def _evict_open_indexes(self) -> None:
+        """Closes least recently used indexes beyond the count and memory bounds; holds the state lock."""
+        while len(self._numpy_indexes) > 1 and (
+            len(self._numpy_indexes) > self.max_open_indexes
+            or self._resident_bytes() > self.max_resident_bytes
+        ):
+            _, evicted = self._numpy_indexes.popitem(last=False)
+            evicted.close()
+            self.store_evictions += 1
+    
+    def _resident_bytes(self) -> int:
+        return sum(index.nbytes for index in self._numpy_indexes.values())
+    
+    def get_store_stats(self) -> Dict[str, Any]:
+        """Counters for monitoring open index handles and memory."""
+        with self._state_lock:
+            return {
+                "backend": self.index_backend,
+                "opens": self.store_opens,
+                "evictions": self.store_evictions,
+                "open_indexes": len(self._numpy_indexes) + (1 if self._vectorstore is not None else 0),
+                "resident_bytes": self._resident_bytes(),
+            }
+    
+    def get_vectorstore(self) -> Chroma:
+        """Opens (once) and returns the consolidated example vector store."""
+        with self._state_lock:
+            if self._vectorstore is None:
+                self._vectorstore = Chroma(
+                    collection_name=FEW_SHOT_COLLECTION_NAME,
+                    persist_directory=self.persist_directory,
+                    embedding_function=self.embeddings
+                )
+                self.store_opens += 1
+            return self._vectorstore
+    
+    def _index_lock(self, index_key: str) -> ReadWriteLock:
+        """Returns the read/write lock of one field's index."""
+        with self._state_lock:
+            if index_key not in self._index_locks:
+                self._index_locks[index_key] = ReadWriteLock()
+            return self._index_locks[index_key]
+    
+    def _indexed_id_set(self, index_key: str) -> Set[str]:
+        """
+        Example ids already in the index for one field (loaded once per field).
+        
+        The caller holds the field's write lock.
+        """
+        if self.index_backend == "numpy":
+            return self.get_numpy_index(index_key).ids
+        with self._state_lock:
+            indexed_ids = self._indexed_ids.get(index_key)
+        if indexed_ids is None:
+            existing = self.get_vectorstore().get(where={"index_key": index_key}, include=[])
+            indexed_ids = set(existing.get("ids", []))
+            with self._state_lock:
+                self._indexed_ids[index_key] = indexed_ids
+        return indexed_ids
+    
+    def _sync_index(
+        self,
+        machine_type: str,
+        template_type: str,
+        examples_by_field: Dict[str, List[Dict[str, Any]]]
+    ) -> int:
+        """
+        Appends examples missing from the index for one or more fields.
+        
+        Example ids are the database ids, so only examples that are not indexed
+        yet are embedded, all of them in a single embedding batch. Existing
+        vectors are never rebuilt here. Indexed examples that are no longer
+        among a field's stored top examples (evicted or merged in the database)
+        are removed from its index. The fields' write locks are held while
+        appending, so a thread arriving for the same field waits and then finds
+        the examples already indexed.
         
         Args:
             machine_type: Type of machine
             template_type: Template type
-            field_name: Field name
-            k: Number of examples to select
-            
+            examples_by_field: Formatted examples per field name
+        
         Returns:
-            SemanticSimilarityExampleSelector or None if no examples exist
+            Number of examples added to the index
         """
-        # Get examples from database
-        examples = get_few_shot_examples(machine_type, template_type, field_name, limit=50)
+        index_keys = sorted({make_index_key(machine_type, template_type, f) for f in examples_by_field})
+        with self._store_lock.read(), ExitStack() as held_locks:
+            for index_key in index_keys:  # sorted, so threads never wait on each other in a cycle
+                held_locks.enter_context(self._index_lock(index_key).write())
+            return self._append_missing_examples(machine_type, template_type, examples_by_field)
+    
+    def _append_missing_examples(
+        self,
+        machine_type: str,
+        template_type: str,
+        examples_by_field: Dict[str, List[Dict[str, Any]]]
+    ) -> int:
+        """Body of _sync_index; the caller holds the store lock and the fields' write locks."""
+        pending = []
+        stale_by_index: Dict[str, List[str]] = {}
+        for field_name, formatted_examples in examples_by_field.items():
+            index_key = make_index_key(machine_type, template_type, field_name)
+            indexed_ids = self._indexed_id_set(index_key)
+            current_ids = {str(ex["example_id"]) for ex in formatted_examples}
+            stale_ids = sorted(indexed_ids - current_ids)
+            if stale_ids:
+                stale_by_index[index_key] = stale_ids
+            for ex in formatted_examples:
+                if str(ex["example_id"]) not in indexed_ids:
+                    pending.append((field_name, index_key, ex))
         
-        if not examples:
-            return None
+        if stale_by_index:
+            self._remove_indexed_examples(stale_by_index)
+        if not pending:
+            return 0
+        
+        vectors = self.embeddings.embed_documents([ex["input_context"] for _, _, ex in pending])
         
+        if self.index_backend == "numpy":
+            by_index: Dict[str, List[Tuple[Dict[str, Any], List[float]]]] = {}
+            for (_, index_key, ex), vector in zip(pending, vectors):
+                by_index.setdefault(index_key, []).append((ex, vector))
+            for index_key, rows in by_index.items():
+                self.get_numpy_index(index_key).add(
+                    np.array([vector for _, vector in rows]),
+                    [str(ex["example_id"]) for ex, _ in rows],
+                    [ex for ex, _ in rows]
+                )
+            with self._state_lock:
+                self._evict_open_indexes()  # appended rows count towards the memory bound
+            return len(pending)
+        
+        self.get_vectorstore()._collection.upsert(
+            ids=[str(ex["example_id"]) for _, _, ex in pending],
+            embeddings=vectors,
+            documents=[ex["input_context"] for _, _, ex in pending],
+            metadatas=[
+                self._chroma_metadata(machine_type, template_type, field_name, index_key, ex)
+                for field_name, index_key, ex in pending
+            ]
+        )
+        for _, index_key, ex in pending:
+            self._indexed_id_set(index_key).add(str(ex["example_id"]))
+        return len(pending)
+    
+    def _remove_indexed_examples(self, stale_by_index: Dict[str, List[str]]) -> None:
+        """Removes examples that left their field's stored top examples; the caller holds the write locks."""
+        for index_key, stale_ids in stale_by_index.items():
+            if self.index_backend == "numpy":
+                self.get_numpy_index(index_key).remove(stale_ids)
+            else:
+                self.get_vectorstore()._collection.delete(ids=stale_ids)
+                self._indexed_id_set(index_key).difference_update(stale_ids)
+        print(f"Removed {sum(len(ids) for ids in stale_by_index.values())} evicted example(s) from the few-shot index.")
+    
+    @staticmethod
+    def _chroma_metadata(
+        machine_type: str,
+        template_type: str,
+        field_name: str,
+        index_key: str,
+        ex: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Metadata stored with an example in the consolidated collection (filterable by index_key)."""
+        return {
+            **ex,
+            "machine_type": machine_type,
+            "template_type": template_type,
+            "field_name": field_name,
+            "index_key": index_key,
+        }
+    
+    def _load_formatted_examples(
+        self,
+        machine_type: str,
+        template_type: str,
+        field_name: str
+    ) -> List[Dict[str, Any]]:
+        """Reads a field's examples from the database and formats them for the index."""
+        return self._load_formatted_examples_by_field(machine_type, template_type, [field_name])[field_name]
+    
+    def _load_formatted_examples_by_field(
+        self,
+        machine_type: str,
+        template_type: str,
+        field_names: List[str]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Reads several fields' examples in one query and formats them for the index.
+        
+        Uses get_all_few_shot_examples, which does not count as usage: building
+        or syncing an index must not change the usage statistics that rank
+        examples, drive compaction and pick the warm-up fields.
+        """
+        field_names = list(dict.fromkeys(field_names))
+        rows_by_field: Dict[str, List[Dict[str, Any]]] = {field_name: [] for field_name in field_names}
+        for row in get_all_few_shot_examples(
+            limit_per_field=FEW_SHOT_INDEX_EXAMPLES_PER_FIELD,
+            machine_type=machine_type,
+            template_type=template_type,
+            field_names=field_names
+        ):
+            rows_by_field[row["field_name"]].append(row)
+        return {field_name: self._format_examples(rows) for field_name, rows in rows_by_field.items()}
+    
+    @staticmethod
+    def _format_examples(examples: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Formats database example rows for the index, skipping empty ones."""
         # Format examples for LangChain
         formatted_examples = []
         for ex in examples:
@@ -92,6 +637,8 @@ class FewShotManager:
             
             if not input_context.strip() and not expected_output.strip():
                 continue  # Skip empty examples that would add noise
+            if ex.get("id") is None:
+                continue  # The database id is the example's id in the index
             
             formatted_examples.append({
                 "input_context": input_context,
@@ -99,48 +646,95 @@ class FewShotManager:
                 "confidence_score": float(ex.get("confidence_score", 1.0) or 1.0),
                 "example_id": ex.get("id")
             })
+        return formatted_examples
+    
+    def index_new_examples(self, machine_type: str, template_type: str, field_names: List[str]) -> int:
+        """
+        Incrementally indexes newly saved examples for several fields at once.
         
-        if not formatted_examples:
-            return None
+        Called after a GOA is processed: the new vectors are appended to the
+        existing index in one embedding batch instead of invalidating and
+        rebuilding each field.
         
-        # Create unique key for this field
-        cache_key = f"{machine_type}_{template_type}_{field_name}"
-        persist_path = os.path.join(self.persist_directory, cache_key)
+        Args:
+            machine_type: Type of machine
+            template_type: Template type
+            field_names: Fields that received new examples
+            
+        Returns:
+            Number of examples added to the index
+        """
+        self.refresh_active_build()
+        examples_by_field = self._load_formatted_examples_by_field(machine_type, template_type, field_names)
+        return self._sync_index(machine_type, template_type, examples_by_field)
+    
+    def preload_indexes(self, machine_type: str, template_type: str, field_names: List[str]) -> int:
+        """
+        Indexes any missing examples of the fields and opens their indexes, without searching.
         
-        try:
-            # Try to load existing vectorstore
-            if cache_key in self._vectorstore_cache:
-                vectorstore = self._vectorstore_cache[cache_key]
-            elif os.path.exists(persist_path):
-                vectorstore = Chroma(
-                    persist_directory=persist_path,
-                    embedding_function=self.embeddings
-                )
-                self._vectorstore_cache[cache_key] = vectorstore
+        Used by the startup warm-up; like every index read, it leaves the examples'
+        usage counters untouched.
+        
+        Returns:
+            Number of examples added to the index
+        """
+        added = self.index_new_examples(machine_type, template_type, field_names)
+        with self._store_lock.read():
+            if self.index_backend == "numpy":
+                for field_name in field_names:
+                    self.get_numpy_index(make_index_key(machine_type, template_type, field_name))
             else:
-                # Create new vectorstore
-                vectorstore = None
+                self.get_vectorstore()
+        return added
+    
+    def get_example_selector(
+        self, 
+        machine_type: str, 
+        template_type: str, 
+        field_name: str,
+        k: int = 2
+    ) -> Optional[BaseExampleSelector]:
+        """
+        Creates or retrieves a semantic similarity example selector for a specific field.
+        
+        With the numpy backend a NumpyExampleSelector is returned; it exposes the
+        same select_examples interface as SemanticSimilarityExampleSelector.
+        
+        Args:
+            machine_type: Type of machine
+            template_type: Template type
+            field_name: Field name
+            k: Number of examples to select
             
-            # Create example selector
-            if vectorstore is None:
-                # First time creation
-                example_selector = SemanticSimilarityExampleSelector.from_examples(
-                    formatted_examples,
+        Returns:
+            SemanticSimilarityExampleSelector or None if no examples exist
+        """
+        self.refresh_active_build()
+        
+        # Get examples from database
+        formatted_examples = self._load_formatted_examples(machine_type, template_type, field_name)
+        
+        if not formatted_examples:
+            return None
+        
+        try:
+            # Index any examples not yet in the consolidated store, then search
+            # only this field's examples through a metadata filter
+            self._sync_index(machine_type, template_type, {field_name: formatted_examples})
+            if self.index_backend == "numpy":
+                index_key = make_index_key(machine_type, template_type, field_name)
+                return NumpyExampleSelector(
+                    lambda: self._selector_index(index_key),
                     self.embeddings,
-                    Chroma,
                     k=k,
-                    input_keys=["input_context"],
-                    persist_directory=persist_path
+                    example_keys=EXAMPLE_KEYS
                 )
-            else:
-                # Use existing vectorstore
-                example_selector = SemanticSimilarityExampleSelector(
-                    vectorstore=vectorstore,
-                    k=k
-                )
-            
-            self._vectorstore_cache[cache_key] = example_selector.vectorstore
-            return example_selector
+            return SemanticSimilarityExampleSelector(
+                vectorstore=self.get_vectorstore(),
+                k=k,
+                example_keys=EXAMPLE_KEYS,
+                vectorstore_kwargs={"filter": {"index_key": make_index_key(machine_type, template_type, field_name)}}
+            )
             
         except Exception as e:
             print(f"Error creating example selector for {field_name}: {e}")
@@ -221,17 +815,82 @@ class FewShotManager:
         Returns:
             List of selected examples
         """
-        example_selector = self.get_example_selector(
-            machine_type, template_type, field_name, k
-        )
+        # Select examples based on semantic similarity
+        return self.select_best_examples_batch(
+            input_text, machine_type, template_type, [field_name], k
+        ).get(field_name, [])
+    
+    def _selector_index(self, index_key: str) -> NumpyVectorIndex:
+        """Index lookup of a NumpyExampleSelector: switches to a newly swapped build first."""
+        self.refresh_active_build()
+        return self.get_numpy_index(index_key)
+    
+    def _search_field(self, index_key: str, query_vector: List[float], k: int) -> List[Dict[str, Any]]:
+        """
+        Returns the k examples of one field closest to an embedded query.
         
-        if example_selector is None:
-            return []
+        Searches the manager's current index rather than a selector's, so a search
+        racing a compaction sees the new (possibly still empty) index. The caller
+        holds the store read lock.
+        """
+        with self._index_lock(index_key).read():
+            if self.index_backend == "numpy":
+                hits = search_open_index(lambda: self.get_numpy_index(index_key), np.array(query_vector), k)
+                return [{key: hit[key] for key in EXAMPLE_KEYS if key in hit} for hit in hits]
+            docs = self.get_vectorstore().similarity_search_by_vector(
+                query_vector, k=k, filter={"index_key": index_key}
+            )
+            return [{key: doc.metadata[key] for key in EXAMPLE_KEYS if key in doc.metadata} for doc in docs]
+    
+    def select_best_examples_batch(
+        self,
+        input_text: str,
+        machine_type: str,
+        template_type: str,
+        field_names: List[str],
+        k: int = 2
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Selects the best examples for several fields with a single query embedding.
         
-        # Select examples based on semantic similarity
-        selected = example_selector.select_examples({"input_context": input_text})
+        The input text is embedded once and the vector is reused for every field's
+        index, instead of one embedding request per field.
+        
+        Args:
+            input_text: The input text to find similar examples for
+            machine_type: Type of machine
+            template_type: Template type
+            field_names: Fields to select examples for
+            k: Number of examples to select per field
+            
+        Returns:
+            Dictionary of field name to selected examples (fields without examples are omitted)
+        """
+        self.refresh_active_build()
+        # One database read and one index sync for all fields, then direct searches
+        examples_by_field = {
+            field_name: rows
+            for field_name, rows in self._load_formatted_examples_by_field(machine_type, template_type, field_names).items()
+            if rows
+        }
+        if not examples_by_field:
+            return {}
+        
+        try:
+            self._sync_index(machine_type, template_type, examples_by_field)
+        except Exception as e:
+            print(f"Error indexing examples for {len(examples_by_field)} field(s): {e}")
+            return {}
+        
+        query_vector = self.embeddings.embed_query(input_text)
         
-        return selected
+        results = {}
+        with self._store_lock.read():
+            for field_name in examples_by_field:
+                selected = self._search_field(make_index_key(machine_type, template_type, field_name), query_vector, k)
+                if selected:
+                    results[field_name] = selected
+        return results
     
     def add_example(
         self,
@@ -271,79 +930,327 @@ class FewShotManager:
         
         if success:
             try:
-                # Get the selector, which loads or creates the vectorstore
-                example_selector = self.get_example_selector(
-                    machine_type, template_type, field_name
-                )
-                
-                # Add the new example directly to the active vectorstore
-                if example_selector and hasattr(example_selector, 'add_example'):
-                    new_example = {
-                        "input_context": input_context,
-                        "expected_output": expected_output,
-                    }
-                    example_selector.add_example(new_example)
-                    print(f"Successfully added new example to live vectorstore for {field_name}.")
-                else:
-                    # If there's no selector or it can't add examples, invalidate the cache
-                    # so it gets rebuilt on the next run. This is a safe fallback.
-                    print(f"No active vectorstore for {field_name} or it cannot be updated. Invalidating cache.")
-                    self.invalidate_cache(machine_type, template_type, field_name)
-            
+                # Getting the selector indexes the new example in the consolidated store
+                self.get_example_selector(machine_type, template_type, field_name)
+                print(f"Successfully added new example to live vectorstore for {field_name}.")
             except Exception as e:
-                # If adding directly fails for any reason, fall back to the invalidation method
-                print(f"Error adding example to vectorstore, using cache invalidation as fallback. Error: {e}")
-                self.invalidate_cache(machine_type, template_type, field_name)
+                # The example is in the database and will be indexed on next access
+                print(f"Error adding example to vectorstore; it will be indexed on next access. Error: {e}")
 
         return success
     
-    def shutdown_vectorstore(self, cache_key: str):
+    def shutdown_vectorstore(self):
         """
         Properly shuts down the Chroma vectorstore to release file locks.
         
-        Args:
-            cache_key: The key for the vectorstore to shut down.
+        Waits for in-flight searches and appends to finish first.
         """
-        if cache_key in self._vectorstore_cache:
-            vectorstore = self._vectorstore_cache[cache_key]
-            
-            # Chroma's client needs to be stopped to release file locks
-            if hasattr(vectorstore, "_client") and hasattr(vectorstore._client, "stop"):
-                try:
-                    vectorstore._client.stop()
-                except Exception as e:
-                    print(f"Error stopping Chroma client for {cache_key}: {e}")
-
-            # Remove from cache and force garbage collection to release file handles
-            del self._vectorstore_cache[cache_key]
-            gc.collect()
+        with self._store_lock.write():
+            self._close_vectorstore()
+    
+    def _close_vectorstore(self):
+        """Stops the Chroma client; the caller holds the store write lock."""
+        with self._state_lock:
+            vectorstore, self._vectorstore = self._vectorstore, None
+            self._indexed_ids.clear()
+        if vectorstore is None:
+            return
+        
+        # Stopping Chroma's client releases its file handles; no gc.collect() needed
+        if hasattr(vectorstore, "_client") and hasattr(vectorstore._client, "stop"):
+            try:
+                vectorstore._client.stop()
+            except Exception as e:
+                print(f"Error stopping Chroma client: {e}")
 
     def invalidate_cache(self, machine_type: str, template_type: str, field_name: str):
         """
-        Invalidates the cache for a specific field, forcing rebuild on next access.
+        Invalidates the index entries for a specific field, forcing re-indexing on next access.
+        
+        Only this field's vectors are removed from the consolidated store; other
+        fields and the store itself are left untouched.
         
         Args:
             machine_type: Type of machine
             template_type: Template type
             field_name: Field name
         """
-        cache_key = f"{machine_type}_{template_type}_{field_name}"
+        index_key = make_index_key(machine_type, template_type, field_name)
+        with self._store_lock.read(), self._index_lock(index_key).write():
+            if self.index_backend == "numpy":
+                self.get_numpy_index(index_key).clear()
+                return
+            self.get_vectorstore()._collection.delete(where={"index_key": index_key})
+            with self._state_lock:
+                self._indexed_ids.pop(index_key, None)
+    
+    def compact_index(self):
+        """
+        Drops the active example index in place so every field is re-indexed lazily.
         
-        # Properly shut down the vectorstore before deleting files
-        self.shutdown_vectorstore(cache_key)
+        Fields are re-indexed on their next access, i.e. on the request path. Use
+        rebuild_all_indexes() to replace the index without that cost.
+        """
+        with self._store_lock.write():
+            if self.index_backend == "numpy":
+                with self._state_lock:
+                    for index in self._numpy_indexes.values():
+                        index.clear()
+                    self._numpy_indexes.clear()
+                for file_name in os.listdir(self.persist_directory):
+                    if file_name.endswith((".npy", ".json")):
+                        os.remove(os.path.join(self.persist_directory, file_name))
+            else:
+                self.get_vectorstore().delete_collection()
+                self._close_vectorstore()
+            if self.embedding_backend == "local":
+                # Every field is re-indexed anyway, so refit the IDF on the current contexts
+                self.embeddings = self._load_local_embeddings(refit=True)
+        print("Few-shot example index compacted; fields will be re-indexed on next access.")
+    
+    def refresh_active_build(self) -> bool:
+        """
+        Switches to the index build the CURRENT pointer selects, if it changed.
+        
+        Another process (e.g., the rebuild script) may have swapped in a new
+        build; reading the pointer is a single small file read per request.
+        Called on every selection path, which also renews this manager's lease
+        on the build it serves.
         
-        persist_path = os.path.join(self.persist_directory, cache_key)
-        if os.path.exists(persist_path):
-            import shutil
+        Returns:
+            True if the manager switched to another build
+        """
+        build_name = read_active_build(self.index_root)
+        if build_name == self._active_build:
+            self._renew_build_lease()
+            return False
+        with self._store_lock.write():
+            if build_name != self._active_build:
+                self._switch_to_build(build_name)
+        return True
+    
+    def _switch_to_build(self, build_name: Optional[str]) -> None:
+        """Closes the open index and points the manager at a build; the caller holds the store write lock."""
+        with self._state_lock:
+            for index in self._numpy_indexes.values():
+                index.close()
+            self._numpy_indexes.clear()
+        self._close_vectorstore()
+        if self.embedding_backend == "local":
+            # The build was embedded with the weights saved alongside its swap
+            self.embeddings = HashedTfidfEmbeddings.load(LOCAL_EMBEDDING_IDF_PATH) or self.embeddings
+        self._active_build = build_name
+        self.persist_directory = _build_directory(self.index_root, build_name)
+        self._take_build_lease(build_name)
+        print(f"Few-shot example index switched to {self.persist_directory}.")
+    
+    def _take_build_lease(self, build_name: Optional[str]) -> None:
+        """Releases the lease on the previous build and leases build_name (None is the lazily built index)."""
+        if self._lease_path is not None:
             try:
-                shutil.rmtree(persist_path)
-            except OSError as e:
-                # If the error is a file lock error on Windows, handle it gracefully.
-                if hasattr(e, 'winerror') and e.winerror == 32:
-                    print(f"Cache for '{field_name}' is locked; will be rebuilt on next application start.")
-                else:
-                    # For other OS or different errors, re-raise the exception.
-                    raise
+                os.remove(self._lease_path)
+            except OSError:
+                pass
+            self._lease_path = None
+        if build_name is None:
+            return
+        lease_directory = os.path.join(_build_directory(self.index_root, build_name), FEW_SHOT_BUILD_LEASES_DIRECTORY)
+        lease_path = os.path.join(lease_directory, f"{os.getpid()}-{id(self)}")
+        try:
+            os.makedirs(lease_directory, exist_ok=True)
+            with open(lease_path, "w", encoding="utf-8"):
+                pass
+            self._lease_path = lease_path
+            self._lease_renewed = time.time()
+        except OSError as e:
+            print(f"Error leasing few-shot index build {build_name}: {e}")
+    
+    def _renew_build_lease(self) -> None:
+        """Touches the lease file a few times per lease period so pruning sees the build in use."""
+        if self._lease_path is None or time.time() - self._lease_renewed < FEW_SHOT_BUILD_LEASE_SECONDS / 4:
+            return
+        try:
+            os.utime(self._lease_path)
+            self._lease_renewed = time.time()
+        except OSError as e:
+            print(f"Error renewing few-shot index build lease: {e}")
+    
+    def rebuild_all_indexes(
+        self,
+        batch_size: int = FEW_SHOT_REBUILD_BATCH_SIZE,
+        rate_limiter: Optional[BaseRateLimiter] = None
+    ) -> Dict[str, Any]:
+        """
+        Rebuilds every field's index from few_shot_examples in one offline job.
+        
+        Each distinct context is embedded once, in batches of batch_size texts per
+        request under the rate limiter; texts already in the embedding cache cost
+        no request. The new index is written to its own build directory while
+        requests keep searching the current one, then the CURRENT pointer is
+        swapped atomically. Interactive requests never wait for the rebuild, only
+        for the swap itself. Local embeddings are refitted on the rebuilt corpus
+        and the new weights are saved with the swap.
+        
+        Args:
+            batch_size: Texts per embedding request
+            rate_limiter: Limiter for embedding requests (defaults to
+                FEW_SHOT_EMBEDDING_REQUESTS_PER_MINUTE; not used by local embeddings)
+        
+        Returns:
+            Statistics: build, fields, examples, texts, embedding_requests, seconds
+        """
+        start = time.perf_counter()
+        examples_by_key: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        for row in get_all_few_shot_examples(limit_per_field=FEW_SHOT_INDEX_EXAMPLES_PER_FIELD):
+            examples_by_key.setdefault(
+                (row["machine_type"], row["template_type"], row["field_name"]), []
+            ).append(row)
+        formatted_by_key = {key: self._format_examples(rows) for key, rows in examples_by_key.items()}
+        formatted_by_key = {key: rows for key, rows in formatted_by_key.items() if rows}
+        
+        # Fields of one machine share their context, so embed each distinct text once
+        texts = list(dict.fromkeys(
+            ex["input_context"] for rows in formatted_by_key.values() for ex in rows
+        ))
+        if rate_limiter is None and self.embedding_backend != "local":
+            rate_limiter = InMemoryRateLimiter(
+                requests_per_second=FEW_SHOT_EMBEDDING_REQUESTS_PER_MINUTE / 60.0,
+                check_every_n_seconds=0.1
+            )
+        local_embeddings: Optional[HashedTfidfEmbeddings] = None
+        if self.embedding_backend == "local":
+            # Refit on a new instance: requests keep searching the current build with the current weights
+            contexts = get_few_shot_contexts()
+            local_embeddings = HashedTfidfEmbeddings().fit(contexts) if contexts else None
+            limited = RateLimitedEmbeddings(local_embeddings or self.embeddings, rate_limiter, batch_size)
+            embeddings: Embeddings = limited
+        elif isinstance(self.embeddings, CachedEmbeddings):
+            limited = RateLimitedEmbeddings(self.embeddings.embeddings, rate_limiter, batch_size)
+            embeddings = CachedEmbeddings(
+                limited,
+                model_name=self.embeddings.model_name,
+                cache_path=self.embeddings.cache_path,
+                memory_size=self.embeddings.memory_size
+            )
+        else:
+            limited = RateLimitedEmbeddings(self.embeddings, rate_limiter, batch_size)
+            embeddings = limited
+        vectors_by_text = dict(zip(texts, embeddings.embed_documents(texts))) if texts else {}
+        
+        build_name = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        build_directory = _build_directory(self.index_root, build_name)
+        os.makedirs(build_directory, exist_ok=True)
+        if self.index_backend == "numpy":
+            for (machine_type, template_type, field_name), rows in formatted_by_key.items():
+                NumpyVectorIndex(build_directory, make_index_key(machine_type, template_type, field_name)).add(
+                    np.array([vectors_by_text[ex["input_context"]] for ex in rows]),
+                    [str(ex["example_id"]) for ex in rows],
+                    rows
+                )
+        else:
+            self._write_chroma_build(build_directory, formatted_by_key, vectors_by_text)
+        
+        with self._store_lock.write():
+            previous_build = read_active_build(self.index_root)
+            if local_embeddings is not None:
+                # Saved before the pointer so other processes switch to matching weights
+                local_embeddings.save(LOCAL_EMBEDDING_IDF_PATH)
+            _write_active_build(self.index_root, build_name)
+            self._switch_to_build(build_name)
+        self._prune_builds(keep=[build_name, previous_build])
+        
+        stats = {
+            "build": build_name,
+            "fields": len(formatted_by_key),
+            "examples": sum(len(rows) for rows in formatted_by_key.values()),
+            "texts": len(texts),
+            "embedding_requests": limited.requests,
+            "seconds": time.perf_counter() - start,
+        }
+        print(f"Rebuilt few-shot index {build_name}: {stats['fields']} field(s), {stats['examples']} example(s), "
+              f"{stats['embedding_requests']} embedding request(s) in {stats['seconds']:.1f}s.")
+        return stats
+    
+    def _write_chroma_build(
+        self,
+        build_directory: str,
+        formatted_by_key: Dict[Tuple[str, str, str], List[Dict[str, Any]]],
+        vectors_by_text: Dict[str, List[float]]
+    ) -> None:
+        """Writes a complete consolidated collection into a new build directory."""
+        entries = [
+            (make_index_key(machine_type, template_type, field_name), machine_type, template_type, field_name, ex)
+            for (machine_type, template_type, field_name), rows in formatted_by_key.items()
+            for ex in rows
+        ]
+        build_store = Chroma(
+            collection_name=FEW_SHOT_COLLECTION_NAME,
+            persist_directory=build_directory,
+            embedding_function=self.embeddings
+        )
+        try:
+            for start in range(0, len(entries), CHROMA_UPSERT_BATCH_SIZE):
+                batch = entries[start:start + CHROMA_UPSERT_BATCH_SIZE]
+                build_store._collection.upsert(
+                    ids=[str(ex["example_id"]) for _, _, _, _, ex in batch],
+                    embeddings=[vectors_by_text[ex["input_context"]] for _, _, _, _, ex in batch],
+                    documents=[ex["input_context"] for _, _, _, _, ex in batch],
+                    metadatas=[
+                        self._chroma_metadata(machine_type, template_type, field_name, index_key, ex)
+                        for index_key, machine_type, template_type, field_name, ex in batch
+                    ]
+                )
+        finally:
+            if hasattr(build_store, "_client") and hasattr(build_store._client, "stop"):
+                build_store._client.stop()
+    
+    def _prune_builds(self, keep: List[Optional[str]]) -> None:
+        """
+        Deletes old builds beyond the newest FEW_SHOT_INDEX_BUILDS_KEPT.
+        
+        The builds in keep (the new and the previously active build) and any build
+        a manager still holds a live lease on are never deleted; they are retried
+        on the next rebuild.
+        """
+        builds_directory = os.path.join(self.index_root, FEW_SHOT_INDEX_BUILDS_DIRECTORY)
+        kept = {name for name in keep if name}
+        for name in sorted(os.listdir(builds_directory), reverse=True):
+            if name in kept:
+                continue
+            if len(kept) < FEW_SHOT_INDEX_BUILDS_KEPT:
+                kept.add(name)
+                continue
+            build_directory = os.path.join(builds_directory, name)
+            if _build_is_leased(build_directory):
+                print(f"Keeping few-shot index build {name}: still in use by another manager.")
+                continue
+            shutil.rmtree(build_directory, ignore_errors=True)
+
+
+def remove_legacy_field_stores(directory: str = LEGACY_FEW_SHOT_STORE_DIRECTORY) -> int:
+    """
+    One-time cleanup of the per-field Chroma stores replaced by the consolidated index.
+    
+    Nothing needs migrating: every example is in the few_shot_examples table and
+    is indexed again on first access (or by rebuild_few_shot_index.py).
+    
+    Args:
+        directory: Directory holding one Chroma store per field
+        
+    Returns:
+        Number of legacy stores removed
+    """
+    if not os.path.isdir(directory):
+        return 0
+    try:
+        store_count = len(os.listdir(directory))
+        shutil.rmtree(directory)
+        print(f"Removed {store_count} legacy per-field few-shot store(s) from {directory}.")
+        return store_count
+    except OSError as e:
+        # A store still open in another process is retried on the next start
+        print(f"Error removing legacy few-shot stores in {directory}: {e}")
+        return 0
 
 
 def get_few_shot_manager(api_key: Optional[str] = None) -> "FewShotManager":
@@ -353,7 +1260,11 @@ def get_few_shot_manager(api_key: Optional[str] = None) -> "FewShotManager":
     """
     global _MANAGER_INSTANCE
     if _MANAGER_INSTANCE is None:
-        _MANAGER_INSTANCE = FewShotManager(api_key=api_key)
+        # The startup warm-up thread may create the manager concurrently with a request
+        with _MANAGER_LOCK:
+            if _MANAGER_INSTANCE is None:
+                remove_legacy_field_stores()
+                _MANAGER_INSTANCE = FewShotManager(api_key=api_key)
     return _MANAGER_INSTANCE
 
 
@@ -462,15 +1373,17 @@ def enhance_prompt_with_semantic_examples(
         few_shot_section = ["\nSEMANTICALLY SELECTED EXAMPLES (most relevant to current input):"]
         examples_added = 0
         
+        # Embed the input context once and search every field's index with it
+        examples_by_field = manager.select_best_examples_batch(
+            input_context,
+            machine_type,
+            template_type,
+            key_fields,
+            k=max_examples_per_field
+        )
+        
         for field_name in key_fields:
-            # Get semantically similar examples
-            selected_examples = manager.select_best_examples(
-                input_context,
-                machine_type,
-                template_type,
-                field_name,
-                k=max_examples_per_field
-            )
+            selected_examples = examples_by_field.get(field_name)
             
             if selected_examples:
                 few_shot_section.append(f"\nExamples for '{field_name}':")
@@ -542,3 +1455,44 @@ def get_enhanced_few_shot_examples(
         print(f"Error getting enhanced examples: {e}")
         # Fall back to basic retrieval
         return get_few_shot_examples(machine_type, template_type, field_name, limit)
+
+
+def rebuild_few_shot_indexes(batch_size: int = FEW_SHOT_REBUILD_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Rebuilds the example index of every field offline and swaps it in atomically.
+    
+    Args:
+        batch_size: Texts per embedding request
+        
+    Returns:
+        Rebuild statistics (see FewShotManager.rebuild_all_indexes)
+    """
+    return get_few_shot_manager().rebuild_all_indexes(batch_size=batch_size)
+
+
+def compact_few_shot_store(
+    max_per_field: int = FEW_SHOT_MAX_EXAMPLES_PER_FIELD,
+    similarity_threshold: float = FEW_SHOT_DUPLICATE_THRESHOLD
+) -> Dict[str, int]:
+    """
+    Compacts the few-shot example store and rebuilds the example index once.
+    
+    Near-duplicate examples are merged and each field is capped (see
+    compact_few_shot_examples). If rows were removed, every field's index is
+    rebuilt from the compacted table in one job and swapped in atomically (see
+    FewShotManager.rebuild_all_indexes), so no request pays for re-indexing.
+    
+    Args:
+        max_per_field: Maximum examples kept per field
+        similarity_threshold: Minimum context similarity for merging examples
+        
+    Returns:
+        Compaction statistics
+    """
+    stats = compact_few_shot_examples(max_per_field=max_per_field, similarity_threshold=similarity_threshold)
+    if stats["merged"] or stats["evicted"]:
+        try:
+            get_few_shot_manager().rebuild_all_indexes()
+        except Exception as e:
+            print(f"Error rebuilding few-shot index after compaction: {e}")
+    return stats
@@ -9,7 +9,7 @@ import re
 from typing import Dict, List, Optional, Tuple, Any
 from src.utils.crm_utils import (
     save_few_shot_example, get_few_shot_examples, get_similar_examples,
-    add_few_shot_feedback
+    add_few_shot_feedback, insert_few_shot_examples
 )
 
 def determine_machine_type(machine_name: str) -> str:
@@ -165,6 +165,45 @@ def save_successful_extraction_as_example(field_name: str, field_value: str,
         confidence_score=confidence_score
     )
 
+def save_successful_extractions_as_examples(field_values: Dict[str, str],
+                                          machine_data: Dict, common_items: List[Dict],
+                                          full_pdf_text: str, machine_type: str,
+                                          template_type: str, source_machine_id: Optional[int] = None,
+                                          confidence_score: float = 1.0) -> List[str]:
+    """
+    Saves many successful field extractions of one machine as few-shot examples at once.
+    
+    All rows are written in a single transaction (see insert_few_shot_examples);
+    examples already stored with the same context and value are skipped.
+    
+    Args:
+        field_values: Field name to successfully extracted value
+        machine_data: Machine data dictionary
+        common_items: List of common items
+        full_pdf_text: Full PDF text
+        machine_type: Type of machine
+        template_type: Type of template
+        source_machine_id: ID of the source machine
+        confidence_score: Confidence in these examples
+    
+    Returns:
+        List[str]: Fields whose example was inserted (the ones to index)
+    """
+    examples = []
+    for field_name, field_value in field_values.items():
+        examples.append({
+            "machine_type": machine_type,
+            "template_type": template_type,
+            "field_name": field_name,
+            "input_context": extract_field_context_for_example(
+                field_name, machine_data, common_items, full_pdf_text
+            ),
+            "expected_output": field_value,
+            "source_machine_id": source_machine_id,
+            "confidence_score": confidence_score,
+        })
+    return [ex["field_name"] for ex in insert_few_shot_examples(examples)]
+
 def enhance_prompt_with_few_shot_examples(prompt_parts: List[str], 
                                         machine_data: Dict,
                                         template_placeholder_contexts: Dict[str, str],
@@ -1,9 +1,12 @@
+import hashlib
 import html
+import json
 import re
 import os
+import threading
 from collections import defaultdict
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 
 from openpyxl import load_workbook
 
@@ -14,6 +17,14 @@ EXCEL_PATH = TEMPLATE_DIR / EXCEL_FILENAME
 OUTPUT_HTML_FILENAME = "goa_form.html"
 OUTPUT_HTML_PATH = TEMPLATE_DIR / OUTPUT_HTML_FILENAME
 
+# Bump whenever load_rows/build_html change the generated form, so existing forms are rebuilt
+GENERATOR_VERSION = "1"
+FORM_STAMP_SUFFIX = ".stamp.json"
+
+# (excel path, output path) -> (mtime_ns, size) of both files when the form was last verified current
+_FORM_STAMP_CACHE: Dict[Tuple[str, str], Tuple[Tuple[int, int], Tuple[int, int]]] = {}
+_FORM_LOCK = threading.Lock()
+
 def load_rows(excel_path: Path = EXCEL_PATH) -> List[Dict[str, str]]:
     """
     Reads rows from the Excel template.
@@ -470,18 +481,94 @@ def build_html(rows):
 </html>
 """
 
-def generate_goa_form(excel_path: Path = EXCEL_PATH, output_path: Path = OUTPUT_HTML_PATH) -> bool:
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_stamp(path: Path) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _form_stamp(excel_path: Path) -> Dict[str, str]:
+    """What the generated form depends on: the template content and the generator version."""
+    return {"source_hash": file_sha256(str(excel_path)), "generator_version": GENERATOR_VERSION}
+
+
+def _stamp_path(output_path: Path) -> Path:
+    return Path(str(output_path) + FORM_STAMP_SUFFIX)
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    """Writes through a temporary file and renames it, so readers never see a partial file."""
+    tmp_path = Path(f"{path}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def is_form_current(excel_path: Path = EXCEL_PATH, output_path: Path = OUTPUT_HTML_PATH) -> bool:
     """
-    Generates the HTML form from the Excel template.
+    Checks whether the generated form matches the Excel template and generator version.
+    
+    Once verified, later checks only stat the two files until either changes.
+    
+    Returns:
+        True if the form exists and was generated from the current template
     """
+    cache_key = (os.path.abspath(excel_path), os.path.abspath(output_path))
     try:
-        print(f"Generating form from {excel_path}...")
-        rows = load_rows(excel_path)
-        html_doc = build_html(rows)
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(html_doc)
-        print(f"Successfully generated {output_path} with {len(rows)} fields.")
+        stamps = (_file_stamp(excel_path), _file_stamp(output_path))
+    except OSError:
+        return False
+    if _FORM_STAMP_CACHE.get(cache_key) == stamps:
         return True
+    try:
+        with open(_stamp_path(output_path), "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if stored != _form_stamp(excel_path):
+        return False
+    _FORM_STAMP_CACHE[cache_key] = stamps
+    return True
+
+
+def generate_goa_form(excel_path: Path = EXCEL_PATH, output_path: Path = OUTPUT_HTML_PATH, force: bool = False) -> bool:
+    """
+    Generates the HTML form from the Excel template, unless it is already up to date.
+    
+    A stamp file next to the form records the template hash and GENERATOR_VERSION
+    it was built from; the form is rebuilt only when either changes. Files are
+    written atomically, so concurrent runs never see or leave a partial form.
+    
+    Args:
+        excel_path: Excel template
+        output_path: Generated HTML form
+        force: Rebuild even if the form is up to date
+    
+    Returns:
+        True if the form is up to date afterwards
+    """
+    try:
+        if not force and is_form_current(excel_path, output_path):
+            return True
+        with _FORM_LOCK:
+            if not force and is_form_current(excel_path, output_path):
+                return True  # another thread rebuilt it meanwhile
+            print(f"Generating form from {excel_path}...")
+            stamp = _form_stamp(excel_path)
+            rows = load_rows(excel_path)
+            html_doc = build_html(rows)
+            _write_atomic(Path(output_path), html_doc)
+            _write_atomic(_stamp_path(output_path), json.dumps(stamp))
+            print(f"Successfully generated {output_path} with {len(rows)} fields.")
+            return True
     except Exception as e:
         print(f"Error generating form: {e}")
         import traceback
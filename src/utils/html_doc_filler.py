@@ -1,9 +1,51 @@
+import copy
 import os
+import re
 import sys
-from typing import Dict
-from bs4 import BeautifulSoup
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from bs4 import BeautifulSoup, NavigableString
+from bs4.formatter import HTMLFormatter
 from contextlib import contextmanager
 
+# Compiled fill plans, keyed by template content, most recently used last
+HTML_FILL_PLAN_CACHE_SIZE = 8
+
+CHECKED_VALUES = ['YES', 'TRUE', '1', 'CHECKED']
+MULTILINE_CHARS = ['\n', '\r', '•', '–', '▪']
+MULTILINE_KEYWORDS = [
+    'listing', 'note', 'comment', 'description', 'detail', 'remark',
+    'spec', 'requirements', 'instruction', 'observation', 'options'
+]
+
+# Checkbox and list styling added to the <head> of every filled form
+FILL_STYLE_CSS = """
+        .field.checkbox input[type="checkbox"] {
+            -webkit-appearance: checkbox;
+            appearance: checkbox;
+            width: 18px;
+            height: 18px;
+            border: 1px solid var(--border);
+            background: #fff;
+            accent-color: var(--accent);
+        }
+        .field.checkbox input[type="checkbox"]:checked {
+            background-color: var(--accent);
+        }
+        .formatted-list {
+            padding: 6px 0;
+        }
+        .formatted-list ul {
+            margin: 0;
+        }
+        .options-listing {
+            background: #fafbfc;
+            border-radius: 4px;
+            padding: 8px 12px;
+        }
+    """
+
 
 @contextmanager
 def suppress_stderr():
@@ -164,10 +206,165 @@ def format_options_listing(soup: BeautifulSoup, text_val: str) -> BeautifulSoup:
     return wrapper
 
 
+def _should_format_as_list(key: str, text_val: str, multiline_hint: Optional[bool] = None) -> bool:
+    """Whether a text field's value is rendered as a formatted list instead of the input/textarea."""
+    has_multiline_content = (
+        any(ch in text_val for ch in MULTILINE_CHARS) or
+        '- ' in text_val or
+        '* ' in text_val or
+        len(text_val.splitlines()) > 1
+    )
+    if multiline_hint is None:
+        key_lower = key.lower()
+        multiline_hint = any(term in key_lower for term in MULTILINE_KEYWORDS)
+    return bool((multiline_hint and text_val) or has_multiline_content)
+
+
+def _is_checked(value: Any) -> bool:
+    return bool(value and str(value).upper() in CHECKED_VALUES)
+
+
+def _append_fill_style(soup: BeautifulSoup) -> None:
+    """Adds the checkbox/list styling to the head unless the template already has it."""
+    style_tag = soup.new_tag('style')
+    style_tag.string = FILL_STYLE_CSS
+    if soup.head and not soup.head.find('style', string=lambda s: 'options-listing' in str(s)):
+        soup.head.append(style_tag)
+
+
+class FillSlot(NamedTuple):
+    """A data-dependent piece of the form: one checkbox, input or textarea."""
+    kind: str  # "checkbox", "input" or "textarea"
+    key: str
+    checked_html: str = ""  # checkbox markup when checked / unchecked
+    unchecked_html: str = ""
+    prefix: str = ""  # markup around the value of an input or textarea
+    suffix: str = ""
+    multiline_hint: bool = False
+
+
+_SLOT_MARKER = "\x00goa-slot-{}\x00"
+_SLOT_PATTERN = re.compile("\x00goa-slot-(\\d+)\x00")
+_VALUE_SENTINEL = "\x00goa-value\x00"
+_FORMATTER = HTMLFormatter.REGISTRY["minimal"]  # what str(soup) uses for html.parser documents
+
+
+class HtmlFillPlan:
+    """
+    An HTML form compiled for filling: static segments interleaved with typed slots.
+    
+    The template is parsed once; each field's input is replaced by a slot whose
+    markup variants are pre-serialized with BeautifulSoup's own formatter. Filling
+    is then a linear join whose output is byte-identical to mutating and
+    serializing the parsed tree.
+    """
+    
+    def __init__(self, html_content: str):
+        """
+        Compile the template.
+        
+        Args:
+            html_content: The HTML template content
+        """
+        soup = BeautifulSoup(html_content, 'html.parser')
+        self.slots: List[FillSlot] = []
+        
+        for label_element in soup.find_all('label', class_='field'):
+            placeholder = label_element.get('data-placeholder')
+            if not placeholder:
+                continue
+            key = placeholder.replace('{{', '').replace('}}', '').strip()
+            
+            if 'checkbox' in label_element.get('class', []):
+                input_elem = label_element.find('input', type='checkbox')
+                if input_elem:
+                    checked = copy.copy(input_elem)
+                    checked['checked'] = 'checked'
+                    unchecked = copy.copy(input_elem)
+                    unchecked.attrs.pop('checked', None)
+                    self._add_slot(input_elem, FillSlot(
+                        "checkbox", key, checked_html=str(checked), unchecked_html=str(unchecked)
+                    ))
+                continue
+            
+            target_element = label_element.find('input') or label_element.find('textarea')
+            if not target_element:
+                continue
+            blank = copy.copy(target_element)
+            if target_element.name == 'input':
+                blank['value'] = _VALUE_SENTINEL
+                prefix, suffix = str(blank).split(f'"{_VALUE_SENTINEL}"')
+            else:
+                blank.string = _VALUE_SENTINEL
+                prefix, suffix = str(blank).split(_VALUE_SENTINEL)
+            key_lower = key.lower()
+            self._add_slot(target_element, FillSlot(
+                target_element.name, key, prefix=prefix, suffix=suffix,
+                multiline_hint=any(term in key_lower for term in MULTILINE_KEYWORDS)
+            ))
+        
+        _append_fill_style(soup)
+        
+        # Alternating static text and slot numbers: [static, slot, static, slot, ..., static]
+        parts = _SLOT_PATTERN.split(str(soup))
+        self.head = parts[0]
+        self.body: List[Tuple[FillSlot, str]] = [
+            (self.slots[int(parts[i])], parts[i + 1]) for i in range(1, len(parts), 2)
+        ]
+    
+    def _add_slot(self, element, slot: FillSlot) -> None:
+        element.replace_with(NavigableString(_SLOT_MARKER.format(len(self.slots))))
+        self.slots.append(slot)
+    
+    @staticmethod
+    def render_slot(slot: FillSlot, data: Dict[str, str]) -> str:
+        """Markup of one slot for the given data."""
+        value = data.get(slot.key)
+        if slot.kind == "checkbox":
+            return slot.checked_html if _is_checked(value) else slot.unchecked_html
+        
+        text_val = str(value) if value is not None else ''
+        if _should_format_as_list(slot.key, text_val, slot.multiline_hint):
+            return str(format_options_listing(BeautifulSoup('', 'html.parser'), text_val))
+        if slot.kind == "input":
+            return slot.prefix + _FORMATTER.quoted_attribute_value(_FORMATTER.attribute_value(text_val)) + slot.suffix
+        return slot.prefix + _FORMATTER.substitute(text_val) + slot.suffix
+    
+    def render(self, data: Dict[str, str]) -> str:
+        """Fills the form with data."""
+        out = [self.head]
+        for slot, static in self.body:
+            out.append(self.render_slot(slot, data))
+            out.append(static)
+        return "".join(out)
+
+
+_FILL_PLANS: "OrderedDict[str, HtmlFillPlan]" = OrderedDict()
+_FILL_PLANS_LOCK = threading.Lock()
+
+
+def get_fill_plan(html_content: str) -> HtmlFillPlan:
+    """Returns the compiled fill plan of a template, compiling it on first use."""
+    with _FILL_PLANS_LOCK:
+        plan = _FILL_PLANS.get(html_content)
+        if plan is not None:
+            _FILL_PLANS.move_to_end(html_content)
+            return plan
+    plan = HtmlFillPlan(html_content)
+    with _FILL_PLANS_LOCK:
+        _FILL_PLANS[html_content] = plan
+        while len(_FILL_PLANS) > HTML_FILL_PLAN_CACHE_SIZE:
+            _FILL_PLANS.popitem(last=False)
+    return plan
+
+
 def fill_html_template(html_content: str, data: Dict[str, str]) -> str:
     """
     Populate placeholders in HTML template while preserving layout and formatting multiline text.
     
+    The template is compiled into a fill plan once (see HtmlFillPlan); later
+    fills of the same template do not parse it again.
+    
     Args:
         html_content: The HTML template content
         data: Dictionary mapping placeholder keys to values
@@ -175,6 +372,16 @@ def fill_html_template(html_content: str, data: Dict[str, str]) -> str:
     Returns:
         Filled HTML content as string
     """
+    try:
+        plan = get_fill_plan(html_content)
+    except Exception as e:
+        print(f"Error compiling HTML fill plan, filling the parsed template instead: {e}")
+        return _fill_html_template_with_soup(html_content, data)
+    return plan.render(data)
+
+
+def _fill_html_template_with_soup(html_content: str, data: Dict[str, str]) -> str:
+    """Fills the template by mutating and serializing the parsed tree; the reference for HtmlFillPlan."""
     soup = BeautifulSoup(html_content, 'html.parser')
 
     # Find all field containers, which are the labels with class 'field'
@@ -191,7 +398,7 @@ def fill_html_template(html_content: str, data: Dict[str, str]) -> str:
         if 'checkbox' in label_element.get('class', []):
             input_elem = label_element.find('input', type='checkbox')
             if input_elem:
-                if value and str(value).upper() in ['YES', 'TRUE', '1', 'CHECKED']:
+                if _is_checked(value):
                     input_elem['checked'] = 'checked'
                 else:
                     input_elem.attrs.pop('checked', None)
@@ -203,25 +410,7 @@ def fill_html_template(html_content: str, data: Dict[str, str]) -> str:
         if not target_element:
             continue
 
-        # Determine if content is multiline
-        multiline_chars = ['\n', '\r', '•', '–', '▪']
-        has_multiline_content = (
-            any(ch in text_val for ch in multiline_chars) or
-            '- ' in text_val or
-            '* ' in text_val or
-            len(text_val.splitlines()) > 1
-        )
-        
-        key_lower = key.lower()
-        multiline_keywords = [
-            'listing', 'note', 'comment', 'description', 'detail', 'remark',
-            'spec', 'requirements', 'instruction', 'observation', 'options'
-        ]
-        multiline_hint = any(term in key_lower for term in multiline_keywords)
-        
-        should_format_as_list = (multiline_hint and text_val) or has_multiline_content
-
-        if should_format_as_list:
+        if _should_format_as_list(key, text_val):
             formatted_element = format_options_listing(soup, text_val)
             # The placeholder is on the label, so the formatted element doesn't need it.
             # We are replacing the input/textarea inside the label.
@@ -232,34 +421,7 @@ def fill_html_template(html_content: str, data: Dict[str, str]) -> str:
             target_element.string = text_val
 
     # Add consistent checkbox and list styling
-    style_tag = soup.new_tag('style')
-    style_tag.string = """
-        .field.checkbox input[type="checkbox"] {
-            -webkit-appearance: checkbox;
-            appearance: checkbox;
-            width: 18px;
-            height: 18px;
-            border: 1px solid var(--border);
-            background: #fff;
-            accent-color: var(--accent);
-        }
-        .field.checkbox input[type="checkbox"]:checked {
-            background-color: var(--accent);
-        }
-        .formatted-list {
-            padding: 6px 0;
-        }
-        .formatted-list ul {
-            margin: 0;
-        }
-        .options-listing {
-            background: #fafbfc;
-            border-radius: 4px;
-            padding: 8px 12px;
-        }
-    """
-    if soup.head and not soup.head.find('style', string=lambda s: 'options-listing' in str(s)):
-        soup.head.append(style_tag)
+    _append_fill_style(soup)
 
     return str(soup)
 
@@ -2,15 +2,22 @@ import re
 import os
 import google.generativeai as genai
 from dotenv import load_dotenv
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Literal
 import json
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import traceback # For more detailed error logging
  
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.output_parsers import PydanticOutputParser
+from src.utils.llm_hedging import HedgingPolicy, hedged_call
+from src.utils.template_utils import add_section_aware_instructions, select_sortstar_basic_system
 from src.utils.few_shot_learning import (
     determine_machine_type,
-    save_successful_extraction_as_example,
+    save_successful_extractions_as_examples,
     record_user_feedback_on_extraction,
     enhance_prompt_with_few_shot_examples,
 )
@@ -38,6 +45,35 @@ from pydantic import BaseModel, Field, create_model
 # Global variable for the model, initialized once
 GENERATIVE_MODEL = None
 
+# Structured output mode: the response schema is passed natively to the model API
+# instead of embedding textual format instructions and parsing free text.
+# Set GOA_STRUCTURED_OUTPUT=0 to go back to the text-based protocol.
+STRUCTURED_OUTPUT_ENABLED = os.getenv("GOA_STRUCTURED_OUTPUT", "1").lower() in ("1", "true", "yes")
+
+# Sparse output protocol: the model returns only "YES" checkboxes and non-empty text
+# fields; every omitted key keeps its local default ("NO" / ""). Output tokens then
+# scale with the number of selected options instead of the size of the template.
+# Set GOA_SPARSE_OUTPUT=0 to require every key in the response again.
+SPARSE_OUTPUT_ENABLED = os.getenv("GOA_SPARSE_OUTPUT", "1").lower() in ("1", "true", "yes")
+SPARSE_OUTPUT_INSTRUCTION = (
+    "Respond with a single, valid JSON object containing ONLY the checkbox keys whose value is \"YES\" "
+    "and the text field keys for which you found a value. OMIT every checkbox that would be \"NO\" and "
+    "every text field that would be empty; omitted keys automatically default to \"NO\" / \"\"."
+)
+
+# Chat corrections: send only the fields relevant to the instruction and ask the
+# model for a patch of changed keys instead of the whole data dictionary.
+CHAT_PATCH_MODE_ENABLED = os.getenv("GOA_CHAT_PATCH_MODE", "1").lower() in ("1", "true", "yes")
+CHAT_PATCH_MAX_FIELDS = 25
+CHAT_PATCH_PDF_EXCERPT_CHARS = 4000
+
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
 def check_model_usage():
     """
     Sends a minimal test request to check which model is actually being used.
@@ -125,6 +161,68 @@ def _zero_evidence_check(field_data: Dict[str, str], template_schema: Dict[str,
                 
     return verified_data
 
+def _is_checkbox_field(key: str, context: Any) -> bool:
+    """Returns True if the placeholder is a YES/NO checkbox (schema type boolean or '_check' suffix)."""
+    if isinstance(context, dict) and context.get("type") == "boolean":
+        return True
+    return key.endswith("_check")
+
+def build_response_schema(template_placeholder_contexts: Dict[str, Any], sparse: bool = False) -> Dict[str, Any]:
+    """
+    Builds a native response schema for the Gemini API from the template fields.
+    
+    Checkbox fields are constrained to the "YES"/"NO" enum, text fields are plain strings.
+    
+    Args:
+        template_placeholder_contexts: Placeholder contexts (string or schema format)
+        sparse: If True, no key is required so the model can omit "NO"/empty fields
+        
+    Returns:
+        A response_schema mapping usable in a generation_config
+    """
+    properties = {}
+    for key, context in template_placeholder_contexts.items():
+        if _is_checkbox_field(key, context):
+            properties[key] = {"type": "string", "enum": ["YES", "NO"]}
+        else:
+            properties[key] = {"type": "string"}
+    schema = {"type": "object", "properties": properties}
+    if not sparse:
+        schema["required"] = list(properties.keys())
+    return schema
+
+def _generate_json_content(prompt: str, template_placeholder_contexts: Dict[str, Any], text_mode_suffix: str = "",
+                           sparse: bool = False) -> str:
+    """
+    Sends a prompt to GENERATIVE_MODEL and returns the JSON response text.
+    
+    In structured output mode the response schema is passed natively, so the model
+    returns typed JSON without format instructions. If that request fails (e.g. the
+    schema is rejected), the call is retried once in text mode with text_mode_suffix
+    (example JSON, format instructions) appended to the prompt.
+    """
+    if STRUCTURED_OUTPUT_ENABLED:
+        try:
+            response = GENERATIVE_MODEL.generate_content(
+                prompt,
+                safety_settings=SAFETY_SETTINGS,
+                generation_config={
+                    "response_mime_type": "application/json",
+                    "response_schema": build_response_schema(template_placeholder_contexts, sparse=sparse),
+                },
+            )
+            return response.text.strip()
+        except Exception as e:
+            print(f"Structured output request failed, falling back to text mode: {e}")
+
+    response = GENERATIVE_MODEL.generate_content(prompt + text_mode_suffix, safety_settings=SAFETY_SETTINGS)
+    cleaned_response_text = response.text.strip()
+    if cleaned_response_text.startswith("```json"):
+        cleaned_response_text = cleaned_response_text[7:]
+        if cleaned_response_text.endswith("```"):
+            cleaned_response_text = cleaned_response_text[:-3]
+    return cleaned_response_text.strip()
+
 def apply_post_processing_rules(field_data: Dict[str, str], template_schema: Dict[str, Dict]) -> Dict[str, str]:
     """
     Applies domain-specific rules to correct and improve LLM-generated field values.
@@ -533,8 +631,11 @@ def get_all_fields_via_llm(selected_pdf_descriptions: List[str],
     prompt_parts.append("Pay attention to bundled features within SELECTED PDF ITEMS. For example, if 'Monoblock Model ABC' description says 'Including: Feature X, Feature Y', then template fields for Feature X and Feature Y (if they are _check fields) should be YES.")
     prompt_parts.append("If a PDF item is general (e.g., 'Three (X 3) colours status beacon light') and the template has specific sub-features (e.g., 'Status Beacon Light: Red', 'Status Beacon Light: Yellow', 'Status Beacon Light: Green'), mark ALL corresponding specific sub-feature placeholders as YES.")
     prompt_parts.append("Be accurate and conservative. For checkboxes, if unsure, default to \"NO\". If an entire category of options (e.g., 'Street Fighter Tablet Counter') is NOT MENTIONED AT ALL in the PDF text or selected items, all its related checkboxes should be \"NO\".")
-    prompt_parts.append("For text fields, if not found, use an empty string.")
-    prompt_parts.append("Respond with a single, valid JSON object. The keys in the JSON MUST be ALL the TEMPLATE PLACEHOLDER KEYS listed above, and the values must be their extracted text or \"YES\"/\"NO\".")
+    if SPARSE_OUTPUT_ENABLED:
+        prompt_parts.append(SPARSE_OUTPUT_INSTRUCTION)
+    else:
+        prompt_parts.append("For text fields, if not found, use an empty string.")
+        prompt_parts.append("Respond with a single, valid JSON object. The keys in the JSON MUST be ALL the TEMPLATE PLACEHOLDER KEYS listed above, and the values must be their extracted text or \"YES\"/\"NO\".")
     
     # Add context about General Order Acknowledgement structure to help with understanding
     prompt_parts.append("\nADDITIONAL CONTEXT ABOUT THE GENERAL ORDER ACKNOWLEDGEMENT (GOA) FORM:")
@@ -546,9 +647,12 @@ def get_all_fields_via_llm(selected_pdf_descriptions: List[str],
     prompt_parts.append("5. Different sections cover specific functional modules (Filling System, Capping, Labeling, etc.).")
     prompt_parts.append("Pay close attention to the hierarchical structure of fields when determining YES/NO values for checkboxes.")
     
-    # Add example JSON response format
-    prompt_parts.append("\nEXAMPLE JSON RESPONSE FORMAT:")
-    prompt_parts.append("""```json
+    prompt = "\n".join(prompt_parts)
+    
+    # The example JSON block is only needed when the schema is not passed natively
+    text_mode_suffix = "\n".join([
+        "\nEXAMPLE JSON RESPONSE FORMAT:",
+        """```json
 {
   "machine_model": "LabelStar Model System 1", 
   "production_speed": "60 units per minute",
@@ -557,11 +661,9 @@ def get_all_fields_via_llm(selected_pdf_descriptions: List[str],
   "customer_name": "ACME Corp",
   ... (other fields)
 }
-```""")
-    
-    prompt_parts.append("\nYour JSON Response:")
-    
-    prompt = "\n".join(prompt_parts)
+```""",
+        "\nYour JSON Response:",
+    ])
     
     # print("\n----- LLM PROMPT (get_all_fields_via_llm) -----") 
     # print(prompt)
@@ -572,27 +674,16 @@ def get_all_fields_via_llm(selected_pdf_descriptions: List[str],
 
     try:
         print("Sending comprehensive prompt to Gemini API...")
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-        response = GENERATIVE_MODEL.generate_content(prompt, safety_settings=safety_settings)
-        
-        cleaned_response_text = response.text.strip()
-        if cleaned_response_text.startswith("```json"):
-            cleaned_response_text = cleaned_response_text[7:]
-            if cleaned_response_text.endswith("```"):
-                cleaned_response_text = cleaned_response_text[:-3]
-        cleaned_response_text = cleaned_response_text.strip()
+        cleaned_response_text = _generate_json_content(prompt, template_placeholder_contexts, text_mode_suffix,
+                                                       sparse=SPARSE_OUTPUT_ENABLED)
         
         try:
             parsed_llm_output = json.loads(cleaned_response_text)
             if isinstance(parsed_llm_output, dict):
                 # Validate the response if using schema format
                 if using_schema_format:
-                    validation_errors = validate_llm_response(parsed_llm_output, template_placeholder_contexts)
+                    validation_errors = validate_llm_response(parsed_llm_output, template_placeholder_contexts,
+                                                              allow_missing=SPARSE_OUTPUT_ENABLED)
                     if validation_errors:
                         print("Validation errors found in LLM response:")
                         for field, errors in validation_errors.items():
@@ -623,9 +714,217 @@ def get_all_fields_via_llm(selected_pdf_descriptions: List[str],
         traceback.print_exc()
     
     # Apply post-processing rules to improve the data
-    corrected_data = apply_post_processing_rules(llm_response_data, template_placeholder_contexts)
+    corrected_data = apply_post_processing_rules(llm_response_data, template_placeholder_contexts, full_pdf_text, selected_pdf_descriptions)
     return corrected_data
 
+_INSTRUCTION_STOPWORDS = {
+    'the', 'and', 'is', 'of', 'in', 'to', 'a', 'an', 'for', 'with', 'on', 'it', 'be', 'as', 'at', 'by',
+    'set', 'change', 'make', 'turn', 'should', 'actually', 'please', 'field', 'value', 'not', 'off', 'are',
+    'yes', 'no', 'from', 'this', 'that', 'instead', 'also', 'update', 'correct'
+}
+
+def _instruction_terms(text: str) -> List[str]:
+    """Lowercase content words of a user instruction, without stopwords."""
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1 and t not in _INSTRUCTION_STOPWORDS]
+
+def _field_search_text(key: str, context: Any) -> str:
+    """Searchable text for a field: key words, description, section and synonyms."""
+    parts = [key.replace("_", " ")]
+    if isinstance(context, dict):
+        parts.extend([context.get("description", ""), context.get("section", ""), context.get("subsection", "")])
+        parts.extend(context.get("synonyms", [])[:5])
+    else:
+        parts.append(str(context))
+    return " ".join(parts).lower()
+
+def select_relevant_fields(user_instruction: str,
+                           template_placeholder_contexts: Dict[str, Any],
+                           max_fields: int = CHAT_PATCH_MAX_FIELDS) -> List[str]:
+    """
+    Picks the template fields a chat instruction most likely refers to.
+    
+    A placeholder key quoted in the instruction always wins; otherwise fields are
+    scored by how many instruction words appear in their key, description, section
+    and synonyms (prefix matches count, so "labeler" finds "labeling").
+    
+    Args:
+        user_instruction: The user's correction instruction
+        template_placeholder_contexts: Placeholder contexts (string or schema format)
+        max_fields: Maximum number of fields returned
+        
+    Returns:
+        Field keys ordered by relevance (empty if nothing matches)
+    """
+    instruction_lower = user_instruction.lower()
+    terms = _instruction_terms(user_instruction)
+    scored = []
+    for order, (key, context) in enumerate(template_placeholder_contexts.items()):
+        score = 100 if key.lower() in instruction_lower else 0
+        field_words = set(re.findall(r"[a-z0-9]+", _field_search_text(key, context)))
+        for term in terms:
+            if term in field_words:
+                score += 2
+            elif len(term) >= 4 and any(word.startswith(term[:4]) for word in field_words if len(word) >= 4):
+                score += 1
+        if score > 0:
+            scored.append((-score, order, key))
+    scored.sort()
+    return [key for _, _, key in scored[:max_fields]]
+
+def _relevant_pdf_excerpt(full_pdf_text: str, terms: List[str], max_chars: int = CHAT_PATCH_PDF_EXCERPT_CHARS) -> str:
+    """Returns the start of the document plus the lines mentioning any of the terms, up to max_chars."""
+    if len(full_pdf_text) <= max_chars:
+        return full_pdf_text
+    header = full_pdf_text[:max_chars // 4]
+    excerpt_lines = []
+    total_chars = len(header)
+    for line in full_pdf_text[max_chars // 4:].splitlines():
+        line_lower = line.lower()
+        if line.strip() and any(term in line_lower for term in terms):
+            if total_chars + len(line) + 1 > max_chars:
+                break
+            excerpt_lines.append(line)
+            total_chars += len(line) + 1
+    return header + ("\n...\n" + "\n".join(excerpt_lines) if excerpt_lines else "\n... (text truncated)")
+
+def apply_field_patch(current_data: Dict[str, str],
+                      patch: Dict[str, Any],
+                      template_placeholder_contexts: Dict[str, Any]) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Applies a patch of field values returned by the LLM to the current data.
+    
+    Unknown keys and invalid checkbox values are ignored.
+    
+    Args:
+        current_data: Current field values
+        patch: Changed fields (key -> new value)
+        template_placeholder_contexts: Placeholder contexts used to identify checkboxes
+        
+    Returns:
+        Tuple of (updated data copy, list of keys whose value actually changed)
+    """
+    updated_data = current_data.copy()
+    changed_keys = []
+    for key, value in patch.items():
+        if key not in updated_data and key not in template_placeholder_contexts:
+            print(f"Warning: Ignoring patch for unknown key '{key}'.")
+            continue
+        if _is_checkbox_field(key, template_placeholder_contexts.get(key)):
+            if not isinstance(value, str) or value.upper() not in ["YES", "NO"]:
+                print(f"Warning: LLM provided invalid value '{value}' for key '{key}'. Keeping previous: '{updated_data.get(key)}'.")
+                continue
+            new_value = value.upper()
+        else:
+            new_value = "" if value is None else str(value)
+        if updated_data.get(key) != new_value:
+            updated_data[key] = new_value
+            changed_keys.append(key)
+    return updated_data, changed_keys
+
+# Field families that post-processing rules check together (one HMI size, one PLC type,
+# beacon colors, filling system/type); a patch to one member re-checks the whole family
+POST_PROCESSING_FIELD_GROUPS = [
+    lambda key: '_hmi_' in key and 'size' in key,
+    lambda key: ('hmi' in key or 'touch' in key or 'screen' in key) and any(s in key for s in ['15', '10', '5.7', '5_7']),
+    lambda key: 'plc_' in key,
+    lambda key: any(term in key for term in ['beacon', 'light', 'signal']),
+    lambda key: 'filling_system' in key or any(typ in key for typ in ['volumetric', 'peristaltic', 'time_pressure', 'mass_flow']),
+]
+
+def post_processing_scope(changed_keys: List[str], field_keys: List[str]) -> List[str]:
+    """
+    Returns the fields post-processing must see after a patch: the changed keys plus
+    the members of every rule family one of them belongs to.
+    
+    Args:
+        changed_keys: Keys whose value the patch changed
+        field_keys: All keys of the filled data
+        
+    Returns:
+        Keys in field_keys order
+    """
+    groups = [group for group in POST_PROCESSING_FIELD_GROUPS
+              if any(group(key.lower()) for key in changed_keys)]
+    changed = set(changed_keys)
+    return [key for key in field_keys
+            if key in changed or any(group(key.lower()) for group in groups)]
+
+def get_llm_chat_patch(current_data: Dict[str, str],
+                       user_instruction: str,
+                       selected_pdf_descriptions: List[str],
+                       template_placeholder_contexts: Dict[str, Any],
+                       full_pdf_text: str) -> Optional[Dict[str, str]]:
+    """
+    Asks the LLM for a patch containing only the fields changed by a chat instruction.
+    
+    Only the fields relevant to the instruction (see select_relevant_fields) and a
+    matching PDF excerpt are sent, so the call costs about as much as a short completion.
+    
+    Args:
+        current_data: Current field values
+        user_instruction: The user's correction instruction
+        selected_pdf_descriptions: Descriptions of selected PDF items
+        template_placeholder_contexts: Placeholder contexts (string or schema format)
+        full_pdf_text: The full text of the PDF document
+        
+    Returns:
+        Dictionary of changed fields (possibly empty), or None if no field matched the
+        instruction and the caller should fall back to a full update
+    """
+    global GENERATIVE_MODEL
+    if GENERATIVE_MODEL is None:
+        if not configure_gemini_client():
+            print("LLM client not configured for chat patch. Returning empty patch.")
+            return {}
+
+    relevant_keys = select_relevant_fields(user_instruction, template_placeholder_contexts)
+    if not relevant_keys:
+        print("No template fields matched the instruction; patch mode not applicable.")
+        return None
+    relevant_contexts = {key: template_placeholder_contexts[key] for key in relevant_keys}
+
+    prompt_parts = [
+        "You are an AI assistant helping to correct a technical equipment order template that was previously filled.",
+        "The user will provide an instruction to change one or more field values.",
+        "\nUSER'S CORRECTION INSTRUCTION:",
+        f">>> {user_instruction}",
+        "\nCANDIDATE FIELDS (Placeholder Key (Type): Description = current value):",
+    ]
+    for key, context in relevant_contexts.items():
+        field_type = "Checkbox (YES/NO)" if _is_checkbox_field(key, context) else "Text Field"
+        description = context.get("description", key) if isinstance(context, dict) else context
+        prompt_parts.append(f"  - '{key}' ({field_type}): '{description}' = {json.dumps(current_data.get(key, ''))}")
+
+    prompt_parts.append("\nSELECTED PDF ITEMS (for reference):")
+    if not selected_pdf_descriptions:
+        prompt_parts.append("  (No specific items were identified as selected from tables.)")
+    else:
+        for i, desc in enumerate(selected_pdf_descriptions):
+            prompt_parts.append(f"  - PDF Item {i+1}: {desc}")
+    prompt_parts.append("\nPDF TEXT EXCERPT (use it if the user implies a value from the document):")
+    prompt_parts.append(_relevant_pdf_excerpt(full_pdf_text, _instruction_terms(user_instruction)))
+
+    prompt_parts.append("\nYOUR TASK:")
+    prompt_parts.append("Respond with a single, valid JSON object containing ONLY the CANDIDATE FIELDS whose value must change, mapped to their new value.")
+    prompt_parts.append("For checkbox keys the value MUST be \"YES\" or \"NO\". Do NOT include unchanged fields. Do NOT add keys that are not listed.")
+    prompt = "\n".join(prompt_parts)
+
+    try:
+        print(f"Sending chat patch prompt to Gemini API ({len(relevant_keys)} candidate fields)...")
+        cleaned_response_text = _generate_json_content(prompt, relevant_contexts, "\nJSON Patch:", sparse=True)
+        parsed_patch = json.loads(cleaned_response_text)
+        if not isinstance(parsed_patch, dict):
+            print(f"Warning: LLM chat patch response was not a JSON dictionary: {parsed_patch}")
+            return {}
+        return {key: value for key, value in parsed_patch.items() if key in relevant_contexts}
+    except json.JSONDecodeError as e:
+        print(f"Error decoding LLM chat patch JSON response: {e}")
+        return {}
+    except Exception as e:
+        print(f"Error in get_llm_chat_patch: {e}")
+        traceback.print_exc()
+        return {}
+
 def get_llm_chat_update(current_data: Dict[str, str], 
                         user_instruction: str, 
                         selected_pdf_descriptions: List[str], 
@@ -634,6 +933,10 @@ def get_llm_chat_update(current_data: Dict[str, str],
     """
     Takes current data, user instruction, and original contexts, then asks LLM for an updated data dictionary
     covering ALL fields (text and checkboxes).
+    
+    In patch mode (GOA_CHAT_PATCH_MODE) only the fields relevant to the instruction are sent
+    and the LLM returns the changed keys, which are applied locally. The full-dictionary
+    protocol is used when no field matches the instruction.
     """
     global GENERATIVE_MODEL
     if GENERATIVE_MODEL is None:
@@ -641,6 +944,22 @@ def get_llm_chat_update(current_data: Dict[str, str],
             print("LLM client not configured for chat update. Returning current data.")
             return current_data 
 
+    if CHAT_PATCH_MODE_ENABLED:
+        patch = get_llm_chat_patch(current_data, user_instruction, selected_pdf_descriptions,
+                                   template_placeholder_contexts, full_pdf_text)
+        if patch is not None:
+            updated_data, changed_keys = apply_field_patch(current_data, patch, template_placeholder_contexts)
+            print(f"Chat patch changed {len(changed_keys)} field(s): {changed_keys}")
+            # Re-check only the patched fields (and their rule families); the rest was
+            # already post-processed when it was filled
+            scope = post_processing_scope(changed_keys, list(updated_data))
+            if scope:
+                updated_data.update(apply_post_processing_rules(
+                    {key: updated_data[key] for key in scope},
+                    template_placeholder_contexts, full_pdf_text, selected_pdf_descriptions
+                ))
+            return updated_data
+
     prompt_parts = [
         "You are an AI assistant helping to correct a technical equipment order template that was previously filled (partially or fully).",
         "The user will provide an instruction to change one or more field values.",
@@ -733,7 +1052,7 @@ def get_llm_chat_update(current_data: Dict[str, str],
         traceback.print_exc()
     
     # Apply post-processing rules to improve the data
-    corrected_data = apply_post_processing_rules(updated_data, template_placeholder_contexts)
+    corrected_data = apply_post_processing_rules(updated_data, template_placeholder_contexts, full_pdf_text, selected_pdf_descriptions)
     
     return corrected_data
 
@@ -1043,13 +1362,15 @@ def map_crm_to_document_via_llm(crm_client_data: Dict[str, Any],
     print(f"Prepared data for {document_type_hint}:", json.dumps(output_data_for_document, indent=2))
     return output_data_for_document
 
-def validate_llm_response(response_data: Dict[str, Any], expected_schema: Dict[str, Dict]) -> Dict[str, List[str]]:
+def validate_llm_response(response_data: Dict[str, Any], expected_schema: Dict[str, Dict],
+                          allow_missing: bool = False) -> Dict[str, List[str]]:
     """
     Validates the LLM response against the expected schema.
     
     Args:
         response_data: The LLM response data
         expected_schema: The template schema
+        allow_missing: If True (sparse output protocol), omitted fields are not errors
         
     Returns:
         A dictionary of errors by field, empty if all valid
@@ -1059,6 +1380,8 @@ def validate_llm_response(response_data: Dict[str, Any], expected_schema: Dict[s
     # Check for missing fields
     for key, schema in expected_schema.items():
         if key not in response_data:
+            if allow_missing:
+                continue
             if key not in errors:
                 errors[key] = []
             errors[key].append("Missing field")
@@ -1088,6 +1411,9 @@ def validate_llm_response(response_data: Dict[str, Any], expected_schema: Dict[s
     return errors
 
 
+# Set GOA_FEW_SHOT_PERSIST_ASYNC=1 to save automatic examples off the request thread
+FEW_SHOT_PERSIST_IN_BACKGROUND = os.getenv("GOA_FEW_SHOT_PERSIST_ASYNC", "0").lower() in ("1", "true", "yes")
+
 def _persist_machine_few_shot_examples(
     machine_data: Dict[str, Any],
     common_items: List[Dict[str, Any]],
@@ -1103,7 +1429,7 @@ def _persist_machine_few_shot_examples(
     
     template_type = "sortstar" if "sortstar" in machine_type else "default"
     machine_name = machine_data.get("machine_name", "machine")
-    saved_count = 0
+    values_to_store = {}
     
     manager = None
     if ENHANCED_FEW_SHOT_AVAILABLE and "get_few_shot_manager" in globals():
@@ -1130,47 +1456,287 @@ def _persist_machine_few_shot_examples(
                 continue
             value_to_store = value
         
-        success = save_successful_extraction_as_example(
-            field_name=field_name,
-            field_value=value_to_store,
-            machine_data=machine_data,
-            common_items=common_items,
-            full_pdf_text=full_pdf_text,
-            machine_type=machine_type,
-            template_type=template_type,
-            confidence_score=0.75,
-        )
+        values_to_store[field_name] = value_to_store
+    
+    # One connection and one transaction for all fields; duplicates are skipped
+    saved_fields = save_successful_extractions_as_examples(
+        field_values=values_to_store,
+        machine_data=machine_data,
+        common_items=common_items,
+        full_pdf_text=full_pdf_text,
+        machine_type=machine_type,
+        template_type=template_type,
+        confidence_score=0.75,
+    )
+    if saved_fields:
+        print(f"Saved {len(saved_fields)} automatic few-shot example(s) for {machine_name}.")
+    
+    # Append the new examples to the semantic index in one batch (no rebuild);
+    # duplicates that were not inserted cause no index work
+    if manager and saved_fields:
+        try:
+            indexed = manager.index_new_examples(machine_type, template_type, saved_fields)
+            print(f"Indexed {indexed} new few-shot example(s) incrementally.")
+        except Exception as cache_error:
+            print(f"Unable to update semantic index for {machine_name}: {cache_error}")
+
+# --- Field grouping for the Divide and Conquer strategy ---
+# Groups are computed from the schema instead of a hand-coded prefix map so that
+# every parallel group call carries roughly the same prompt/output token load.
+CHARS_PER_TOKEN = 4
+# Rough Gemini Flash Lite throughput figures used to turn token counts into seconds
+LLM_BASE_LATENCY_SECONDS = 1.5
+LLM_PROMPT_TOKENS_PER_SECOND = 8000.0
+LLM_OUTPUT_TOKENS_PER_SECOND = 150.0
+# Shared context sent with every group (PDF text is capped at 20,000 chars)
+DEFAULT_SHARED_PROMPT_TOKENS = 20000 // CHARS_PER_TOKEN
+GROUP_TARGET_LATENCY_SECONDS = float(os.getenv("GOA_GROUP_TARGET_LATENCY_SECONDS", "15"))
+MAX_EXTRACTION_GROUPS = 8
+# Shared context is rounded up to this many tokens so documents of similar length
+# reuse the same partition instead of keying the cache on the exact PDF length
+SHARED_PROMPT_TOKEN_BUCKET = 2500
+PARTITION_CACHE_SIZE = 16
+
+# Small LRU of partitions keyed by schema hash, target latency, max groups and the
+# bucketed shared context size
+_PARTITION_CACHE: "OrderedDict[str, Dict[str, Dict[str, Any]]]" = OrderedDict()
+_PARTITION_CACHE_LOCK = threading.Lock()
+
+
+def _field_section(key: str, context: Any) -> str:
+    """Returns the template section a field belongs to, used to keep related fields together."""
+    if isinstance(context, dict):
+        return context.get("section") or "General"
+    if isinstance(context, str) and " - " in context:
+        return context.split(" - ")[0].strip() or "General"
+    return "General"
+
+
+def estimate_field_tokens(key: str, context: Any) -> Tuple[int, int]:
+    """
+    Estimates the prompt and output tokens a single field adds to a group call.
+    
+    Args:
+        key: Placeholder key
+        context: Field context (schema dict or description string)
         
-        if success:
-            saved_count += 1
-            if manager:
-                try:
-                    manager.invalidate_cache(machine_type, template_type, field_name)
-                except Exception as cache_error:
-                    print(f"Unable to refresh semantic cache for {field_name}: {cache_error}")
-    
-    if saved_count:
-        print(f"Saved {saved_count} automatic few-shot example(s) for {machine_name}.")
-
-# Field groups for Divide and Conquer strategy
-FIELD_GROUPS = {
-    "General & Utility": {
-        "prefixes": ["ce_", "conformity_", "wi_", "sk_", "stpc_", "pt_", "vd_", "wrts_", "op_"],
-        "exact": ["machine", "customer", "quote", "production_speed", "options_listing", "voltage", "hz", "amps", "psi", "cfm", "phases", "country"]
-    },
-    "Controls & Electrical": {
-        "prefixes": ["plc_", "hmi_", "cps_", "cpp_", "blt_", "batch_", "etr_", "rts_", "lan_", "ci_", "eg_", "el_"],
-        "exact": []
-    },
-    "Liquid Filling & Handling": {
-        "prefixes": ["lf_", "gp_", "tb_", "sf_", "c_", "d_"],
-        "exact": []
-    },
-    "Capping, Labeling & Other": {
-        "prefixes": ["cs_", "bs_", "ps_", "ls_", "rj_", "plug_", "cap_", "bot_"],
-        "exact": []
-    }
-}
+    Returns:
+        Tuple of (prompt_tokens, output_tokens)
+    """
+    if isinstance(context, dict):
+        description = context.get("description", key)
+        hints = context.get("synonyms", [])[:5] + context.get("positive_indicators", [])[:3]
+        prompt_chars = len(key) + len(description) + sum(len(h) + 2 for h in hints) + 40
+    else:
+        prompt_chars = len(key) + len(str(context)) + 40
+    
+    is_checkbox = key.endswith("_check") or (isinstance(context, dict) and context.get("type") == "boolean")
+    # Every key is echoed back as "key": "value", checkboxes with a short YES/NO
+    output_chars = len(key) + (8 if is_checkbox else 40)
+    if SPARSE_OUTPUT_ENABLED:
+        # Only positive checkboxes (roughly 1 in 10) and found text fields come back
+        output_chars = output_chars // 10 if is_checkbox else output_chars // 2
+    
+    return max(1, prompt_chars // CHARS_PER_TOKEN), max(1, output_chars // CHARS_PER_TOKEN)
+
+
+def estimate_group_latency(prompt_tokens: int, output_tokens: int,
+                           shared_prompt_tokens: int = DEFAULT_SHARED_PROMPT_TOKENS) -> float:
+    """Estimates the wall-clock seconds of one group call from its token counts."""
+    return (LLM_BASE_LATENCY_SECONDS
+            + (prompt_tokens + shared_prompt_tokens) / LLM_PROMPT_TOKENS_PER_SECOND
+            + output_tokens / LLM_OUTPUT_TOKENS_PER_SECOND)
+
+
+def _schema_hash(template_placeholder_contexts: Dict[str, Any]) -> str:
+    """Stable hash of a template schema, used as the partition cache key."""
+    payload = json.dumps(template_placeholder_contexts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def partition_fields_into_groups(template_placeholder_contexts: Dict[str, Any],
+                                 target_latency_seconds: Optional[float] = None,
+                                 shared_prompt_tokens: int = DEFAULT_SHARED_PROMPT_TOKENS,
+                                 max_groups: int = MAX_EXTRACTION_GROUPS) -> Dict[str, Dict[str, Any]]:
+    """
+    Partitions template fields into token-balanced groups for parallel extraction.
+    
+    The number of groups is the smallest one whose estimated per-call latency stays
+    under the target. Sections are kept whole where possible; a section larger than
+    one group's budget is split into contiguous chunks. Chunks are then assigned
+    largest-first to the least loaded group so all calls finish at about the same time.
+    
+    Args:
+        template_placeholder_contexts: Field contexts (Dict[str, str] or Dict[str, Dict])
+        target_latency_seconds: Desired latency per group call
+        shared_prompt_tokens: Tokens of context sent with every group (PDF text, instructions),
+            rounded up to SHARED_PROMPT_TOKEN_BUCKET
+        max_groups: Upper bound on the number of parallel calls
+        
+    Returns:
+        Ordered dict of group name -> {field key: context}
+    """
+    if not template_placeholder_contexts:
+        return {}
+    
+    target = target_latency_seconds or GROUP_TARGET_LATENCY_SECONDS
+    shared_prompt_tokens = math.ceil(max(0, shared_prompt_tokens) / SHARED_PROMPT_TOKEN_BUCKET) * SHARED_PROMPT_TOKEN_BUCKET
+    cache_key = f"{_schema_hash(template_placeholder_contexts)}:{target}:{max_groups}:{shared_prompt_tokens}"
+    with _PARTITION_CACHE_LOCK:
+        if cache_key in _PARTITION_CACHE:
+            _PARTITION_CACHE.move_to_end(cache_key)
+            return _PARTITION_CACHE[cache_key]
+    
+    # 1. Cost every field in seconds of model time, bucketed by section in schema order
+    field_order = {key: index for index, key in enumerate(template_placeholder_contexts)}
+    sections: Dict[str, List[Tuple[str, float]]] = {}
+    for key, context in template_placeholder_contexts.items():
+        prompt_tokens, output_tokens = estimate_field_tokens(key, context)
+        cost = prompt_tokens / LLM_PROMPT_TOKENS_PER_SECOND + output_tokens / LLM_OUTPUT_TOKENS_PER_SECOND
+        sections.setdefault(_field_section(key, context), []).append((key, cost))
+    
+    total_cost = sum(cost for fields in sections.values() for _, cost in fields)
+    
+    # 2. Pick the smallest N that keeps each call under the target latency
+    fixed_cost = estimate_group_latency(0, 0, shared_prompt_tokens)
+    if target > fixed_cost:
+        num_groups = math.ceil(total_cost / (target - fixed_cost))
+    else:
+        num_groups = max_groups
+    num_groups = max(1, min(num_groups, max_groups, len(template_placeholder_contexts)))
+    capacity = total_cost / num_groups
+    
+    # 3. Split oversized sections into contiguous chunks that fit one group
+    chunks: List[Tuple[str, List[str], float]] = []
+    for section, fields in sections.items():
+        chunk_keys: List[str] = []
+        chunk_cost = 0.0
+        for key, cost in fields:
+            if chunk_keys and chunk_cost + cost > capacity:
+                chunks.append((section, chunk_keys, chunk_cost))
+                chunk_keys, chunk_cost = [], 0.0
+            chunk_keys.append(key)
+            chunk_cost += cost
+        if chunk_keys:
+            chunks.append((section, chunk_keys, chunk_cost))
+    
+    # 4. Longest-processing-time-first assignment onto the least loaded group
+    loads = [0.0] * num_groups
+    members: List[List[Tuple[str, List[str]]]] = [[] for _ in range(num_groups)]
+    for section, keys, cost in sorted(chunks, key=lambda chunk: chunk[2], reverse=True):
+        target_index = loads.index(min(loads))
+        loads[target_index] += cost
+        members[target_index].append((section, keys))
+    
+    partition: Dict[str, Dict[str, Any]] = {}
+    for index, group_members in enumerate(members):
+        if not group_members:
+            continue
+        keys = sorted((key for _, keys in group_members for key in keys), key=field_order.get)
+        section_names = []
+        for section, _ in sorted(group_members, key=lambda member: field_order[member[1][0]]):
+            if section not in section_names:
+                section_names.append(section)
+        label = ", ".join(section_names[:2]) + (f" +{len(section_names) - 2} more" if len(section_names) > 2 else "")
+        partition[f"Group {index + 1} ({label})"] = {key: template_placeholder_contexts[key] for key in keys}
+    
+    print(f"Partitioned {len(template_placeholder_contexts)} fields into {len(partition)} group(s) "
+          f"(target {target:.0f}s/call, est. {max(loads) + fixed_cost:.1f}s slowest group).")
+    with _PARTITION_CACHE_LOCK:
+        _PARTITION_CACHE[cache_key] = partition
+        while len(_PARTITION_CACHE) > PARTITION_CACHE_SIZE:
+            _PARTITION_CACHE.popitem(last=False)
+    return partition
+
+
+# Optional hedging of slow group calls (see src/utils/llm_hedging.py). Latency is
+# always recorded so the telemetry is available even when hedging is off.
+GROUP_CALL_HEDGING = HedgingPolicy(
+    percentile=float(os.getenv("GOA_LLM_HEDGE_PERCENTILE", "95")),
+    max_extra_rate=float(os.getenv("GOA_LLM_HEDGE_MAX_EXTRA_RATE", "0.1")),
+    enabled=os.getenv("GOA_LLM_HEDGING", "0").lower() in ("1", "true", "yes"),
+)
+
+
+# LangChain chat model for group extraction, created once per process
+EXTRACTION_MODEL_NAME = "gemini-2.5-flash-lite"
+_EXTRACTION_LLM = None
+
+
+def get_extraction_llm():
+    """Returns the shared LangChain chat model used for group extraction."""
+    global _EXTRACTION_LLM
+    if _EXTRACTION_LLM is None:
+        _EXTRACTION_LLM = ChatGoogleGenerativeAI(model=EXTRACTION_MODEL_NAME, temperature=0.1)
+    return _EXTRACTION_LLM
+
+
+def get_llm_call_telemetry() -> Dict[str, Any]:
+    """Returns latency and hedging counters for the group extraction calls."""
+    return GROUP_CALL_HEDGING.stats()
+
+
+def build_group_models(group_name: str, group_contexts: Dict[str, Any]) -> Tuple[Any, Any, Dict[str, str]]:
+    """
+    Builds the Pydantic models of one extraction group.
+    
+    The structured model constrains checkboxes to YES/NO (when STRUCTURED_OUTPUT_ENABLED)
+    and is only sent as the native response schema. The text model used by the
+    format-instructions parser types every field as Optional[str], so replies such
+    as "Yes", "TRUE" or "1" still parse and are normalized afterwards.
+    
+    Args:
+        group_name: Name of the group (used for unique model names)
+        group_contexts: Field contexts of the group (Dict[str, str] or Dict[str, Dict])
+        
+    Returns:
+        Tuple of (structured model, text model, sanitized name -> original name)
+    """
+    using_schema_format = isinstance(next(iter(group_contexts.values()), {}), dict)
+    fields = {}
+    text_fields = {}
+    name_mapping = {}
+    for name, context in group_contexts.items():
+        description = ""
+        if using_schema_format and isinstance(context, dict):
+            description = context.get("description", f"Field for {name}")
+        elif isinstance(context, str):
+            description = context
+        
+        # Sanitize field name for Pydantic
+        sanitized_name = re.sub(r'[^a-zA-Z0-9_]', '_', name)
+        if sanitized_name != name:
+            name_mapping[sanitized_name] = name
+        
+        # In structured mode the YES/NO constraint is part of the native response schema
+        if STRUCTURED_OUTPUT_ENABLED and _is_checkbox_field(name, context):
+            field_type = Optional[Literal["YES", "NO"]]
+        else:
+            field_type = Optional[str]
+        fields[sanitized_name] = (field_type, Field(default=None, description=description))
+        text_fields[sanitized_name] = (Optional[str], Field(default=None, description=description))
+    
+    # Create unique model names to avoid conflicts
+    model_name = "DynamicGOADocument_" + re.sub(r'[^a-zA-Z0-9_]', '', group_name.replace(' ', '_').replace('&', 'and'))
+    return create_model(model_name, **fields), create_model(model_name + "_Text", **text_fields), name_mapping
+
+def _run_group_chain(chain: Any, input_data: Dict[str, Any], fallback_chain: Any = None) -> Dict[str, Any]:
+    """
+    Invokes one group's extraction chain (hedged if enabled) and returns the parsed fields as a dict.
+    
+    If a structured-output chain fails or returns nothing, fallback_chain (the text-mode
+    chain with format instructions) is tried once before giving up.
+    """
+    try:
+        result = hedged_call(GROUP_CALL_HEDGING, chain.invoke, input_data)
+        if result is None:
+            raise ValueError("Structured output returned no data")
+        return result.dict()
+    except Exception as e:
+        if fallback_chain is None:
+            raise
+        print(f"Structured output failed ({e}); retrying group with text format instructions.")
+        return hedged_call(GROUP_CALL_HEDGING, fallback_chain.invoke, input_data).dict()
 
 from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
 
@@ -1213,8 +1779,9 @@ def get_machine_specific_fields_via_llm(machine_data: Dict,
     Uses LangChain to create robust, schema-driven extraction chains to fill
     fields based on machine data, common items, and full PDF text. 
     
-    Implements a 'Divide and Conquer' strategy by splitting fields into logical groups
-    and running multiple smaller LLM calls to improve accuracy and focus.
+    Implements a 'Divide and Conquer' strategy by partitioning fields into token-balanced
+    groups (see partition_fields_into_groups) and running the smaller LLM calls in parallel
+    to improve accuracy, focus and end-to-end latency.
     """
     global GENERATIVE_MODEL
     if GENERATIVE_MODEL is None:
@@ -1222,25 +1789,15 @@ def get_machine_specific_fields_via_llm(machine_data: Dict,
             print("LLM client not configured. Returning empty data.")
             return {key: ("NO" if key.endswith("_check") else "") for key in template_placeholder_contexts.keys()}
 
-    # 1. Categorize fields into groups
-    grouped_contexts = {group: {} for group in FIELD_GROUPS.keys()}
-    
-    # Helper to find group
-    def find_group(key):
-        for group_name, rules in FIELD_GROUPS.items():
-            if key in rules["exact"]:
-                return group_name
-            for prefix in rules["prefixes"]:
-                if key.startswith(prefix):
-                    return group_name
-        return "General & Utility" # Default fallback
-
-    for key, context in template_placeholder_contexts.items():
-        group = find_group(key)
-        grouped_contexts[group][key] = context
+    # Prepare input data common to all groups
+    main_item_desc = machine_data.get("main_item", {}).get("description", "")
+    add_on_descs = "; ".join([item.get("description", "") for item in machine_data.get("add_ons", [])])
+    common_item_descs = "; ".join([item.get("description", "") for item in common_items])
+    truncated_pdf_text = full_pdf_text[:20000]
 
-    # Remove empty groups to avoid unnecessary calls
-    active_groups = {k: v for k, v in grouped_contexts.items() if v}
+    # 1. Partition fields into token-balanced groups computed from the schema
+    shared_prompt_tokens = (len(truncated_pdf_text) + len(main_item_desc) + len(add_on_descs) + len(common_item_descs)) // CHARS_PER_TOKEN
+    active_groups = partition_fields_into_groups(template_placeholder_contexts, shared_prompt_tokens=shared_prompt_tokens)
     
     all_extracted_data = {}
     
@@ -1248,40 +1805,20 @@ def get_machine_specific_fields_via_llm(machine_data: Dict,
     machine_name = machine_data.get("machine_name", "")
     machine_type = determine_machine_type(machine_name)
 
-    # Prepare input data common to all groups
-    main_item_desc = machine_data.get("main_item", {}).get("description", "")
-    add_on_descs = "; ".join([item.get("description", "") for item in machine_data.get("add_ons", [])])
-    common_item_descs = "; ".join([item.get("description", "") for item in common_items])
-
-    # 2. Iterate through each group and run extraction
+    llm = get_extraction_llm()
+    output_protocol = f"- {SPARSE_OUTPUT_INSTRUCTION}" if SPARSE_OUTPUT_ENABLED else ""
+    
+    # 2. Build one extraction chain per group. Few-shot enhancement stays sequential
+    # because it shares the FewShotManager; only the LLM calls run in parallel.
+    group_jobs = []
     for group_name, group_contexts in active_groups.items():
-        print(f"\n--- Processing Group: {group_name} ({len(group_contexts)} fields) ---")
+        print(f"\n--- Preparing Group: {group_name} ({len(group_contexts)} fields) ---")
         
         # --- Dynamic Pydantic Model Creation for this Group ---
         using_schema_format = isinstance(next(iter(group_contexts.values()), {}), dict)
-
-        fields = {}
-        name_mapping = {}
-        for name, context in group_contexts.items():
-            description = ""
-            if using_schema_format and isinstance(context, dict):
-                description = context.get("description", f"Field for {name}")
-            elif isinstance(context, str):
-                description = context
-            
-            # Sanitize field name for Pydantic
-            sanitized_name = re.sub(r'[^a-zA-Z0-9_]', '_', name)
-            if sanitized_name != name:
-                name_mapping[sanitized_name] = name
-            
-            fields[sanitized_name] = (Optional[str], Field(default=None, description=description))
-
-        # Create unique model name to avoid conflicts
-        model_name = f"DynamicGOADocument_{group_name.replace(' ', '_').replace('&', 'and').replace(',', '')}"
-        DynamicGroupModel = create_model(model_name, **fields)
+        DynamicGroupModel, TextGroupModel, name_mapping = build_group_models(group_name, group_contexts)
         
-        llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite", temperature=0.1)
-        parser = PydanticOutputParser(pydantic_object=DynamicGroupModel)
+        parser = PydanticOutputParser(pydantic_object=TextGroupModel)
         
         base_prompt_template = f"""
         You are an AI assistant specializing in extracting information from packaging machinery quotes.
@@ -1293,6 +1830,7 @@ def get_machine_specific_fields_via_llm(machine_data: Dict,
           - Conversely, if any 'negative indicators' (keywords that explicitly negate the feature) are present in the context, you MUST output "NO", even if some positive indicators are also present. Negative indicators override positive ones.
         - For text fields, extract the information as requested. If not found, leave it null.
         - Be precise and do not guess. Your accuracy is critical.
+        {output_protocol}
 
         CONTEXT:
         - Machine Name: {{machine_name}}
@@ -1338,59 +1876,85 @@ def get_machine_specific_fields_via_llm(machine_data: Dict,
 
         prompt_template = "\n".join(enhanced_prompt_parts)
 
-        prompt = PromptTemplate(
+        text_prompt = PromptTemplate(
             template=prompt_template,
             input_variables=["machine_name", "full_pdf_text", "main_item_desc", "add_on_descs", "common_item_descs"],
             partial_variables={"format_instructions": parser.get_format_instructions()},
         )
+        text_chain = text_prompt | llm | parser
 
-        chain = prompt | llm | parser
-
-        input_data = {
-            "machine_name": machine_name,
-            "full_pdf_text": full_pdf_text[:20000], 
-            "main_item_desc": main_item_desc,
-            "add_on_descs": add_on_descs,
-            "common_item_descs": common_item_descs,
-        }
+        if STRUCTURED_OUTPUT_ENABLED:
+            # The schema goes to the API natively, so the textual schema dump is dropped
+            structured_prompt = text_prompt.partial(format_instructions="")
+            chain = structured_prompt | llm.with_structured_output(DynamicGroupModel, method="json_schema")
+            fallback_chain = text_chain
+        else:
+            chain = text_chain
+            fallback_chain = None
+
+        group_jobs.append({
+            "group_name": group_name,
+            "group_contexts": group_contexts,
+            "name_mapping": name_mapping,
+            "using_schema_format": using_schema_format,
+            "chain": chain,
+            "fallback_chain": fallback_chain,
+        })
+
+    input_data = {
+        "machine_name": machine_name,
+        "full_pdf_text": truncated_pdf_text, 
+        "main_item_desc": main_item_desc,
+        "add_on_descs": add_on_descs,
+        "common_item_descs": common_item_descs,
+    }
 
-        try:
-            result = chain.invoke(input_data)
-            result_dict = result.dict()
+    # 3. Run all group extractions in parallel and merge their results
+    with ThreadPoolExecutor(max_workers=max(1, len(group_jobs))) as executor:
+        futures = [(job, executor.submit(_run_group_chain, job["chain"], input_data, job["fallback_chain"])) for job in group_jobs]
+        
+        for job, future in futures:
+            group_name = job["group_name"]
+            try:
+                result_dict = future.result()
 
-            # Process results for this group
-            for sanitized_name, value in result_dict.items():
-                original_name = name_mapping.get(sanitized_name, sanitized_name)
+                # Process results for this group
+                for sanitized_name, value in result_dict.items():
+                    original_name = job["name_mapping"].get(sanitized_name, sanitized_name)
+                    
+                    is_checkbox = original_name.endswith("_check") or (
+                        job["using_schema_format"] and 
+                        isinstance(template_placeholder_contexts.get(original_name), dict) and
+                        template_placeholder_contexts[original_name].get('type') == 'boolean'
+                    )
+
+                    if value is None:
+                        all_extracted_data[original_name] = "NO" if is_checkbox else ""
+                    elif is_checkbox:
+                        if isinstance(value, str) and value.upper() in ["YES", "TRUE", "1"]:
+                            all_extracted_data[original_name] = "YES"
+                        elif isinstance(value, bool) and value:
+                            all_extracted_data[original_name] = "YES"
+                        else:
+                            all_extracted_data[original_name] = "NO"
+                    else:
+                        all_extracted_data[original_name] = str(value)
                 
-                is_checkbox = original_name.endswith("_check") or (
-                    using_schema_format and 
-                    isinstance(template_placeholder_contexts.get(original_name), dict) and
-                    template_placeholder_contexts[original_name].get('type') == 'boolean'
-                )
+                print(f"✓ Completed extraction for {group_name}")
 
-                if value is None:
-                    all_extracted_data[original_name] = "NO" if is_checkbox else ""
-                elif is_checkbox:
-                    if isinstance(value, str) and value.upper() in ["YES", "TRUE", "1"]:
-                        all_extracted_data[original_name] = "YES"
-                    elif isinstance(value, bool) and value:
-                        all_extracted_data[original_name] = "YES"
-                    else:
-                        all_extracted_data[original_name] = "NO"
-                else:
-                    all_extracted_data[original_name] = str(value)
-            
-            print(f"✓ Completed extraction for {group_name}")
+            except Exception as e:
+                print(f"Error during extraction for group {group_name}: {e}")
+                traceback.print_exc()
+                # Fill missing fields with defaults
+                for key in job["group_contexts"]:
+                    if key not in all_extracted_data:
+                         all_extracted_data[key] = "NO" if key.endswith("_check") else ""
 
-        except Exception as e:
-            print(f"Error during extraction for group {group_name}: {e}")
-            traceback.print_exc()
-            # Fill missing fields with defaults
-            for key in group_contexts:
-                if key not in all_extracted_data:
-                     all_extracted_data[key] = "NO" if key.endswith("_check") else ""
-
-    # 3. Apply post-processing rules to the combined data
+    telemetry = get_llm_call_telemetry()
+    print(f"LLM group call telemetry: p50={telemetry['p50_seconds']}, p95={telemetry['p95_seconds']}, "
+          f"hedges={telemetry['hedges_issued']}/{telemetry['calls']} (wins: {telemetry['hedge_wins']})")
+
+    # 4. Apply post-processing rules to the combined data
     print("\nApplying post-processing rules to combined data...")
     
     # Construct selected_pdf_descriptions for post-processing
@@ -1410,13 +1974,18 @@ def get_machine_specific_fields_via_llm(machine_data: Dict,
         print("SortStar basic system selection applied.")
 
     # Store confident outputs so future runs benefit from richer few-shot data
-    _persist_machine_few_shot_examples(
+    persist_kwargs = dict(
         machine_data=machine_data,
         common_items=common_items,
         full_pdf_text=full_pdf_text,
-        extracted_fields=final_data,
+        extracted_fields=dict(final_data),
         machine_type=machine_type,
     )
+    if FEW_SHOT_PERSIST_IN_BACKGROUND:
+        threading.Thread(target=_persist_machine_few_shot_examples, kwargs=persist_kwargs,
+                         name="few-shot-persist", daemon=True).start()
+    else:
+        _persist_machine_few_shot_examples(**persist_kwargs)
 
     return final_data
 
@@ -0,0 +1,268 @@
+"""
+Hedged Requests for LLM Calls
+
+This module cuts tail latency on slow LLM calls. If a call has not returned by a
+configurable percentile of its recent latency, a duplicate is issued and whichever
+attempt finishes first wins. A budget caps the extra request rate so hedging never
+more than marginally increases API usage.
+"""
+
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+# Shared pool for primary and hedge attempts so callers never block on pool creation.
+# Two workers per parallel extraction group (8 at most): one primary and one hedge.
+HEDGE_MAX_WORKERS = int(os.getenv("GOA_LLM_HEDGE_MAX_WORKERS", "16"))
+_HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="llm-hedge")
+
+# Attempts submitted and not finished yet, including abandoned losers still running.
+# A hedge is only issued while a worker is free, so it never queues behind them.
+_attempts_in_flight = 0
+_attempts_lock = threading.Lock()
+
+
+class HedgingPolicy:
+    """Tracks recent call latency and decides when (and whether) to hedge a call."""
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        max_extra_rate: float = 0.1,
+        min_samples: int = 10,
+        window: int = 200,
+        min_delay_seconds: float = 0.5,
+        enabled: bool = True
+    ):
+        """
+        Initialize the hedging policy.
+
+        Args:
+            percentile: Latency percentile after which a duplicate request is issued
+            max_extra_rate: Maximum hedges as a fraction of primary calls (budget cap)
+            min_samples: Latency samples required before hedging starts
+            window: Number of recent latencies kept for the percentile
+            min_delay_seconds: Never hedge earlier than this
+            enabled: If False, calls run unhedged but latency is still recorded
+        """
+        self.percentile = percentile
+        self.max_extra_rate = max_extra_rate
+        self.min_samples = min_samples
+        self.min_delay_seconds = min_delay_seconds
+        self.enabled = enabled
+
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+        # Telemetry counters
+        self.calls = 0
+        self.hedges_issued = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self.no_free_worker = 0
+        self.failures = 0
+
+    def record_latency(self, seconds: float) -> None:
+        """Records the duration of one attempt whose result was used."""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Returns the given percentile of recent latencies, or None without enough samples."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(percentile / 100.0 * len(samples)) - 1))
+        return samples[index]
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None if hedging should not happen."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            sample_count = len(self._latencies)
+        if sample_count < self.min_samples:
+            return None
+        delay = self.latency_percentile(self.percentile)
+        return max(self.min_delay_seconds, delay) if delay is not None else None
+
+    def try_acquire_hedge(self) -> bool:
+        """Reserves budget for one hedge; False if the extra request rate cap is reached."""
+        with self._lock:
+            if self.hedges_issued + 1 > self.max_extra_rate * self.calls:
+                self.budget_denied += 1
+                return False
+            self.hedges_issued += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Telemetry snapshot for monitoring the policy's cost and benefit."""
+        with self._lock:
+            calls = self.calls
+            snapshot = {
+                "calls": calls,
+                "hedges_issued": self.hedges_issued,
+                "hedge_wins": self.hedge_wins,
+                "budget_denied": self.budget_denied,
+                "no_free_worker": self.no_free_worker,
+                "failures": self.failures,
+                "extra_request_rate": self.hedges_issued / calls if calls else 0.0,
+                "samples": len(self._latencies),
+            }
+        snapshot["p50_seconds"] = self.latency_percentile(50)
+        snapshot["p95_seconds"] = self.latency_percentile(95)
+        snapshot["p99_seconds"] = self.latency_percentile(99)
+        return snapshot
+
+
+def _timed_attempt(fn: Callable[..., Any], args: tuple, kwargs: dict) -> Tuple[Any, float]:
+    """Runs one attempt and returns its result with its duration in seconds."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _reserve_worker(required: bool) -> bool:
+    """Counts one more attempt in flight; unless required, only if a worker is free for it."""
+    global _attempts_in_flight
+    with _attempts_lock:
+        if not required and _attempts_in_flight >= HEDGE_MAX_WORKERS:
+            return False
+        _attempts_in_flight += 1
+        return True
+
+
+def _release_worker(_future: Optional[Future] = None) -> None:
+    global _attempts_in_flight
+    with _attempts_lock:
+        _attempts_in_flight -= 1
+
+
+def _submit_attempt(fn: Callable[..., Any], args: tuple, kwargs: dict) -> Future:
+    """Submits an attempt whose worker was reserved; the reservation ends when it finishes or is cancelled."""
+    future = _HEDGE_EXECUTOR.submit(_timed_attempt, fn, args, kwargs)
+    future.add_done_callback(_release_worker)
+    return future
+
+
+def hedged_call(policy: HedgingPolicy, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Calls fn, issuing one duplicate if it runs past the policy's hedge delay.
+
+    The first attempt to succeed wins and only its latency is recorded. The loser
+    is cancelled if it has not started yet; an attempt already in flight cannot be
+    interrupted, so its result is discarded. If the first finished attempt fails,
+    the other one is still awaited. No hedge is issued while every worker is busy
+    (e.g., with abandoned losers), since it would only queue behind them. Calls
+    the policy would not hedge run inline on the caller's thread.
+
+    Args:
+        policy: HedgingPolicy that supplies the delay and the budget
+        fn: The call to run (e.g., a LangChain chain's invoke)
+        *args, **kwargs: Arguments passed to fn
+
+    Returns:
+        The result of the winning attempt
+    """
+    with policy._lock:
+        policy.calls += 1
+
+    delay = policy.hedge_delay()
+    if delay is None:
+        # Nothing to race, so run inline instead of queueing behind pool attempts
+        try:
+            result, seconds = _timed_attempt(fn, args, kwargs)
+        except Exception:
+            with policy._lock:
+                policy.failures += 1
+            raise
+        policy.record_latency(seconds)
+        return result
+
+    _reserve_worker(required=True)
+    primary = _submit_attempt(fn, args, kwargs)
+
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return _result_or_count_failure(policy, primary)
+    if not _reserve_worker(required=False):
+        with policy._lock:
+            policy.no_free_worker += 1
+        return _result_or_count_failure(policy, primary)
+    if not policy.try_acquire_hedge():
+        _release_worker()
+        return _result_or_count_failure(policy, primary)
+
+    print(f"LLM call exceeded {delay:.1f}s (p{policy.percentile:.0f}); issuing hedged request.")
+    hedge = _submit_attempt(fn, args, kwargs)
+    pending = {primary, hedge}
+    last_error: Optional[BaseException] = None
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                last_error = future.exception()
+                continue
+            for loser in pending:
+                loser.cancel()
+            if future is hedge:
+                with policy._lock:
+                    policy.hedge_wins += 1
+            result, seconds = future.result()
+            policy.record_latency(seconds)
+            return result
+
+    with policy._lock:
+        policy.failures += 1
+    raise last_error  # type: ignore[misc]
+
+
+def _result_or_count_failure(policy: HedgingPolicy, future: Future) -> Any:
+    """Waits for a single attempt, recording its latency or counting its failure."""
+    try:
+        result, seconds = future.result()
+    except Exception:
+        with policy._lock:
+            policy.failures += 1
+        raise
+    policy.record_latency(seconds)
+    return result
+
+
+# Demo against a fake backend with heavy-tailed latency
+if __name__ == "__main__":
+    def fake_llm_call(scale: float = 0.05) -> str:
+        """Pareto-distributed latency: most calls are fast, a few are very slow."""
+        time.sleep(min(scale * random.paretovariate(1.5), 5.0))
+        return "{}"
+
+    def run(policy: HedgingPolicy, n: int = 300) -> Dict[str, float]:
+        durations = []
+        for _ in range(n):
+            start = time.perf_counter()
+            hedged_call(policy, fake_llm_call)
+            durations.append(time.perf_counter() - start)
+        durations.sort()
+        return {
+            "p50": durations[int(0.50 * n)],
+            "p95": durations[int(0.95 * n)],
+            "p99": durations[int(0.99 * n) - 1],
+        }
+
+    random.seed(7)
+    baseline = run(HedgingPolicy(enabled=False))
+    random.seed(7)
+    hedging_policy = HedgingPolicy(percentile=90.0, max_extra_rate=0.15, min_delay_seconds=0.0)
+    hedged = run(hedging_policy)
+
+    print("\n--- Heavy-tailed fake backend (300 calls) ---")
+    for label, result in (("no hedging", baseline), ("hedging p90", hedged)):
+        print(f"{label:>12}: p50={result['p50']*1000:.0f}ms p95={result['p95']*1000:.0f}ms p99={result['p99']*1000:.0f}ms")
+    print(f"Telemetry: {hedging_policy.stats()}")
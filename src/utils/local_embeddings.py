@@ -0,0 +1,176 @@
+"""
+Local Embeddings for Few-Shot Selection
+
+A CPU-only alternative to the remote embedding model. Texts are turned into
+hashed character n-gram counts (sublinear TF), weighted by IDF fitted on the
+stored example contexts and L2-normalized. No network round trip or API key is
+needed, and a vector takes microseconds to compute, so few-shot selection keeps
+working offline or when the embedding quota runs out.
+"""
+
+import os
+import re
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+LOCAL_EMBEDDING_FEATURES = 4096
+LOCAL_EMBEDDING_NGRAM_RANGE = (3, 5)
+
+_HASH_MULTIPLIER = np.uint64(1099511628211)
+_HASH_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class HashedTfidfEmbeddings(Embeddings):
+    """Hashed character n-gram TF-IDF vectors, compatible with LangChain Embeddings."""
+
+    def __init__(self, n_features: int = LOCAL_EMBEDDING_FEATURES,
+                 ngram_range: Tuple[int, int] = LOCAL_EMBEDDING_NGRAM_RANGE,
+                 idf: Optional[np.ndarray] = None):
+        """
+        Initialize the vectorizer.
+
+        Args:
+            n_features: Vector size; must be a power of two
+            ngram_range: Smallest and largest character n-gram length
+            idf: Fitted IDF weights (all ones until fit() is called)
+        """
+        if n_features & (n_features - 1):
+            raise ValueError("n_features must be a power of two")
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self._shift = np.uint64(64 - int(np.log2(n_features)))
+        self.idf = np.ones(n_features, dtype=np.float32) if idf is None else np.asarray(idf, dtype=np.float32)
+
+    def _feature_indices(self, text: str) -> np.ndarray:
+        """Hash bucket of every character n-gram of the normalized text."""
+        normalized = " " + re.sub(r"\s+", " ", (text or "").lower()).strip() + " "
+        codes = np.frombuffer(normalized.encode("utf-8"), dtype=np.uint8).astype(np.uint64)
+        buckets = []
+        with np.errstate(over="ignore"):
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                if len(codes) < n:
+                    break
+                # Polynomial hash of every n-gram at once, wrapping at 64 bits
+                hashes = np.full(len(codes) - n + 1, n, dtype=np.uint64)
+                for offset in range(n):
+                    hashes = hashes * _HASH_MULTIPLIER + codes[offset:len(codes) - n + 1 + offset]
+                buckets.append((hashes * _HASH_MIX) >> self._shift)
+        if not buckets:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(buckets).astype(np.int64)
+
+    def _term_frequencies(self, text: str) -> np.ndarray:
+        counts = np.bincount(self._feature_indices(text), minlength=self.n_features).astype(np.float32)
+        return np.log1p(counts)
+
+    def fit(self, texts: Iterable[str]) -> "HashedTfidfEmbeddings":
+        """
+        Fits the IDF weights on a corpus (e.g., all stored example contexts).
+
+        Args:
+            texts: Corpus texts
+
+        Returns:
+            self
+        """
+        document_frequency = np.zeros(self.n_features, dtype=np.float64)
+        count = 0
+        for text in texts:
+            document_frequency[np.unique(self._feature_indices(text))] += 1
+            count += 1
+        self.idf = (np.log((1 + count) / (1 + document_frequency)) + 1).astype(np.float32)
+        return self
+
+    def embed_vector(self, text: str) -> np.ndarray:
+        """Returns the normalized TF-IDF vector of one text as a float32 array."""
+        vector = self._term_frequencies(text) * self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds documents."""
+        return [self.embed_vector(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embeds a query (same vector space as documents)."""
+        return self.embed_vector(text).tolist()
+
+    def save(self, path: str) -> None:
+        """Persists the fitted IDF weights (written atomically)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, self.idf)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> Optional["HashedTfidfEmbeddings"]:
+        """Loads a vectorizer with persisted IDF weights, or None if none are stored."""
+        if not os.path.exists(path):
+            return None
+        try:
+            idf = np.load(path)
+        except (OSError, ValueError) as e:
+            print(f"Error loading local embedding weights from {path}: {e}")
+            return None
+        return cls(n_features=len(idf), idf=idf, **kwargs)
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray, k: int) -> float:
+    """
+    Average overlap of each row's top-k neighbours under two embeddings (self excluded).
+
+    Args:
+        reference: Normalized reference vectors (one row per example)
+        candidate: Normalized candidate vectors for the same examples
+        k: Neighbours compared per example
+
+    Returns:
+        Fraction of the reference neighbours also found by the candidate
+    """
+    count = len(reference)
+    k = min(k, count - 1)
+    if k <= 0:
+        return 1.0
+    overlaps = []
+    for scores_ref, scores_cand, i in zip(reference @ reference.T, candidate @ candidate.T, range(count)):
+        scores_ref[i] = scores_cand[i] = -np.inf
+        top_ref = set(np.argsort(-scores_ref)[:k])
+        top_cand = set(np.argsort(-scores_cand)[:k])
+        overlaps.append(len(top_ref & top_cand) / k)
+    return float(np.mean(overlaps))
+
+
+# Recall and latency of the local embeddings against the remote model on the stored examples
+if __name__ == "__main__":
+    import time
+
+    from src.utils.crm_utils import get_few_shot_contexts
+    from src.utils.numpy_vector_index import normalize_rows
+
+    contexts = get_few_shot_contexts()
+    if len(contexts) < 3:
+        print("Not enough stored few-shot contexts to compare (need at least 3).")
+        raise SystemExit(0)
+
+    local = HashedTfidfEmbeddings().fit(contexts)
+    start = time.perf_counter()
+    local_vectors = normalize_rows(np.array(local.embed_documents(contexts)))
+    local_seconds = (time.perf_counter() - start) / len(contexts)
+    print(f"Local embeddings: {len(contexts)} contexts, {local_seconds * 1e6:.0f}us per text")
+
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        print("GOOGLE_API_KEY not set; skipping the recall comparison with the remote model.")
+        raise SystemExit(0)
+
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    remote = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=api_key)
+    start = time.perf_counter()
+    remote_vectors = normalize_rows(np.array(remote.embed_documents(contexts)))
+    remote_seconds = (time.perf_counter() - start) / len(contexts)
+    print(f"Remote embeddings: {remote_seconds * 1e3:.1f}ms per text (batched)")
+    for k in (1, 3, 5):
+        print(f"recall@{k} of local vs remote neighbours: {recall_at_k(remote_vectors, local_vectors, k):.3f}")
@@ -0,0 +1,399 @@
+"""
+In-Process NumPy Vector Index for Few-Shot Examples
+
+Each field has at most a few dozen examples, so a full vector database is far
+heavier than the search itself. This module keeps one index per field as a
+contiguous float32 matrix of normalized embeddings in a .npy file (memory-mapped
+on load) plus a JSON sidecar with the example ids and metadata. New and removed
+examples are appended to a small delta log, so an incremental update writes only
+the new rows. Top-k search is a single matrix-vector product.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.example_selectors.base import BaseExampleSelector
+
+# The delta log is merged into the base files once it has more entries than
+# this and than the base has rows, so merging stays amortized O(1) per append
+DELTA_COMPACT_MIN_ENTRIES = 64
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Returns float32 rows scaled to unit length (zero rows are left as zeros)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyVectorIndex:
+    """
+    Normalized embedding matrix for one field.
+
+    The compacted index is <name>.npy (memory-mapped) + <name>.json. Appends and
+    removals go to a delta log instead of rewriting it: raw float32 rows in
+    <name>.delta.f32 and one JSON line per change in <name>.delta.jsonl (an
+    added row, or a tombstone for a removed id). The delta is merged into the
+    base files once it outgrows DELTA_COMPACT_MIN_ENTRIES and the base itself.
+    """
+
+    def __init__(self, directory: str, name: str):
+        """
+        Initialize the index and load it from disk if it exists.
+
+        Args:
+            directory: Directory holding the index files
+            name: Index name (e.g., the few-shot index key)
+        """
+        self.directory = directory
+        self.name = name
+        self.matrix_path = os.path.join(directory, f"{name}.npy")
+        self.metadata_path = os.path.join(directory, f"{name}.json")
+        self.delta_vectors_path = os.path.join(directory, f"{name}.delta.f32")
+        self.delta_log_path = os.path.join(directory, f"{name}.delta.jsonl")
+
+        self._matrix: Optional[np.ndarray] = None
+        self._delta: Optional[np.ndarray] = None
+        self._records: List[Dict[str, Any]] = []
+        self._alive: Optional[np.ndarray] = None
+        self._row_of_id: Dict[str, int] = {}
+        self._delta_entries = 0
+        self.ids: Set[str] = set()
+        self.nbytes = 0
+        self._closed = False
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def closed(self) -> bool:
+        """True once the index was closed (e.g., evicted); its owner opens a fresh one."""
+        return self._closed
+
+    def _reset(self) -> None:
+        self._matrix, self._delta, self._records, self._alive = None, None, [], None
+        self._row_of_id, self.ids = {}, set()
+        self._delta_entries = 0
+        self.nbytes = 0
+
+    def load(self) -> None:
+        """Memory-maps the base matrix, reads the sidecar metadata and replays the delta log."""
+        self._closed = False
+        self._reset()
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.metadata_path)):
+            return
+        try:
+            with open(self.metadata_path, "r", encoding="utf-8") as f:
+                self._records = json.load(f)
+            self._matrix = np.load(self.matrix_path, mmap_mode="r")
+            self._alive = np.ones(len(self._records), dtype=bool)
+            self._row_of_id = {record["id"]: row for row, record in enumerate(self._records)}
+            self._replay_delta()
+            self.ids = set(self._row_of_id)
+            self.nbytes = (self._matrix.nbytes + os.path.getsize(self.metadata_path)
+                           + (self._delta.nbytes if self._delta is not None else 0))
+        except (OSError, ValueError) as e:
+            print(f"Error loading vector index '{self.name}', starting empty: {e}")
+            self._reset()
+
+    def _replay_delta(self) -> None:
+        """Applies the delta log on top of the base rows; replaying an entry twice is harmless."""
+        if not os.path.exists(self.delta_log_path):
+            return
+        dimension = self._matrix.shape[1]
+        delta = np.zeros(0, dtype=np.float32)
+        if os.path.exists(self.delta_vectors_path):
+            delta = np.fromfile(self.delta_vectors_path, dtype=np.float32)
+        delta = delta[:len(delta) // dimension * dimension].reshape(-1, dimension)
+        alive = list(self._alive)
+        delta_rows = []
+        with open(self.delta_log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                self._delta_entries += 1
+                example_id = entry["id"]
+                if entry.get("removed"):
+                    row = self._row_of_id.pop(example_id, None)
+                    if row is not None:
+                        alive[row] = False
+                elif example_id not in self._row_of_id and entry["row"] < len(delta):
+                    self._records.append({"id": example_id, "metadata": entry["metadata"]})
+                    self._row_of_id[example_id] = len(self._records) - 1
+                    alive.append(True)
+                    delta_rows.append(entry["row"])
+        self._delta = delta[delta_rows] if delta_rows else None
+        self._alive = np.array(alive, dtype=bool)
+
+    def close(self) -> None:
+        """
+        Releases the memory map and the loaded metadata.
+
+        A search already running keeps its own references until it finishes. A
+        closed index is not remapped by searches; the owner (see
+        FewShotManager.get_numpy_index) opens the field again so the reopen is
+        counted against its bounds.
+        """
+        self._reset()
+        self._closed = True
+
+    def add(self, vectors: np.ndarray, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """
+        Appends vectors with their ids and metadata and persists them.
+
+        Only the new rows are written (to the delta log); an empty index is
+        written as a fresh base file.
+
+        Args:
+            vectors: Embeddings (one row per example, normalized here)
+            ids: Unique example ids
+            metadatas: Metadata returned with each search hit
+        """
+        if not ids:
+            return
+        new_rows = normalize_rows(vectors)
+        with self._reopened():
+            if self._matrix is None:
+                self._records = [{"id": id_, "metadata": metadata} for id_, metadata in zip(ids, metadatas)]
+                self._write_base(new_rows)
+                return
+            row_bytes = 4 * self._matrix.shape[1]
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.delta_vectors_path, "ab") as f:
+                # Drop a row cut short by a crash so row numbers stay aligned
+                first_row = f.tell() // row_bytes
+                f.truncate(first_row * row_bytes)
+                f.seek(first_row * row_bytes)
+                f.write(np.ascontiguousarray(new_rows, dtype=np.float32).tobytes())
+            self._append_log([
+                {"id": id_, "row": first_row + i, "metadata": metadata}
+                for i, (id_, metadata) in enumerate(zip(ids, metadatas))
+            ])
+
+    def remove(self, ids: List[str]) -> None:
+        """
+        Removes examples from the index (tombstones in the delta log).
+
+        Args:
+            ids: Example ids to remove; unknown ids are ignored
+        """
+        with self._reopened():
+            stale = [id_ for id_ in ids if id_ in self.ids]
+            if stale:
+                self._append_log([{"id": id_, "removed": True} for id_ in stale])
+
+    @contextmanager
+    def _reopened(self):
+        """
+        Runs a write against the files on disk and reloads (or compacts) afterwards.
+
+        A closed index is loaded for the write and closed again, so it is never
+        left mapped outside its owner.
+        """
+        was_closed = self._closed
+        if was_closed:
+            self.load()
+        try:
+            yield
+        finally:
+            self.load()
+            base_rows = len(self._matrix) if self._matrix is not None else 0
+            if self._delta_entries > max(DELTA_COMPACT_MIN_ENTRIES, base_rows):
+                self.compact()
+            if was_closed:
+                self.close()
+
+    def _append_log(self, entries: List[Dict[str, Any]]) -> None:
+        with open(self.delta_log_path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+    def compact(self) -> None:
+        """
+        Merges the delta log into the base files, dropping removed rows.
+
+        The memory map is released before the base file is replaced (Windows
+        refuses to replace a mapped file). If another process still maps it,
+        the delta is kept and merging is retried on a later write.
+        """
+        if self._matrix is None or self._delta_entries == 0:
+            return
+        rows = np.flatnonzero(self._alive)
+        base_count = len(self._matrix)
+        matrix = np.vstack([
+            np.array(self._matrix[rows[rows < base_count]]),
+            self._delta[rows[rows >= base_count] - base_count] if self._delta is not None else np.zeros((0, self._matrix.shape[1]), np.float32),
+        ])
+        records = [{"id": self._records[row]["id"], "metadata": self._records[row]["metadata"]} for row in rows]
+        self._matrix = None  # release the mapping before the file is replaced
+        self._records = records
+        try:
+            self._write_base(matrix)
+        except OSError as e:
+            print(f"Error compacting vector index '{self.name}', keeping its delta log: {e}")
+        self.load()
+
+    def _write_base(self, matrix: np.ndarray) -> None:
+        """Writes the base files through temporary files, then drops the merged delta log."""
+        os.makedirs(self.directory, exist_ok=True)
+        matrix_tmp = self.matrix_path + ".tmp.npy"
+        metadata_tmp = self.metadata_path + ".tmp"
+        np.save(matrix_tmp, np.ascontiguousarray(matrix, dtype=np.float32))
+        with open(metadata_tmp, "w", encoding="utf-8") as f:
+            json.dump(self._records, f)
+        os.replace(matrix_tmp, self.matrix_path)
+        os.replace(metadata_tmp, self.metadata_path)
+        # Replaying a leftover log after a crash here is harmless: entries are idempotent
+        for path in (self.delta_log_path, self.delta_vectors_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def search(self, query_vector: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        """
+        Returns the metadata of the k most similar examples (cosine similarity).
+
+        Args:
+            query_vector: Query embedding (normalized here)
+            k: Number of results
+
+        Returns:
+            Metadata dicts, most similar first (none once the index is closed)
+        """
+        matrix, delta, records, alive = self._matrix, self._delta, self._records, self._alive  # stable even if closed meanwhile
+        if matrix is None or not records or k <= 0:
+            return []
+        query = normalize_rows(query_vector)[0]
+        scores = matrix @ query
+        if delta is not None:
+            scores = np.concatenate([scores, delta @ query])
+        live = int(alive.sum())
+        if live == 0:
+            return []
+        scores = np.where(alive, scores, -np.inf)
+        k = min(k, live)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(records[i]["metadata"]) for i in top]
+
+    def clear(self) -> None:
+        """Deletes the index files and empties the index."""
+        self._reset()
+        self._closed = False
+        for path in (self.matrix_path, self.metadata_path, self.delta_vectors_path, self.delta_log_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def search_open_index(index_lookup: Callable[[], NumpyVectorIndex], query_vector: np.ndarray, k: int) -> List[Dict[str, Any]]:
+    """
+    Searches the index returned by index_lookup.
+
+    If the index is evicted between the lookup and the search, it is looked up
+    again, so the owner reopens it rather than the closed instance.
+    """
+    for _ in range(3):
+        index = index_lookup()
+        hits = index.search(query_vector, k)
+        if hits or not index.closed:
+            return hits
+    return []
+
+
+class NumpyExampleSelector(BaseExampleSelector):
+    """
+    Example selector over a NumpyVectorIndex, compatible with SemanticSimilarityExampleSelector.
+
+    The index is looked up through index_lookup on every call instead of being
+    held, so an index evicted by its owner is never used or remapped behind it.
+    """
+
+    def __init__(self, index_lookup: Callable[[], NumpyVectorIndex], embeddings: Embeddings, k: int = 2,
+                 input_key: str = "input_context", example_keys: Optional[List[str]] = None):
+        self.index_lookup = index_lookup
+        self.embeddings = embeddings
+        self.k = k
+        self.input_key = input_key
+        self.example_keys = example_keys
+
+    def add_example(self, example: Dict[str, str]) -> Any:
+        """Embeds and appends one example; its id is example['example_id']."""
+        vector = self.embeddings.embed_documents([str(example[self.input_key])])
+        self.index_lookup().add(np.array(vector), [str(example["example_id"])], [example])
+
+    def select_examples(self, input_variables: Dict[str, str]) -> List[dict]:
+        """Embeds the input once and returns the k most similar examples."""
+        query_vector = np.array(self.embeddings.embed_query(str(input_variables[self.input_key])))
+        return self.select_examples_by_vector(query_vector)
+
+    def select_examples_by_vector(self, query_vector: np.ndarray) -> List[dict]:
+        """Returns the k most similar examples for an already embedded query."""
+        hits = search_open_index(self.index_lookup, query_vector, self.k)
+        if self.example_keys:
+            hits = [{key: hit[key] for key in self.example_keys if key in hit} for hit in hits]
+        return hits
+
+
+# Benchmark: NumPy index vs the Chroma store on the same examples
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    import warnings
+
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    warnings.filterwarnings("ignore")
+    from langchain_community.vectorstores import Chroma
+
+    fields, examples_per_field, queries = 20, 50, 200
+    embeddings = DeterministicFakeEmbedding(size=768)
+    workdir = tempfile.mkdtemp(prefix="few_shot_bench_")
+
+    def field_examples(field: int) -> List[Dict[str, Any]]:
+        return [{"input_context": f"Machine {i} for field {field}", "expected_output": "YES", "example_id": f"{field}-{i}"}
+                for i in range(examples_per_field)]
+
+    # Build both indexes once
+    chroma = Chroma(collection_name="bench", persist_directory=os.path.join(workdir, "chroma"), embedding_function=embeddings)
+    for field in range(fields):
+        rows = field_examples(field)
+        chroma.add_texts([r["input_context"] for r in rows], metadatas=[{**r, "index_key": f"f{field}"} for r in rows],
+                         ids=[r["example_id"] for r in rows])
+        index = NumpyVectorIndex(os.path.join(workdir, "numpy"), f"f{field}")
+        index.add(np.array(embeddings.embed_documents([r["input_context"] for r in rows])), [r["example_id"] for r in rows], rows)
+    if hasattr(chroma._client, "stop"):
+        chroma._client.stop()
+    del chroma
+
+    query_vectors = [np.array(embeddings.embed_query(f"query {q}")) for q in range(queries)]
+
+    start = time.perf_counter()
+    chroma = Chroma(collection_name="bench", persist_directory=os.path.join(workdir, "chroma"), embedding_function=embeddings)
+    chroma_load = time.perf_counter() - start
+    start = time.perf_counter()
+    for q, vector in enumerate(query_vectors):
+        chroma.similarity_search_by_vector(vector.tolist(), k=2, filter={"index_key": f"f{q % fields}"})
+    chroma_query = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    numpy_indexes = [NumpyVectorIndex(os.path.join(workdir, "numpy"), f"f{field}") for field in range(fields)]
+    numpy_load = time.perf_counter() - start
+    start = time.perf_counter()
+    for q, vector in enumerate(query_vectors):
+        numpy_indexes[q % fields].search(vector, 2)
+    numpy_query = (time.perf_counter() - start) / queries
+
+    print(f"\n--- {fields} fields x {examples_per_field} examples, 768-d, {queries} queries ---")
+    print(f"Chroma: load {chroma_load * 1000:.1f}ms, query {chroma_query * 1000:.3f}ms")
+    print(f"NumPy : load {numpy_load * 1000:.1f}ms, query {numpy_query * 1000:.3f}ms")
+    shutil.rmtree(workdir, ignore_errors=True)
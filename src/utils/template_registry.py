@@ -0,0 +1,254 @@
+"""
+Compiled Template Registry
+
+Template schemas used to be re-extracted on every GOA run: the Excel template is
+opened with openpyxl and synonyms/indicators are regenerated for every checkbox,
+and the SortStar DOCX is re-parsed. This module compiles each template into a
+schema artifact once, persists it as JSON keyed by the hash of the source files
+and the compile options, and keeps it in memory. A lookup only stats the source
+files; they are hashed again only when their mtime or size changes.
+
+Artifacts contain the schema (field types, sections, descriptions, synonyms and
+indicators), the ordered field list and the section outline, i.e. everything the
+extraction prompts and the template editor need.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.utils import form_generator
+from src.utils.form_generator import EXCEL_PATH, extract_schema_from_excel, file_sha256
+from src.utils import template_utils
+
+TEMPLATE_REGISTRY_DIRECTORY = os.path.join("src", "cache", "template_registry")
+
+# Bump when the compiled artifact format changes
+TEMPLATE_COMPILER_VERSION = 1
+
+
+def _compiler_fingerprint() -> str:
+    """
+    Hash of the source of the schema extractors (form_generator, template_utils
+    including synonym generation, and this module).
+
+    It is part of every artifact key, so editing the extraction logic recompiles
+    the schemas instead of serving stale persisted artifacts.
+    """
+    digest = hashlib.sha256()
+    for module in (form_generator, template_utils, sys.modules[__name__]):
+        digest.update(file_sha256(module.__file__).encode("ascii"))
+    return digest.hexdigest()
+
+
+TEMPLATE_COMPILER_FINGERPRINT = _compiler_fingerprint()
+
+# (kind, source paths, options digest) -> (source stamps, artifact)
+_REGISTRY: Dict[Tuple[str, Tuple[str, ...], str], Tuple[List[Tuple[int, int]], Dict[str, Any]]] = {}
+_REGISTRY_LOCK = threading.Lock()
+REGISTRY_STATS = {"hits": 0, "loads": 0, "compiles": 0}
+
+
+def _source_stamp(path: str) -> Tuple[int, int]:
+    """(mtime_ns, size) of a source file, the cheap change check before hashing."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _artifact_path(kind: str, source_hashes: List[str], options_digest: str) -> str:
+    key = hashlib.sha256(
+        json.dumps([TEMPLATE_COMPILER_VERSION, TEMPLATE_COMPILER_FINGERPRINT, kind, source_hashes, options_digest]).encode("utf-8")
+    ).hexdigest()[:24]
+    return os.path.join(TEMPLATE_REGISTRY_DIRECTORY, f"{kind}-{key}.json")
+
+
+def _write_artifact(path: str, artifact: Dict[str, Any]) -> None:
+    """Writes the artifact through a temporary file so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f)
+    os.replace(tmp_path, path)
+
+
+def _get_compiled(
+    kind: str,
+    source_paths: List[str],
+    options: Any,
+    compile_fn: Callable[[], Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Returns the compiled artifact of a template, compiling it only if its sources changed.
+
+    Args:
+        kind: Artifact kind ("excel" or "docx")
+        source_paths: Files the artifact is compiled from (existing ones only)
+        options: JSON-serializable compile options that are part of the key
+        compile_fn: Builds the artifact body ({"schema": ..., ...})
+
+    Returns:
+        The artifact, shared between callers (treat it as read-only)
+    """
+    paths = tuple(os.path.abspath(p) for p in source_paths)
+    options_digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()
+    registry_key = (kind, paths, options_digest)
+    stamps = [_source_stamp(p) for p in paths]
+
+    with _REGISTRY_LOCK:
+        cached = _REGISTRY.get(registry_key)
+        if cached is not None and cached[0] == stamps:
+            REGISTRY_STATS["hits"] += 1
+            return cached[1]
+
+        source_hashes = [file_sha256(p) for p in paths]
+        artifact_path = _artifact_path(kind, source_hashes, options_digest)
+        artifact = None
+        if os.path.exists(artifact_path):
+            try:
+                with open(artifact_path, "r", encoding="utf-8") as f:
+                    artifact = json.load(f)
+                REGISTRY_STATS["loads"] += 1
+            except (OSError, ValueError) as e:
+                print(f"Error reading compiled template {artifact_path}, recompiling: {e}")
+                artifact = None
+
+        if artifact is None:
+            print(f"Compiling {kind} template schema from {', '.join(source_paths)}...")
+            artifact = {
+                "version": TEMPLATE_COMPILER_VERSION,
+                "kind": kind,
+                "sources": dict(zip(source_paths, source_hashes)),
+                **compile_fn(),
+            }
+            REGISTRY_STATS["compiles"] += 1
+            if artifact.get("schema"):  # extraction errors return an empty schema; retry next time
+                try:
+                    _write_artifact(artifact_path, artifact)
+                except OSError as e:
+                    print(f"Error persisting compiled template {artifact_path}: {e}")
+
+        _REGISTRY[registry_key] = (stamps, artifact)
+        return artifact
+
+
+def _outline_from_schema(schema: Dict[str, Dict]) -> Dict[str, Dict[str, List[str]]]:
+    """Section -> subsection -> placeholders, in template order ("" for fields directly in a section)."""
+    outline: Dict[str, Dict[str, List[str]]] = {}
+    for key, entry in schema.items():
+        section = entry.get("section") or "General"
+        outline.setdefault(section, {}).setdefault(entry.get("subsection") or "", []).append(key)
+    return outline
+
+
+def _compile_excel(excel_path: Path) -> Dict[str, Any]:
+    schema = extract_schema_from_excel(excel_path)
+    return {
+        "schema": schema,
+        "fields": {key: entry["description"] for key, entry in schema.items()},
+        "outline": _outline_from_schema(schema),
+    }
+
+
+def get_excel_template(excel_path: Path = EXCEL_PATH) -> Dict[str, Any]:
+    """Returns the compiled artifact of the Excel GOA template (schema, fields, outline)."""
+    return _get_compiled("excel", [str(excel_path)], None, lambda: _compile_excel(Path(excel_path)))
+
+
+def get_excel_schema(excel_path: Path = EXCEL_PATH) -> Dict[str, Dict]:
+    """
+    Compiled replacement for form_generator.extract_schema_from_excel.
+
+    Returns:
+        Placeholder key -> schema entry (a copy the caller may modify)
+    """
+    try:
+        return copy.deepcopy(get_excel_template(excel_path)["schema"])
+    except Exception as e:
+        print(f"Error loading compiled Excel schema: {e}")
+        return {}
+
+
+def get_excel_fields(excel_path: Path = EXCEL_PATH) -> Dict[str, str]:
+    """
+    Compiled replacement for form_generator.get_all_fields_from_excel.
+
+    Returns:
+        Placeholder key -> description, in template order
+    """
+    try:
+        return copy.deepcopy(get_excel_template(excel_path)["fields"])
+    except Exception as e:
+        print(f"Error loading compiled Excel fields: {e}")
+        return {}
+
+
+def get_docx_schema(
+    template_path: str,
+    explicit_mappings: Optional[Dict[str, str]] = None,
+    is_sortstar: bool = False
+) -> Dict[str, Dict]:
+    """
+    Compiled replacement for template_utils.extract_placeholder_schema.
+
+    The explicit mappings and the SortStar flag are part of the artifact key, so
+    editing the mappings recompiles the schema.
+
+    Args:
+        template_path: The path to the Word document template
+        explicit_mappings: The explicit mappings for the given template type
+        is_sortstar: Flag to handle SortStar specific logic
+
+    Returns:
+        Placeholder key -> schema entry (a copy the caller may modify)
+    """
+    def compile_docx() -> Dict[str, Any]:
+        schema = template_utils.extract_placeholder_schema(
+            template_path=template_path,
+            explicit_mappings=explicit_mappings,
+            is_sortstar=is_sortstar
+        )
+        return {
+            "schema": schema,
+            "fields": {key: entry.get("description", key) for key, entry in schema.items()},
+            "outline": _outline_from_schema(schema),
+        }
+
+    try:
+        artifact = _get_compiled(
+            "docx", [template_path], {"mappings": explicit_mappings or {}, "is_sortstar": is_sortstar}, compile_docx
+        )
+        return copy.deepcopy(artifact["schema"])
+    except Exception as e:
+        print(f"Error loading compiled template schema for {template_path}: {e}")
+        return {}
+
+
+def clear_template_registry() -> None:
+    """Forgets the in-memory artifacts (persisted artifacts are kept)."""
+    with _REGISTRY_LOCK:
+        _REGISTRY.clear()
+
+
+# Compile (or load) the templates and time a steady-state lookup
+if __name__ == "__main__":
+    import time
+
+    for label, lookup in [
+        ("Excel schema", get_excel_schema),
+        ("SortStar schema", lambda: get_docx_schema(
+            os.path.join("templates", "goa_sortstar_temp.docx"), template_utils.SORTSTAR_EXPLICIT_MAPPINGS, True
+        )),
+    ]:
+        start = time.perf_counter()
+        schema = lookup()
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        lookup()
+        cached = time.perf_counter() - start
+        print(f"{label}: {len(schema)} fields, first lookup {first * 1e3:.1f}ms, cached {cached * 1e6:.0f}us")
+    print(f"Registry stats: {REGISTRY_STATS}")
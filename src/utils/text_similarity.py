@@ -0,0 +1,115 @@
+"""
+Text Similarity Helpers
+
+MinHash signatures and LSH banding for finding near-duplicate texts without
+comparing every pair, plus shared tokenization for Jaccard scoring.
+"""
+
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 1 << 31, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def tokenize(text: str) -> Set[str]:
+    """Lowercased word tokens of a text, as a set."""
+    return set((text or "").lower().split())
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """Hashed character shingles of the whitespace-normalized, lowercased text."""
+    normalized = re.sub(r"\s+", " ", (text or "").lower()).strip()
+    if len(normalized) <= size:
+        return {_hash32(normalized)} if normalized else set()
+    return {_hash32(normalized[i:i + size]) for i in range(len(normalized) - size + 1)}
+
+
+def _hash32(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """
+    Computes the MinHash signature of a text's character shingles.
+
+    Args:
+        text: Input text
+
+    Returns:
+        uint64 array of MINHASH_PERMUTATIONS values
+    """
+    values = np.fromiter(shingles(text), dtype=np.uint64)
+    if values.size == 0:
+        return np.full(MINHASH_PERMUTATIONS, _MERSENNE_PRIME, dtype=np.uint64)
+    hashed = (np.outer(_PERM_A, values) + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return hashed.min(axis=1)
+
+
+def estimated_jaccard(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+    """Estimates the Jaccard similarity of two texts from their MinHash signatures."""
+    return float(np.mean(signature_a == signature_b))
+
+
+def lsh_candidate_pairs(signatures: Dict[int, np.ndarray], bands: int = MINHASH_BANDS) -> Set[Tuple[int, int]]:
+    """
+    Returns pairs of keys whose signatures share at least one LSH band.
+
+    Args:
+        signatures: Key to MinHash signature
+        bands: Number of bands the signature is split into
+
+    Returns:
+        Set of (smaller key, larger key) candidate pairs
+    """
+    rows = MINHASH_PERMUTATIONS // bands
+    pairs = set()
+    for band in range(bands):
+        buckets: Dict[bytes, List[int]] = defaultdict(list)
+        for key, signature in signatures.items():
+            buckets[signature[band * rows:(band + 1) * rows].tobytes()].append(key)
+        for members in buckets.values():
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    pairs.add((min(members[i], members[j]), max(members[i], members[j])))
+    return pairs
+
+
+def near_duplicate_clusters(texts: Dict[int, str], threshold: float = 0.9) -> List[List[int]]:
+    """
+    Groups keys whose texts are near-duplicates (estimated Jaccard >= threshold).
+
+    Args:
+        texts: Key to text
+        threshold: Minimum estimated Jaccard similarity
+
+    Returns:
+        Clusters with more than one key, each sorted
+    """
+    signatures = {key: minhash_signature(text) for key, text in texts.items()}
+    parent = {key: key for key in texts}
+
+    def find(key: int) -> int:
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for a, b in lsh_candidate_pairs(signatures):
+        if estimated_jaccard(signatures[a], signatures[b]) >= threshold:
+            parent[find(a)] = find(b)
+
+    clusters: Dict[int, List[int]] = defaultdict(list)
+    for key in texts:
+        clusters[find(key)].append(key)
+    return [sorted(members) for members in clusters.values() if len(members) > 1]
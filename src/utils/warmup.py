@@ -0,0 +1,96 @@
+"""
+Background Warm-Up at App Start
+
+The first GOA of a fresh Streamlit process otherwise pays for all one-time setup:
+the Gemini clients, the FewShotManager with its embeddings, opening the example
+index and loading the examples of every field it touches. When enabled, this
+module does that work in a daemon thread at startup, starting with the fields
+whose examples are used most, so the first page renders immediately and the
+first GOA runs at steady-state latency.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.crm_utils import get_most_used_few_shot_fields
+from src.utils.llm_handler import configure_gemini_client, get_extraction_llm
+
+# Opt-in: GOA_WARMUP=1 starts the warm-up thread from app.py
+WARMUP_ENABLED = os.getenv("GOA_WARMUP", "0").lower() in ("1", "true", "yes")
+WARMUP_TOP_FIELDS = int(os.getenv("GOA_WARMUP_TOP_FIELDS", "50"))
+WARMUP_QUERY_TEXT = "Machine specification warm-up query"  # embedded once; never searched
+
+_WARMUP_THREAD: Optional[threading.Thread] = None
+_WARMUP_LOCK = threading.Lock()
+WARMUP_STATUS: Dict[str, Any] = {"state": "idle", "fields": 0, "seconds": None, "error": None}
+
+
+def warm_up(top_fields: int = WARMUP_TOP_FIELDS) -> Dict[str, Any]:
+    """
+    Builds the LLM clients and the few-shot manager and preloads the most used fields.
+
+    Args:
+        top_fields: Number of fields to preload, ranked by example usage_count
+
+    Returns:
+        The warm-up status (state, fields, seconds, error)
+    """
+    start = time.perf_counter()
+    WARMUP_STATUS.update(state="running", fields=0, seconds=None, error=None)
+    try:
+        configure_gemini_client()
+        get_extraction_llm()
+
+        # Imported here so a missing optional dependency only disables this step
+        from src.utils.few_shot_enhanced import CachedEmbeddings, get_few_shot_manager
+        manager = get_few_shot_manager()
+
+        by_template: Dict[Tuple[str, str], List[str]] = {}
+        for row in get_most_used_few_shot_fields(limit=top_fields):
+            by_template.setdefault((row["machine_type"], row["template_type"]), []).append(row["field_name"])
+
+        # Open the indexes without searching them: a lookup here would count as
+        # usage of the top fields and keep pushing them up the ranking
+        for (machine_type, template_type), field_names in by_template.items():
+            manager.preload_indexes(machine_type, template_type, field_names)
+            WARMUP_STATUS["fields"] += len(field_names)
+        if by_template:
+            # Bypass the embedding cache, which would answer from SQLite after the
+            # first run, so the query really reaches (and warms) the embedding client
+            embeddings = manager.embeddings
+            if isinstance(embeddings, CachedEmbeddings):
+                embeddings = embeddings.embeddings
+            embeddings.embed_query(WARMUP_QUERY_TEXT)
+
+        WARMUP_STATUS["state"] = "done"
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        WARMUP_STATUS.update(state="failed", error=str(e))
+    WARMUP_STATUS["seconds"] = time.perf_counter() - start
+    print(f"Warm-up {WARMUP_STATUS['state']}: {WARMUP_STATUS['fields']} field(s) in {WARMUP_STATUS['seconds']:.1f}s")
+    return WARMUP_STATUS
+
+
+def start_background_warmup(force: bool = False) -> Optional[threading.Thread]:
+    """
+    Starts the warm-up in a daemon thread, once per process.
+
+    Streamlit re-runs the script on every interaction, so repeated calls return
+    the thread that was already started.
+
+    Args:
+        force: Start even if GOA_WARMUP is not enabled
+
+    Returns:
+        The warm-up thread, or None if warm-up is disabled
+    """
+    global _WARMUP_THREAD
+    if not (WARMUP_ENABLED or force):
+        return None
+    with _WARMUP_LOCK:
+        if _WARMUP_THREAD is None:
+            _WARMUP_THREAD = threading.Thread(target=warm_up, name="goa-warmup", daemon=True)
+            _WARMUP_THREAD.start()
+    return _WARMUP_THREAD
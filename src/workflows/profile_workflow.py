@@ -542,8 +542,8 @@ def handle_selected_action(action, profile_data):
         # Set processing step to 3 (machine processing) to skip selection steps
         st.session_state.processing_step = 3
         
-        from src.utils.form_generator import extract_schema_from_excel
-        st.session_state.template_contexts = extract_schema_from_excel()
+        from src.utils.template_registry import get_excel_schema
+        st.session_state.template_contexts = get_excel_schema()
         
         # Load the machine data from the profile
         machines_data = profile_data.get("machines_data", {})
@@ -0,0 +1,88 @@
+import os
+import zipfile
+from xml.etree import ElementTree
+
+from docx import Document
+
+import src.utils.doc_filler as doc_filler
+
+
+def _write_template(path, rows):
+    doc = Document()
+    table = doc.add_table(rows=len(rows), cols=2)
+    for row, values in zip(table.rows, rows):
+        for cell, value in zip(row.cells, values):
+            cell.text = value
+    doc.save(path)
+
+
+def _cell_texts(path):
+    return [[cell.text for cell in row.cells] for row in Document(path).tables[0].rows]
+
+
+def test_placeholders_are_resolved_in_one_pass(tmp_path):
+    template = str(tmp_path / "template.docx")
+    output = str(tmp_path / "filled.docx")
+    _write_template(template, [
+        ["Voltage: {{ voltage }} / {{frequency}}", "{{ light_curtain_check }} Light curtain"],
+        ["{{ unknown_field }}", "No placeholder"],
+        ["{{ path }}", "{{ door_check }} Door"],
+    ])
+
+    data = {"voltage": "480V", "frequency": "60Hz", "light_curtain_check": "YES",
+            "path": r"C:\new\table", "door_check": "NO"}
+    doc_filler.fill_word_document_from_llm_data(template, data, output)
+    assert _cell_texts(output) == [
+        ["Voltage: 480V / 60Hz", "☑ Light curtain"],
+        ["{{ unknown_field }}", "No placeholder"],
+        [r"C:\new\table", "☐ Door"],
+    ]
+    filled_cell = Document(output).tables[0].rows[0].cells[0]
+    assert all(run.bold for paragraph in filled_cell.paragraphs for run in paragraph.runs)
+
+
+def test_template_is_parsed_once_until_it_changes(tmp_path):
+    template = str(tmp_path / "template.docx")
+    _write_template(template, [["{{ a }}", "static"]])
+
+    parsed = doc_filler.get_docx_template(template)
+    assert doc_filler.get_docx_template(template) is parsed
+    assert [(p.tokens, p.tail) for p in parsed.cell_plans] == [([("", "a", "{{ a }}")], "")]
+
+    # Fills work on copies: the cached tree keeps its placeholders
+    doc_filler.fill_word_document_from_llm_data(template, {"a": "1"}, str(tmp_path / "one.docx"))
+    doc_filler.fill_word_document_from_llm_data(template, {"a": "2"}, str(tmp_path / "two.docx"))
+    assert _cell_texts(str(tmp_path / "one.docx"))[0][0] == "1"
+    assert _cell_texts(str(tmp_path / "two.docx"))[0][0] == "2"
+    assert doc_filler.get_docx_template(template) is parsed
+
+    _write_template(template, [["{{ a }}", "{{ b }}"]])
+    os.utime(template, ns=(1, 1))
+    reparsed = doc_filler.get_docx_template(template)
+    assert reparsed is not parsed and len(reparsed.cell_plans) == 2
+
+
+def test_filled_package_is_a_valid_docx(tmp_path):
+    template = str(tmp_path / "template.docx")
+    output = str(tmp_path / "filled.docx")
+    _write_template(template, [["{{ a }}", "{{ b_check }} B"]])
+    doc_filler.fill_word_document_from_llm_data(template, {"a": "1", "b_check": "YES"}, output)
+
+    # The package opens and the rewritten part is the one Word reads
+    assert [[cell.text for cell in row.cells] for row in Document(output).tables[0].rows] == [["1", "☑ B"]]
+
+    with zipfile.ZipFile(output) as package, zipfile.ZipFile(template) as source:
+        names = package.namelist()
+        assert len(names) == len(set(names))
+        assert sorted(names) == sorted(source.namelist())
+        # [Content_Types].xml stays the first entry and still types every part
+        assert names[0] == "[Content_Types].xml"
+        types = ElementTree.fromstring(package.read("[Content_Types].xml"))
+        namespace = "{http://schemas.openxmlformats.org/package/2006/content-types}"
+        defaults = {d.get("Extension").lower() for d in types.iter(f"{namespace}Default")}
+        overrides = {o.get("PartName"): o.get("ContentType") for o in types.iter(f"{namespace}Override")}
+        for name in names[1:]:
+            extension = name.rsplit(".", 1)[-1].lower()
+            assert f"/{name}" in overrides or extension in defaults, name
+        assert overrides["/word/document.xml"].endswith("document.main+xml")
+        assert package.getinfo("word/document.xml").compress_type == zipfile.ZIP_DEFLATED
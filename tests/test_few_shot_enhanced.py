@@ -0,0 +1,463 @@
+import os
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+import src.utils.few_shot_enhanced as few_shot_enhanced
+from src.utils import numpy_vector_index
+from src.utils.few_shot_enhanced import FewShotManager, CachedEmbeddings
+
+
+EXAMPLES = {
+    ("filling", "default", "voltage"): [
+        {"id": 1, "input_context": "Machine: Filler 480V three phase", "expected_output": "480V", "confidence_score": 0.9},
+        {"id": 2, "input_context": "Machine: Filler 220V single phase", "expected_output": "220V", "confidence_score": 0.8},
+    ],
+    ("filling", "default", "fat_check"): [
+        {"id": 3, "input_context": "Machine: Filler with Factory Acceptance Test", "expected_output": "YES", "confidence_score": 0.9},
+    ],
+}
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    examples = {key: list(rows) for key, rows in EXAMPLES.items()}
+
+    def get_all_few_shot_examples(limit_per_field=50, machine_type=None, template_type=None, field_names=None):
+        return [
+            {**ex, "machine_type": key[0], "template_type": key[1], "field_name": key[2]}
+            for key, rows in examples.items()
+            if machine_type in (None, key[0]) and template_type in (None, key[1])
+            and (field_names is None or key[2] in field_names)
+            for ex in rows[:limit_per_field]
+        ]
+
+    def get_few_shot_examples(*args, **kwargs):
+        raise AssertionError("indexing must not read through the usage-counting get_few_shot_examples")
+
+    monkeypatch.setattr(few_shot_enhanced, "get_all_few_shot_examples", get_all_few_shot_examples)
+    monkeypatch.setattr(few_shot_enhanced, "get_few_shot_examples", get_few_shot_examples)
+    monkeypatch.setattr(few_shot_enhanced, "FEW_SHOT_INDEX_DIRECTORY", str(tmp_path / "index"))
+    monkeypatch.setattr(few_shot_enhanced, "EMBEDDING_CACHE_PATH", str(tmp_path / "embedding_cache.sqlite3"))
+
+    mgr = FewShotManager(api_key="test-key")
+    mgr.embeddings = DeterministicFakeEmbedding(size=32)
+    mgr.examples = examples
+    yield mgr
+    mgr.shutdown_vectorstore()
+
+
+def test_fields_share_one_store_and_are_filtered(manager):
+    voltage = manager.select_best_examples("Filler 480V", "filling", "default", "voltage", k=5)
+    fat = manager.select_best_examples("Filler FAT", "filling", "default", "fat_check", k=5)
+
+    assert {ex["example_id"] for ex in voltage} == {1, 2}
+    assert [ex["example_id"] for ex in fat] == [3]
+    assert set(voltage[0]) == set(few_shot_enhanced.EXAMPLE_KEYS)
+    assert manager.get_vectorstore()._collection.count() == 3
+
+
+def test_new_example_is_indexed_without_new_store(manager):
+    manager.select_best_examples("Filler", "filling", "default", "voltage", k=5)
+    manager.examples[("filling", "default", "hmi_size")] = [
+        {"id": 4, "input_context": "Machine: Filler with 10 inch HMI", "expected_output": "10 inch", "confidence_score": 1.0},
+    ]
+
+    selected = manager.select_best_examples("Filler HMI", "filling", "default", "hmi_size", k=5)
+    assert [ex["example_id"] for ex in selected] == [4]
+    assert manager.get_vectorstore()._collection.count() == 2 + 1
+
+
+def test_invalidate_removes_only_that_field(manager):
+    manager.select_best_examples("Filler", "filling", "default", "voltage", k=5)
+    manager.select_best_examples("Filler", "filling", "default", "fat_check", k=5)
+
+    manager.invalidate_cache("filling", "default", "voltage")
+    assert manager.get_vectorstore()._collection.count() == 1
+
+    # Re-indexed on next access
+    assert len(manager.select_best_examples("Filler", "filling", "default", "voltage", k=5)) == 2
+
+
+def test_numpy_backend_selects_and_persists(manager, tmp_path):
+    manager.index_backend = "numpy"
+    manager.persist_directory = str(tmp_path / "numpy")
+
+    voltage = manager.select_best_examples("Machine: Filler 480V three phase", "filling", "default", "voltage", k=1)
+    assert [ex["example_id"] for ex in voltage] == [1]
+    assert set(voltage[0]) == set(few_shot_enhanced.EXAMPLE_KEYS)
+
+    # A fresh index loads the memory-mapped matrix from disk
+    reloaded = few_shot_enhanced.NumpyVectorIndex(manager.persist_directory, "filling_default_voltage")
+    assert reloaded.ids == {"1", "2"}
+
+    manager.invalidate_cache("filling", "default", "voltage")
+    assert len(manager.get_numpy_index("filling_default_voltage")) == 0
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_batch_selection_embeds_query_once(manager, tmp_path, monkeypatch, backend):
+    manager.index_backend = backend
+    manager.persist_directory = str(tmp_path / backend)
+    fields = ["voltage", "fat_check", "missing_field"]
+    expected = {
+        field: manager.select_best_examples("Filler 480V FAT", "filling", "default", field, k=2)
+        for field in fields
+    }
+
+    query_calls = []
+    embed_query = DeterministicFakeEmbedding.embed_query
+    monkeypatch.setattr(DeterministicFakeEmbedding, "embed_query",
+                        lambda self, text: query_calls.append(text) or embed_query(self, text))
+
+    # Every field is read in one query and synced once, without building selectors
+    reads, syncs = [], []
+    get_all = few_shot_enhanced.get_all_few_shot_examples
+    monkeypatch.setattr(few_shot_enhanced, "get_all_few_shot_examples",
+                        lambda **kwargs: reads.append(kwargs["field_names"]) or get_all(**kwargs))
+    sync_index = FewShotManager._sync_index
+    monkeypatch.setattr(FewShotManager, "_sync_index",
+                        lambda self, *args: syncs.append(sorted(args[2])) or sync_index(self, *args))
+    monkeypatch.setattr(FewShotManager, "get_example_selector", lambda *args: pytest.fail("no selector needed"))
+
+    batch = manager.select_best_examples_batch("Filler 480V FAT", "filling", "default", fields, k=2)
+    assert query_calls == ["Filler 480V FAT"]
+    assert reads == [fields]
+    assert syncs == [["fat_check", "voltage"]]
+    assert set(batch) == {"voltage", "fat_check"}
+    for field in batch:
+        assert [ex["example_id"] for ex in batch[field]] == [ex["example_id"] for ex in expected[field]]
+
+
+class CountingEmbedding(Embeddings):
+    def __init__(self):
+        self.fake = DeterministicFakeEmbedding(size=16)
+        self.documents = 0
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self.fake.embed_query(text)
+
+
+def test_cached_embeddings_only_embed_new_texts(tmp_path):
+    cache_path = str(tmp_path / "cache.sqlite3")
+    inner = CountingEmbedding()
+    cached = CachedEmbeddings(inner, "fake-model", cache_path=cache_path, memory_size=2)
+
+    first = cached.embed_documents(["a  text", "other", "a text"])
+    assert inner.documents == 2  # whitespace-normalized duplicates are embedded once
+    assert first[0] == first[2]
+
+    cached.embed_documents(["a text", "new"])
+    assert inner.documents == 3
+
+    cached.embed_query("a text")
+    cached.embed_query("a text")
+    assert inner.queries == 1  # queries are cached separately from documents
+
+    # A new process reuses the persisted vectors
+    reopened = CachedEmbeddings(CountingEmbedding(), "fake-model", cache_path=cache_path)
+    assert reopened.embed_documents(["other"]) == [cached.embed_documents(["other"])[0]]
+    assert reopened.embeddings.documents == 0
+    assert reopened.hits == 1 and reopened.misses == 0
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_new_examples_are_appended_in_one_batch(manager, tmp_path, backend):
+    manager.index_backend = backend
+    manager.persist_directory = str(tmp_path / backend)
+    inner = CountingEmbedding()
+    manager.embeddings = inner
+
+    manager.index_new_examples("filling", "default", ["voltage", "fat_check"])
+    assert inner.documents == 3
+
+    # A new GOA adds one example per field: only those two are embedded
+    manager.examples[("filling", "default", "voltage")].append(
+        {"id": 5, "input_context": "Machine: Filler 600V", "expected_output": "600V", "confidence_score": 0.75})
+    manager.examples[("filling", "default", "fat_check")].append(
+        {"id": 6, "input_context": "Machine: Filler FAT included", "expected_output": "YES", "confidence_score": 0.75})
+    calls_before = inner.documents
+    assert manager.index_new_examples("filling", "default", ["voltage", "fat_check"]) == 2
+    assert inner.documents - calls_before == 2
+
+    selected = manager.select_best_examples("Filler 600V", "filling", "default", "voltage", k=5)
+    assert {ex["example_id"] for ex in selected} == {1, 2, 5}
+
+    manager.compact_index()
+    assert manager.select_best_examples("Filler", "filling", "default", "fat_check", k=5)
+
+
+def test_local_embeddings_rank_similar_text_first():
+    from src.utils.local_embeddings import HashedTfidfEmbeddings
+
+    corpus = [ex["input_context"] for rows in EXAMPLES.values() for ex in rows]
+    embeddings = HashedTfidfEmbeddings(n_features=1024).fit(corpus)
+    query = np.array(embeddings.embed_query("filler 480 V three-phase"))
+    scores = [float(query @ np.array(vector)) for vector in embeddings.embed_documents(corpus)]
+
+    assert int(np.argmax(scores)) == 0
+    assert np.isclose(np.linalg.norm(query), 1.0)
+    assert embeddings.embed_documents(["a"]) == embeddings.embed_documents(["a"])
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_local_embedding_backend_needs_no_api_key(manager, tmp_path, monkeypatch, backend):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.setattr(few_shot_enhanced, "FEW_SHOT_EMBEDDING_BACKEND", "local")
+    monkeypatch.setattr(few_shot_enhanced, "FEW_SHOT_INDEX_BACKEND", backend)
+    monkeypatch.setattr(few_shot_enhanced, "FEW_SHOT_NUMPY_INDEX_DIRECTORY", str(tmp_path / "numpy"))
+    monkeypatch.setattr(few_shot_enhanced, "LOCAL_EMBEDDING_IDF_PATH", str(tmp_path / "idf.npy"))
+    monkeypatch.setattr(few_shot_enhanced, "get_few_shot_contexts",
+                        lambda: [ex["input_context"] for rows in manager.examples.values() for ex in rows])
+
+    local_manager = FewShotManager()
+    assert (tmp_path / "idf.npy").exists()
+    selected = local_manager.select_best_examples("Filler 220V single phase", "filling", "default", "voltage", k=1)
+    assert [ex["example_id"] for ex in selected] == [2]
+    local_manager.shutdown_vectorstore()
+
+
+def test_local_embeddings_are_refit_on_rebuild(manager, tmp_path, monkeypatch):
+    monkeypatch.setattr(few_shot_enhanced, "FEW_SHOT_EMBEDDING_BACKEND", "local")
+    monkeypatch.setattr(few_shot_enhanced, "FEW_SHOT_INDEX_BACKEND", "numpy")
+    monkeypatch.setattr(few_shot_enhanced, "FEW_SHOT_NUMPY_INDEX_DIRECTORY", str(tmp_path / "numpy"))
+    monkeypatch.setattr(few_shot_enhanced, "LOCAL_EMBEDDING_IDF_PATH", str(tmp_path / "idf.npy"))
+    contexts = []
+    monkeypatch.setattr(few_shot_enhanced, "get_few_shot_contexts", lambda: list(contexts))
+
+    # Nothing to fit on yet: the weights stay unfitted and are not persisted
+    local_manager = FewShotManager()
+    assert not (tmp_path / "idf.npy").exists()
+    assert np.all(local_manager.embeddings.idf == 1)
+
+    contexts.extend(ex["input_context"] for rows in manager.examples.values() for ex in rows)
+    local_manager.rebuild_all_indexes()
+    assert (tmp_path / "idf.npy").exists()
+    assert not np.all(local_manager.embeddings.idf == 1)
+    selected = local_manager.select_best_examples("Filler 220V single phase", "filling", "default", "voltage", k=1)
+    assert [ex["example_id"] for ex in selected] == [2]
+    local_manager.shutdown_vectorstore()
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_concurrent_requests_index_a_field_once(manager, tmp_path, backend):
+    from concurrent.futures import ThreadPoolExecutor
+
+    manager.index_backend = backend
+    manager.persist_directory = str(tmp_path / backend)
+    inner = CountingEmbedding()
+    manager.embeddings = inner
+
+    def select(i):
+        field = "voltage" if i % 2 else "fat_check"
+        return manager.select_best_examples(f"Filler {i}", "filling", "default", field, k=5)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(select, range(32)))
+
+    assert inner.documents == 3  # each example embedded once despite 32 concurrent requests
+    assert all(len(selected) == (2 if i % 2 else 1) for i, selected in enumerate(results))
+
+    # Dropping the index while other threads search is safe
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(select, i) for i in range(8)] + [pool.submit(manager.compact_index)]
+        for future in futures:
+            future.result()
+
+
+def test_open_numpy_indexes_are_bounded(manager, tmp_path):
+    manager.index_backend = "numpy"
+    manager.persist_directory = str(tmp_path / "numpy")
+    manager.max_open_indexes = 2
+    manager.examples[("filling", "default", "hmi_size")] = [
+        {"id": 4, "input_context": "Machine: Filler with 10 inch HMI", "expected_output": "10 inch", "confidence_score": 1.0},
+    ]
+
+    for field in ("voltage", "fat_check", "hmi_size"):
+        assert manager.select_best_examples("Filler", "filling", "default", field, k=5)
+    stats = manager.get_store_stats()
+    assert (stats["opens"], stats["evictions"], stats["open_indexes"]) == (3, 1, 2)
+    assert stats["resident_bytes"] > 0
+
+    # The evicted field is reopened from disk without re-embedding
+    assert len(manager.select_best_examples("Filler", "filling", "default", "voltage", k=5)) == 2
+    assert manager.get_store_stats()["opens"] == 4
+
+    # The memory bound keeps only the most recent index open
+    manager.max_resident_bytes = 1
+    manager.select_best_examples("Filler", "filling", "default", "fat_check", k=5)
+    assert manager.get_store_stats()["open_indexes"] == 1
+
+
+def test_selector_reopens_evicted_index_through_manager(manager, tmp_path):
+    manager.index_backend = "numpy"
+    manager.persist_directory = str(tmp_path / "numpy")
+    manager.max_open_indexes = 1
+
+    selector = manager.get_example_selector("filling", "default", "voltage", k=1)
+    evicted = manager.get_numpy_index("filling_default_voltage")
+    manager.get_numpy_index("filling_default_fat_check")
+    # An evicted index is not remapped behind the manager's back
+    assert evicted.closed
+    assert evicted.search(np.ones(32), 1) == [] and len(evicted) == 0
+
+    hits = selector.select_examples({"input_context": "Machine: Filler 480V three phase"})
+    assert [ex["example_id"] for ex in hits] == [1]
+    assert evicted.closed
+    stats = manager.get_store_stats()
+    assert (stats["opens"], stats["evictions"], stats["open_indexes"]) == (3, 2, 1)
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self, blocking=True):
+        self.acquired += 1
+        return True
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_rebuild_swaps_in_complete_index(manager, tmp_path, monkeypatch, backend):
+    inner = CountingEmbedding()
+    manager.embeddings = CachedEmbeddings(inner, "fake-model", cache_path=str(tmp_path / "rebuild_cache.sqlite3"))
+    manager.index_backend = backend
+    manager.index_root = manager.persist_directory = str(tmp_path / f"{backend}_root")
+
+    # A second process serving requests from the same index root
+    other = FewShotManager(api_key="test-key")
+    other.embeddings = manager.embeddings
+    other.index_backend = backend
+    other.index_root = other.persist_directory = manager.index_root
+
+    limiter = CountingLimiter()
+    stats = manager.rebuild_all_indexes(batch_size=2, rate_limiter=limiter)
+    assert (stats["fields"], stats["examples"], stats["texts"]) == (2, 3, 3)
+    assert stats["embedding_requests"] == limiter.acquired == 2
+    assert manager.persist_directory.endswith(stats["build"])
+
+    # Requests search the new build without embedding any document
+    for mgr in (manager, other):
+        voltage = mgr.select_best_examples("Machine: Filler 480V three phase", "filling", "default", "voltage", k=1)
+        assert [ex["example_id"] for ex in voltage] == [1]
+        assert mgr.persist_directory == manager.persist_directory
+    assert inner.documents == 3
+
+    # Rebuilding again costs no embedding request; the build `other` still serves is not pruned
+    builds_directory = os.path.join(manager.index_root, "builds")
+    for _ in range(2):
+        assert manager.rebuild_all_indexes(batch_size=2, rate_limiter=limiter)["embedding_requests"] == 0
+    assert len(os.listdir(builds_directory)) == 3 and stats["build"] in os.listdir(builds_directory)
+
+    # Once it switched, old builds are pruned down to the current and the previous one
+    other.get_example_selector("filling", "default", "voltage")
+    assert other.persist_directory == manager.persist_directory
+    manager.rebuild_all_indexes(batch_size=2, rate_limiter=limiter)
+    other.shutdown_vectorstore()
+    assert len(os.listdir(builds_directory)) == 2
+    assert os.path.basename(other.persist_directory) in os.listdir(builds_directory)
+
+
+def test_held_selector_follows_swapped_build(manager, tmp_path):
+    manager.index_backend = "numpy"
+    manager.index_root = manager.persist_directory = str(tmp_path / "numpy_root")
+    selector = manager.get_example_selector("filling", "default", "voltage", k=1)
+
+    # Another process rebuilds and swaps CURRENT
+    builder = FewShotManager(api_key="test-key")
+    builder.embeddings = manager.embeddings
+    builder.index_backend = "numpy"
+    builder.index_root = builder.persist_directory = manager.index_root
+    build = builder.rebuild_all_indexes(batch_size=2, rate_limiter=CountingLimiter())["build"]
+
+    hits = selector.select_examples({"input_context": "Machine: Filler 480V three phase"})
+    assert [ex["example_id"] for ex in hits] == [1]
+    assert manager.persist_directory.endswith(build)
+
+
+def test_compaction_rebuilds_all_indexes_once(monkeypatch):
+    calls = []
+
+    class Manager:
+        def rebuild_all_indexes(self):
+            calls.append("rebuild")
+
+        def compact_index(self):
+            calls.append("drop")
+
+    monkeypatch.setattr(few_shot_enhanced, "get_few_shot_manager", lambda: Manager())
+    stats = {"examined": 3, "merged": 1, "evicted": 0, "contexts_removed": 0, "remaining": 2}
+    monkeypatch.setattr(few_shot_enhanced, "compact_few_shot_examples", lambda **kwargs: dict(stats))
+    few_shot_enhanced.compact_few_shot_store()
+    assert calls == ["rebuild"]
+
+    stats.update(merged=0)
+    few_shot_enhanced.compact_few_shot_store()
+    assert calls == ["rebuild"]
+
+
+def test_preload_opens_indexes_without_searching(manager, tmp_path, monkeypatch):
+    manager.index_backend = "numpy"
+    manager.persist_directory = str(tmp_path / "numpy")
+    monkeypatch.setattr(FewShotManager, "_search_field", lambda *args: pytest.fail("preload must not search"))
+
+    assert manager.preload_indexes("filling", "default", ["voltage", "fat_check"]) == 3
+    assert manager.get_store_stats()["open_indexes"] == 2
+    assert manager.preload_indexes("filling", "default", ["voltage"]) == 0
+
+
+def test_legacy_field_stores_are_removed_once(tmp_path):
+    legacy = tmp_path / "few_shot_embeddings"
+    for field in ("general_default_f0002", "sortstar_sortstar_customer"):
+        (legacy / field).mkdir(parents=True)
+        (legacy / field / "chroma.sqlite3").write_bytes(b"")
+
+    assert few_shot_enhanced.remove_legacy_field_stores(str(legacy)) == 2
+    assert not legacy.exists()
+    assert few_shot_enhanced.remove_legacy_field_stores(str(legacy)) == 0
+
+
+def test_numpy_index_appends_and_removes_without_rewriting(tmp_path):
+    directory = str(tmp_path / "numpy")
+    index = few_shot_enhanced.NumpyVectorIndex(directory, "field")
+    vectors = np.eye(4, dtype=np.float32)
+    index.add(vectors[:2], ["1", "2"], [{"example_id": 1}, {"example_id": 2}])
+    base_stat = os.stat(index.matrix_path)
+
+    # Appends and removals go to the delta log; the mapped base file is untouched
+    index.add(vectors[2:3], ["3"], [{"example_id": 3}])
+    index.remove(["1", "unknown"])
+    assert os.stat(index.matrix_path).st_mtime_ns == base_stat.st_mtime_ns
+    assert index.ids == {"2", "3"} and len(index) == 2
+    assert [hit["example_id"] for hit in index.search(vectors[0] + vectors[2], 5)] == [3, 2]
+
+    reloaded = few_shot_enhanced.NumpyVectorIndex(directory, "field")
+    assert reloaded.ids == {"2", "3"}
+    assert [hit["example_id"] for hit in reloaded.search(vectors[2], 1)] == [3]
+
+    # Once the log outgrows the threshold it is merged into the base files, dropping removed rows
+    appended = numpy_vector_index.DELTA_COMPACT_MIN_ENTRIES - 1
+    for i in range(4, 4 + appended):
+        index.add(vectors[i % 4:i % 4 + 1], [str(i)], [{"example_id": i}])
+    assert not os.path.exists(index.delta_log_path)
+    assert len(np.load(index.matrix_path)) == len(index) == 2 + appended
+    assert "1" not in few_shot_enhanced.NumpyVectorIndex(directory, "field").ids
+
+
+@pytest.mark.parametrize("backend", ["chroma", "numpy"])
+def test_examples_leaving_the_top_n_are_removed_from_the_index(manager, tmp_path, backend):
+    manager.index_backend = backend
+    manager.persist_directory = str(tmp_path / backend)
+    assert len(manager.select_best_examples("Filler 480V", "filling", "default", "voltage", k=5)) == 2
+
+    # Example 2 is evicted from the database; the next sync drops it from the index
+    manager.examples[("filling", "default", "voltage")].pop()
+    assert [ex["example_id"] for ex in manager.select_best_examples("Filler 220V", "filling", "default", "voltage", k=5)] == [1]
+    assert manager._indexed_id_set("filling_default_voltage") == {"1"}
@@ -0,0 +1,233 @@
+import sqlite3
+
+import pytest
+
+from src.utils.crm_utils import init_db, insert_few_shot_examples, save_few_shot_examples_bulk, save_few_shot_example
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "crm_test.db")
+    init_db(path)
+    return path
+
+
+def _example(field_name, value, context="Main Item: Filler FC 11\nPDF Context: 480V"):
+    return {
+        "machine_type": "filling",
+        "template_type": "default",
+        "field_name": field_name,
+        "input_context": context,
+        "expected_output": value,
+        "confidence_score": 0.75,
+    }
+
+
+def _count(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM few_shot_examples").fetchone()[0]
+
+
+def test_bulk_save_inserts_once_and_dedupes(db_path):
+    examples = [_example("voltage", "480V"), _example("fat_check", "YES"), _example("fat_check", "YES")]
+    assert save_few_shot_examples_bulk(examples, db_path=db_path) == 2
+
+    # Same extraction again (whitespace differences included) is not stored twice
+    again = [_example("voltage", "480V", context="Main Item:  Filler FC 11\nPDF Context:   480V")]
+    assert save_few_shot_examples_bulk(again, db_path=db_path) == 0
+
+    # A different value or context is a new example
+    assert save_few_shot_examples_bulk([_example("voltage", "600V")], db_path=db_path) == 1
+    assert _count(db_path) == 3
+
+
+
+def test_insert_reports_only_new_examples(db_path):
+    save_few_shot_examples_bulk([_example("voltage", "480V")], db_path=db_path)
+    inserted = insert_few_shot_examples([_example("voltage", "480V"), _example("fat_check", "YES")], db_path=db_path)
+    assert [ex["field_name"] for ex in inserted] == ["fat_check"]
+
+def test_single_save_is_seen_by_bulk_dedupe(db_path):
+    assert save_few_shot_example("filling", "default", "voltage", "ctx", "480V", db_path=db_path)
+    assert save_few_shot_examples_bulk([_example("voltage", "480V", context="ctx")], db_path=db_path) == 0
+
+
+def test_fields_of_one_machine_share_one_stored_context(db_path):
+    from src.utils.crm_utils import get_few_shot_examples
+
+    examples = [_example(f"field_{i}", "YES") for i in range(20)]
+    assert save_few_shot_examples_bulk(examples, db_path=db_path) == 20
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM few_shot_contexts").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(DISTINCT context_id) FROM few_shot_examples").fetchone()[0] == 1
+
+    rows = get_few_shot_examples("filling", "default", "field_3", db_path=db_path)
+    assert rows[0]["input_context"] == _example("field_3", "YES")["input_context"]
+
+
+def test_legacy_inline_contexts_are_migrated(db_path):
+    from src.utils.crm_utils import get_few_shot_examples
+
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("""
+        INSERT INTO few_shot_examples (machine_type, template_type, field_name, input_context, expected_output, created_date)
+        VALUES ('filling', 'default', ?, 'Legacy context', 'YES', '2024-01-01 00:00:00')
+        """, [("a_check",), ("b_check",)])
+
+    # Readable before and after migration
+    assert get_few_shot_examples("filling", "default", "a_check", db_path=db_path)[0]["input_context"] == "Legacy context"
+    init_db(db_path)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM few_shot_contexts").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM few_shot_examples WHERE input_context != ''").fetchone()[0] == 0
+    assert get_few_shot_examples("filling", "default", "b_check", db_path=db_path)[0]["input_context"] == "Legacy context"
+
+
+def test_compaction_merges_near_duplicates_and_caps_fields(db_path):
+    from src.utils.crm_utils import compact_few_shot_examples, add_few_shot_feedback
+
+    base = "Main Item: Filler FC 11 with 480V three phase supply, Allen Bradley PLC, 10 inch HMI and FAT"
+    examples = [
+        _example("voltage", "480V", context=base),
+        _example("voltage", "480V", context=base + "."),  # near-duplicate, same output
+        _example("voltage", "600V", context=base + "."),  # same context, different output
+        _example("voltage", "480V", context="Labeler LS 200 running on 480V"),
+    ]
+    examples += [dict(_example("hmi_size", f"{i} inch", context=f"HMI option {i}"), confidence_score=i / 10)
+                 for i in range(1, 6)]
+    assert save_few_shot_examples_bulk(examples, db_path=db_path) == 9
+
+    with sqlite3.connect(db_path) as conn:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM few_shot_examples WHERE field_name = 'voltage' AND expected_output = '480V' ORDER BY id")]
+        conn.execute("UPDATE few_shot_examples SET usage_count = 4, success_count = 3 WHERE id = ?", (ids[0],))
+        conn.execute("UPDATE few_shot_examples SET usage_count = 2, success_count = 2, confidence_score = 0.9 WHERE id = ?",
+                     (ids[1],))
+    assert add_few_shot_feedback(ids[0], "confirmation", db_path=db_path)
+    with sqlite3.connect(db_path) as conn:
+        hmi_ids = dict(conn.execute("SELECT expected_output, id FROM few_shot_examples WHERE field_name = 'hmi_size'"))
+    assert add_few_shot_feedback(hmi_ids["1 inch"], "correction", "1 inch", "2 inch", db_path=db_path)
+
+    stats = compact_few_shot_examples(max_per_field=3, db_path=db_path)
+    assert stats["merged"] == 1 and stats["evicted"] == 2
+    assert stats["remaining"] == _count(db_path) == 6
+
+    with sqlite3.connect(db_path) as conn:
+        # Survivor has the best quality and the summed counters; feedback follows it
+        survivor = conn.execute("""
+            SELECT id, usage_count, success_count, confidence_score FROM few_shot_examples
+            WHERE field_name = 'voltage' AND expected_output = '480V' AND id IN (?, ?)
+        """, ids[:2]).fetchall()
+        assert survivor == [(ids[1], 6, 3 + 1 + 2, 0.9)]
+        assert conn.execute("SELECT example_id FROM few_shot_feedback WHERE feedback_type = 'confirmation'").fetchall() == [(ids[1],)]
+        # Feedback of an evicted example moves to the field's best remaining example
+        assert conn.execute("SELECT example_id, corrected_value FROM few_shot_feedback WHERE feedback_type = 'correction'"
+                            ).fetchall() == [(hmi_ids["5 inch"], "2 inch")]
+
+        # The cap keeps the highest-confidence examples
+        kept = conn.execute("SELECT expected_output FROM few_shot_examples WHERE field_name = 'hmi_size'").fetchall()
+        assert sorted(kept) == [("3 inch",), ("4 inch",), ("5 inch",)]
+        assert conn.execute("SELECT COUNT(*) FROM few_shot_contexts").fetchone()[0] == 2 + 3
+
+
+def _scan_similar(db_path, input_text, machine_type, template_type, limit):
+    """Reference implementation: full scan with Python Jaccard scoring."""
+    input_words = set(input_text.lower().split())
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("""
+            SELECT e.id, c.input_context, e.confidence_score, e.success_count
+            FROM few_shot_examples e JOIN few_shot_contexts c ON c.id = e.context_id
+            WHERE e.machine_type = ? AND e.template_type = ?
+        """, (machine_type, template_type)).fetchall()
+    scored = []
+    for example_id, context, confidence, successes in rows:
+        words = set(context.lower().split())
+        similarity = len(input_words & words) / len(input_words | words)
+        if similarity > 0.1:
+            scored.append((-similarity, -confidence, -successes, example_id))
+    return [key[-1] for key in sorted(scored)[:limit]]
+
+
+def test_similar_examples_use_token_index(db_path):
+    from src.utils.crm_utils import get_similar_examples
+
+    contexts = ["Filler 480V three phase", "Filler 220V single phase", "Capper with torque control",
+                "filler   480V  with FAT", "Labeler LS 200"]
+    save_few_shot_examples_bulk([_example("voltage", "V", context=c) for c in contexts], db_path=db_path)
+    # A context saved once is indexed once, even if it is reused
+    save_few_shot_example("filling", "default", "fat_check", contexts[3], "YES", db_path=db_path)
+
+    results = get_similar_examples("FILLER 480V", "filling", "default", limit=10, db_path=db_path)
+    assert [r["id"] for r in results] == _scan_similar(db_path, "FILLER 480V", "filling", "default", 10)
+    assert results[0]["similarity"] == pytest.approx(2 / 4)
+    assert get_similar_examples("no match here", "filling", "default", db_path=db_path) == []
+    assert get_similar_examples("Filler 480V", "labeling", "default", db_path=db_path) == []
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM few_shot_context_tokens").fetchone()[0] == 4 + 4 + 4 + 4 + 3
+        assert conn.execute("SELECT COUNT(*) FROM few_shot_contexts WHERE token_count IS NULL").fetchone()[0] == 0
+
+
+def test_reads_are_cached_and_usage_is_written_behind(db_path):
+    from src.utils.crm_utils import get_few_shot_examples, flush_few_shot_usage
+
+    save_few_shot_examples_bulk([_example("voltage", "480V")], db_path=db_path)
+    first = get_few_shot_examples("filling", "default", "voltage", db_path=db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE few_shot_examples SET confidence_score = 0.1")  # bypasses the cache on purpose
+        assert conn.execute("SELECT usage_count FROM few_shot_examples").fetchone()[0] == 0
+
+    second = get_few_shot_examples("filling", "default", "voltage", db_path=db_path)
+    assert second == first and second[0]["confidence_score"] == 0.75
+    second[0]["expected_output"] = "mutated"  # callers get copies
+
+    assert flush_few_shot_usage(db_path) == 1
+    with sqlite3.connect(db_path) as conn:
+        usage, last_used = conn.execute("SELECT usage_count, last_used_date FROM few_shot_examples").fetchone()
+    assert usage == 2 and last_used
+
+    # Inserting an example invalidates the cached rows
+    save_few_shot_example("filling", "default", "voltage", "Filler 600V", "600V", db_path=db_path)
+    rows = get_few_shot_examples("filling", "default", "voltage", db_path=db_path)
+    assert {row["expected_output"] for row in rows} == {"480V", "600V"}
+
+
+def test_failed_usage_flush_keeps_increments(db_path):
+    from src.utils.crm_utils import UsageCounterBuffer
+
+    save_few_shot_examples_bulk([_example("voltage", "480V")], db_path=db_path)
+    with sqlite3.connect(db_path) as conn:
+        example_id = conn.execute("SELECT id FROM few_shot_examples").fetchone()[0]
+    buffer = UsageCounterBuffer(interval_seconds=3600)
+    buffer.record([example_id], db_path=db_path)
+
+    # The write fails (here: the table is missing); the increment is not dropped
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("ALTER TABLE few_shot_examples RENAME TO few_shot_examples_moved")
+    assert buffer.flush(db_path) == 0
+    buffer.record([example_id], db_path=db_path)
+    assert buffer.pending_count() == 1
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("ALTER TABLE few_shot_examples_moved RENAME TO few_shot_examples")
+    assert buffer.flush(db_path) == 1
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT usage_count FROM few_shot_examples").fetchone()[0] == 2
+
+
+def test_index_reads_do_not_count_usage(db_path):
+    from src.utils.crm_utils import get_all_few_shot_examples, flush_few_shot_usage
+
+    for field_name, context in [("voltage", "Filler 480V"), ("voltage", "Filler 220V"), ("speed", "Filler fast")]:
+        save_few_shot_example("filling", "default", field_name, context, "x", db_path=db_path)
+
+    rows = get_all_few_shot_examples(machine_type="filling", template_type="default",
+                                     field_names=["voltage"], db_path=db_path)
+    assert {row["field_name"] for row in rows} == {"voltage"} and len(rows) == 2
+    assert len(get_all_few_shot_examples(limit_per_field=1, db_path=db_path)) == 2
+
+    flush_few_shot_usage(db_path)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT SUM(usage_count) FROM few_shot_examples").fetchone()[0] == 0
+    conn.close()
@@ -0,0 +1,49 @@
+import os
+
+from openpyxl import Workbook
+
+import src.utils.form_generator as form_generator
+
+
+def _write_template(path, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Form"
+    ws.append(["Section", "Subsection", "Subsub", "Field", "Type", "Placeholder"])
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+
+def test_form_is_only_regenerated_when_template_changes(tmp_path, monkeypatch):
+    excel_path = tmp_path / "GOA_template.xlsx"
+    output_path = tmp_path / "goa_form.html"
+    _write_template(excel_path, [["Electrical", "Power", "", "Voltage", "text", "voltage"]])
+
+    builds = []
+    build_html = form_generator.build_html
+    monkeypatch.setattr(form_generator, "build_html", lambda rows: builds.append(len(rows)) or build_html(rows))
+
+    assert form_generator.generate_goa_form(excel_path, output_path)
+    assert form_generator.generate_goa_form(excel_path, output_path)
+    assert len(builds) == 1
+    assert "voltage" in output_path.read_text(encoding="utf-8")
+
+    # A template edit or a new generator version rebuilds the form
+    _write_template(excel_path, [["Electrical", "Power", "", "Frequency", "text", "frequency"]])
+    os.utime(excel_path, ns=(1, 1))
+    assert form_generator.generate_goa_form(excel_path, output_path)
+    assert "frequency" in output_path.read_text(encoding="utf-8")
+    monkeypatch.setattr(form_generator, "GENERATOR_VERSION", "test")
+    form_generator._FORM_STAMP_CACHE.clear()
+    assert form_generator.generate_goa_form(excel_path, output_path)
+    assert len(builds) == 3
+
+    # Only the form and its stamp are left behind (no temporary files)
+    assert sorted(os.listdir(tmp_path)) == ["GOA_template.xlsx", "goa_form.html", "goa_form.html.stamp.json"]
+
+
+def test_missing_template_fails_without_writing(tmp_path):
+    output_path = tmp_path / "goa_form.html"
+    assert not form_generator.generate_goa_form(tmp_path / "missing.xlsx", output_path)
+    assert not output_path.exists()
@@ -0,0 +1,32 @@
+import pytest
+
+from src.utils.html_doc_filler import fill_html_template, get_fill_plan, _fill_html_template_with_soup
+
+TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>GOA</title></head>
+<body>
+<label class="field checkbox" data-placeholder="{{ light_curtain_check }}"><input type="checkbox" name="light_curtain_check"> Light curtain</label>
+<label class="field checkbox" data-placeholder="{{ no_input_check }}">No input here</label>
+<label class="field" data-placeholder="{{voltage}}"><span>Voltage</span><input type="text" name="voltage" value=""></label>
+<label class="field" data-placeholder="{{ remarks }}"><textarea name="remarks"></textarea></label>
+<label class="field" data-placeholder="{{ options_listing }}"><textarea name="options_listing"></textarea></label>
+<label class="field"><input type="text" name="no_placeholder"></label>
+<p>Static &amp; unchanged <br> text</p>
+</body></html>"""
+
+
+@pytest.mark.parametrize("data", [
+    {},
+    {"light_curtain_check": "YES", "voltage": "480V", "remarks": "", "options_listing": ""},
+    {"light_curtain_check": "no", "voltage": 'say "hi"', "remarks": "it's <b> & &amp;"},
+    {"light_curtain_check": True, "voltage": "both \"'\" quotes", "remarks": "line 1\nline 2"},
+    {"voltage": "- a\n- b", "options_listing": "Selected Options:\n- Option A\n* Option B", "remarks": 42},
+])
+def test_fill_plan_output_is_byte_identical(data):
+    assert fill_html_template(TEMPLATE, data) == _fill_html_template_with_soup(TEMPLATE, data)
+
+
+def test_fill_plan_is_compiled_once():
+    plan = get_fill_plan(TEMPLATE)
+    assert get_fill_plan(TEMPLATE) is plan
+    assert [slot.kind for slot in plan.slots] == ["checkbox", "input", "textarea", "textarea"]
@@ -0,0 +1,182 @@
+from langchain_core.output_parsers import PydanticOutputParser
+
+from src.utils.llm_handler import (
+    partition_fields_into_groups,
+    estimate_field_tokens,
+    estimate_group_latency,
+    build_response_schema,
+    validate_llm_response,
+    select_relevant_fields,
+    apply_field_patch,
+    post_processing_scope,
+    get_llm_chat_update,
+    build_group_models,
+)
+from src.utils import llm_handler
+
+
+def _make_schema(sections):
+    schema = {}
+    for section, count in sections.items():
+        for i in range(count):
+            key = f"{section.lower().replace(' ', '_')}_{i}_check"
+            schema[key] = {
+                "type": "boolean",
+                "section": section,
+                "description": f"{section} - Option {i} (checkbox)",
+            }
+    return schema
+
+
+def test_partition_covers_every_field_once():
+    schema = _make_schema({"Controls": 40, "Filling": 120, "Capping": 30, "Labeling": 60})
+    groups = partition_fields_into_groups(schema, target_latency_seconds=4, shared_prompt_tokens=0)
+
+    assigned = [key for fields in groups.values() for key in fields]
+    assert sorted(assigned) == sorted(schema)
+    assert len(assigned) == len(set(assigned))
+
+
+def test_partition_balances_token_load():
+    schema = _make_schema({"Controls": 40, "Filling": 120, "Capping": 30, "Labeling": 60})
+    groups = partition_fields_into_groups(schema, target_latency_seconds=2.5, shared_prompt_tokens=0)
+    assert len(groups) > 1
+
+    latencies = []
+    for fields in groups.values():
+        prompt_tokens = sum(estimate_field_tokens(k, v)[0] for k, v in fields.items())
+        output_tokens = sum(estimate_field_tokens(k, v)[1] for k, v in fields.items())
+        latencies.append(estimate_group_latency(prompt_tokens, output_tokens, 0))
+    # The slowest group should not dominate: within 25% of the fastest
+    assert max(latencies) <= min(latencies) * 1.25
+
+
+def test_partition_keeps_small_sections_together():
+    schema = _make_schema({"Controls": 10, "Filling": 10, "Capping": 10, "Labeling": 10})
+    groups = partition_fields_into_groups(schema, target_latency_seconds=2.5, shared_prompt_tokens=0)
+
+    for section in ("controls", "filling", "capping", "labeling"):
+        owners = [name for name, fields in groups.items() if any(k.startswith(section) for k in fields)]
+        assert len(owners) == 1, f"Section {section} was split across {owners}"
+
+
+def test_partition_respects_target_latency_and_cache():
+    schema = _make_schema({"Controls": 200})
+    few = partition_fields_into_groups(schema, target_latency_seconds=60, shared_prompt_tokens=0)
+    many = partition_fields_into_groups(schema, target_latency_seconds=3, shared_prompt_tokens=0)
+    assert len(few) == 1
+    assert len(many) > len(few)
+
+    # Same schema and parameters return the cached partition object
+    assert partition_fields_into_groups(schema, target_latency_seconds=3, shared_prompt_tokens=0) is many
+
+
+def test_partition_cache_ignores_small_pdf_length_changes():
+    schema = _make_schema({"Controls": 50})
+    first = partition_fields_into_groups(schema, target_latency_seconds=5, shared_prompt_tokens=3001)
+    # A document of a slightly different length falls in the same bucket
+    assert partition_fields_into_groups(schema, target_latency_seconds=5, shared_prompt_tokens=4217) is first
+
+
+def test_partition_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(llm_handler, "_PARTITION_CACHE", llm_handler.OrderedDict())
+    oldest = _make_schema({"Oldest": 5})
+    partition_fields_into_groups(oldest, target_latency_seconds=5, shared_prompt_tokens=0)
+    for i in range(llm_handler.PARTITION_CACHE_SIZE):
+        partition_fields_into_groups(_make_schema({f"Section {i}": 5}), target_latency_seconds=5, shared_prompt_tokens=0)
+
+    assert len(llm_handler._PARTITION_CACHE) == llm_handler.PARTITION_CACHE_SIZE
+    assert not any(key.startswith(llm_handler._schema_hash(oldest)) for key in llm_handler._PARTITION_CACHE)
+
+
+def test_response_schema_constrains_checkboxes():
+    contexts = {
+        "voltage": {"type": "string", "section": "Utility"},
+        "fat_check": {"type": "boolean", "section": "Validation"},
+        "sat_check": "Site Acceptance Test",
+    }
+    schema = build_response_schema(contexts)
+
+    assert schema["type"] == "object"
+    assert schema["properties"]["voltage"] == {"type": "string"}
+    assert schema["properties"]["fat_check"]["enum"] == ["YES", "NO"]
+    assert schema["properties"]["sat_check"]["enum"] == ["YES", "NO"]
+    assert schema["required"] == list(contexts)
+
+
+def test_text_fallback_parser_accepts_loose_checkbox_values(monkeypatch):
+    monkeypatch.setattr(llm_handler, "STRUCTURED_OUTPUT_ENABLED", True)
+    contexts = {
+        "voltage": {"type": "string", "section": "Utility"},
+        "fat_check": {"type": "boolean", "section": "Validation"},
+    }
+    structured_model, text_model, _ = build_group_models("Validation", contexts)
+
+    assert structured_model.model_json_schema()["properties"]["fat_check"]["anyOf"][0]["enum"] == ["YES", "NO"]
+    parsed = PydanticOutputParser(pydantic_object=text_model).parse('{"voltage": "480V", "fat_check": "Yes"}')
+    assert parsed.fat_check == "Yes"
+
+
+def test_sparse_protocol_allows_omitted_fields():
+    contexts = {
+        "voltage": {"type": "string", "section": "Utility"},
+        "fat_check": {"type": "boolean", "section": "Validation"},
+        "sat_check": {"type": "boolean", "section": "Validation"},
+    }
+    assert "required" not in build_response_schema(contexts, sparse=True)
+
+    sparse_response = {"fat_check": "YES"}
+    assert validate_llm_response(sparse_response, contexts, allow_missing=True) == {}
+    assert set(validate_llm_response(sparse_response, contexts)) == {"voltage", "sat_check"}
+
+
+CHAT_CONTEXTS = {
+    "customer_name": "Customer name",
+    "voltage": {"type": "string", "description": "Supply voltage", "section": "Utility"},
+    "hmi_size10_check": "HMI Screen Size 10 inches",
+    "hmi_size15_check": "HMI Screen Size 15 inches",
+    "vd_f_check": "Factory Acceptance Test (FAT)",
+}
+
+
+def test_select_relevant_fields_for_chat_instruction():
+    assert select_relevant_fields("set voltage to 480", CHAT_CONTEXTS) == ["voltage"]
+    assert set(select_relevant_fields("change HMI to 15 inch", CHAT_CONTEXTS)) == {"hmi_size10_check", "hmi_size15_check"}
+    assert select_relevant_fields("customer_name should be Beta Corp", CHAT_CONTEXTS)[0] == "customer_name"
+    assert select_relevant_fields("something unrelated", CHAT_CONTEXTS) == []
+
+
+def test_apply_field_patch_reports_changed_keys():
+    current = {"voltage": "240", "vd_f_check": "YES", "customer_name": "ACME"}
+    patch = {"voltage": 480, "vd_f_check": "no", "customer_name": "ACME", "hmi_size10_check": "MAYBE", "bogus": "x"}
+    updated, changed = apply_field_patch(current, patch, CHAT_CONTEXTS)
+
+    assert changed == ["voltage", "vd_f_check"]
+    assert updated == {"voltage": "480", "vd_f_check": "NO", "customer_name": "ACME"}
+    assert current["voltage"] == "240"
+
+
+def test_post_processing_scope_includes_rule_families():
+    keys = ["customer_name", "voltage", "hmi_size10_check", "hmi_size15_check", "vd_f_check"]
+    assert post_processing_scope(["voltage"], keys) == ["voltage"]
+    assert post_processing_scope(["hmi_size15_check"], keys) == ["hmi_size10_check", "hmi_size15_check"]
+
+
+def test_chat_patch_leaves_unrelated_fields_untouched(monkeypatch):
+    contexts = {
+        "customer_name": "Customer name",
+        "fat_check": {"type": "boolean", "section": "Validation", "positive_indicators": ["fat"]},
+        "sat_check": {"type": "boolean", "section": "Validation", "positive_indicators": ["site acceptance"]},
+    }
+    # sat_check has no evidence in the PDF; a full post-processing pass would flip it to NO
+    current = {"customer_name": "ACME", "fat_check": "NO", "sat_check": "YES"}
+    monkeypatch.setattr(llm_handler, "GENERATIVE_MODEL", object())
+    monkeypatch.setattr(llm_handler, "CHAT_PATCH_MODE_ENABLED", True)
+    monkeypatch.setattr(llm_handler, "get_llm_chat_patch", lambda *args: {"fat_check": "YES"})
+
+    updated = get_llm_chat_update(current, "add FAT", [], contexts, "Includes FAT at our facility")
+
+    assert updated["fat_check"] == "YES"
+    assert updated["sat_check"] == "YES"
+    assert updated["customer_name"] is current["customer_name"]
+    assert current == {"customer_name": "ACME", "fat_check": "NO", "sat_check": "YES"}
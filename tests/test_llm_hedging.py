@@ -0,0 +1,106 @@
+import threading
+
+from src.utils import llm_hedging
+from src.utils.llm_hedging import HedgingPolicy, hedged_call
+
+
+def _warm_policy(policy, latency=0.01, samples=20):
+    for _ in range(samples):
+        policy.record_latency(latency)
+    policy.calls = samples
+
+
+def test_fast_call_is_not_hedged():
+    policy = HedgingPolicy(min_delay_seconds=0.0)
+    _warm_policy(policy, latency=0.2)
+
+    assert hedged_call(policy, lambda: "ok") == "ok"
+    assert policy.hedges_issued == 0
+
+
+def test_slow_call_is_hedged_and_hedge_wins():
+    policy = HedgingPolicy(max_extra_rate=0.5, min_delay_seconds=0.0)
+    _warm_policy(policy, latency=0.01)
+    release_primary = threading.Event()
+    primary_done = threading.Event()
+    attempts = []
+    lock = threading.Lock()
+
+    def backend():
+        with lock:
+            attempt = len(attempts)
+            attempts.append(attempt)
+        if attempt == 0:
+            # The primary hits the heavy tail and only returns once released
+            release_primary.wait(timeout=5)
+            primary_done.set()
+        return f"attempt-{attempt}"
+
+    try:
+        assert hedged_call(policy, backend) == "attempt-1"
+    finally:
+        release_primary.set()
+    assert policy.hedges_issued == 1
+    assert policy.hedge_wins == 1
+
+    # Only the winner's latency is recorded, not the abandoned primary's
+    assert primary_done.wait(timeout=5)
+    assert policy.stats()["samples"] == 21
+
+
+def test_no_hedge_without_a_free_worker(monkeypatch):
+    monkeypatch.setattr(llm_hedging, "HEDGE_MAX_WORKERS", 1)
+    policy = HedgingPolicy(max_extra_rate=0.5, min_delay_seconds=0.0)
+    _warm_policy(policy, latency=0.001)
+    decided = threading.Event()
+    reserve_worker = llm_hedging._reserve_worker
+
+    def reserve_hedge_worker(required):
+        reserved = reserve_worker(required)
+        if not required:
+            decided.set()
+        return reserved
+
+    monkeypatch.setattr(llm_hedging, "_reserve_worker", reserve_hedge_worker)
+
+    # The call stays in flight until the hedge decision has been made
+    assert hedged_call(policy, lambda: decided.wait(timeout=5) and "slow") == "slow"
+    assert policy.hedges_issued == 0
+    assert policy.no_free_worker == 1
+    assert policy.budget_denied == 0
+
+
+def test_budget_caps_extra_request_rate():
+    decided = threading.Event()
+
+    class GatedPolicy(HedgingPolicy):
+        def try_acquire_hedge(self):
+            acquired = super().try_acquire_hedge()
+            decided.set()
+            return acquired
+
+    policy = GatedPolicy(max_extra_rate=0.0, min_delay_seconds=0.0)
+    _warm_policy(policy, latency=0.001)
+
+    assert hedged_call(policy, lambda: decided.wait(timeout=5) and "slow") == "slow"
+    assert policy.hedges_issued == 0
+    assert policy.budget_denied == 1
+    assert policy.stats()["extra_request_rate"] == 0.0
+
+
+def test_disabled_policy_still_records_latency():
+    policy = HedgingPolicy(enabled=False)
+    hedged_call(policy, lambda: None)
+
+    stats = policy.stats()
+    assert stats["calls"] == 1
+    assert stats["samples"] == 1
+    assert stats["hedges_issued"] == 0
+
+
+def test_unhedged_call_runs_inline():
+    policy = HedgingPolicy()
+    caller = threading.current_thread()
+
+    assert hedged_call(policy, lambda: threading.current_thread()) is caller
+    assert policy.stats()["samples"] == 1
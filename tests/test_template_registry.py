@@ -0,0 +1,78 @@
+import os
+
+from openpyxl import Workbook
+
+import src.utils.template_registry as template_registry
+from src.utils.form_generator import extract_schema_from_excel, get_all_fields_from_excel
+
+
+def _write_template(path, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Form"
+    ws.append(["Section", "Subsection", "Subsub", "Field", "Type", "Placeholder"])
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+
+ROWS = [
+    ["Electrical", "Power", "", "Voltage", "text", "voltage"],
+    ["Electrical", "Safety", "", "Light curtain", "checkbox", "light_curtain_check"],
+    ["Option Listing", "", "", "Options", "textarea", "options_listing"],
+]
+
+
+def test_schema_is_compiled_once_and_recompiled_on_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(template_registry, "TEMPLATE_REGISTRY_DIRECTORY", str(tmp_path / "registry"))
+    template_registry.clear_template_registry()
+    for key in template_registry.REGISTRY_STATS:
+        monkeypatch.setitem(template_registry.REGISTRY_STATS, key, 0)
+    excel_path = tmp_path / "GOA_template.xlsx"
+    _write_template(excel_path, ROWS)
+
+    schema = template_registry.get_excel_schema(excel_path)
+    assert schema == extract_schema_from_excel(excel_path)
+    assert template_registry.get_excel_fields(excel_path) == get_all_fields_from_excel(excel_path)
+    assert template_registry.get_excel_template(excel_path)["outline"]["Electrical"] == {
+        "Power": ["voltage"], "Safety": ["light_curtain_check"]
+    }
+
+    # Steady state: served from memory; a new process loads the persisted artifact
+    template_registry.get_excel_schema(excel_path)
+    template_registry.clear_template_registry()
+    assert template_registry.get_excel_schema(excel_path) == schema
+    assert template_registry.REGISTRY_STATS == {"hits": 3, "loads": 1, "compiles": 1}
+
+    # Editing the template recompiles it
+    _write_template(excel_path, ROWS + [["Electrical", "Power", "", "Frequency", "text", "frequency"]])
+    os.utime(excel_path, ns=(1, 1))
+    assert "frequency" in template_registry.get_excel_schema(excel_path)
+    assert template_registry.REGISTRY_STATS["compiles"] == 2
+    assert len(os.listdir(tmp_path / "registry")) == 2
+
+
+def test_missing_template_returns_empty_schema(tmp_path):
+    assert template_registry.get_excel_schema(tmp_path / "missing.xlsx") == {}
+
+
+def test_returned_schema_is_a_private_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(template_registry, "TEMPLATE_REGISTRY_DIRECTORY", str(tmp_path / "registry"))
+    template_registry.clear_template_registry()
+    excel_path = tmp_path / "GOA_template.xlsx"
+    _write_template(excel_path, ROWS)
+
+    schema = template_registry.get_excel_schema(excel_path)
+    schema["light_curtain_check"]["synonyms"] = ["mutated"]
+    schema.pop("voltage")
+    template_registry.get_excel_fields(excel_path)["voltage"] = "mutated"
+
+    assert template_registry.get_excel_schema(excel_path) == extract_schema_from_excel(excel_path)
+    assert template_registry.get_excel_fields(excel_path) == get_all_fields_from_excel(excel_path)
+
+
+def test_artifact_key_changes_with_compiler_source(tmp_path, monkeypatch):
+    monkeypatch.setattr(template_registry, "TEMPLATE_REGISTRY_DIRECTORY", str(tmp_path / "registry"))
+    path = template_registry._artifact_path("excel", ["abc"], "options")
+    monkeypatch.setattr(template_registry, "TEMPLATE_COMPILER_FINGERPRINT", "edited")
+    assert template_registry._artifact_path("excel", ["abc"], "options") != path
@@ -0,0 +1,80 @@
+import sqlite3
+
+import src.utils.warmup as warmup
+from src.utils.crm_utils import init_db, save_few_shot_examples_bulk, get_most_used_few_shot_fields
+
+
+def test_most_used_fields_are_ranked_by_usage(tmp_path):
+    db_path = str(tmp_path / "crm_test.db")
+    init_db(db_path)
+    save_few_shot_examples_bulk([
+        {"machine_type": "filling", "template_type": "default", "field_name": name,
+         "input_context": f"ctx {name}", "expected_output": "YES"}
+        for name in ("voltage", "hmi_size", "fat_check")
+    ], db_path=db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE few_shot_examples SET usage_count = 7 WHERE field_name = 'hmi_size'")
+        conn.execute("UPDATE few_shot_examples SET usage_count = 3 WHERE field_name = 'fat_check'")
+
+    fields = get_most_used_few_shot_fields(limit=2, db_path=db_path)
+    assert [(f["field_name"], f["usage_count"]) for f in fields] == [("hmi_size", 7), ("fat_check", 3)]
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [0.0]
+
+
+class FakeManager:
+    def __init__(self, embeddings):
+        self.indexed = []
+        self.embeddings = embeddings
+
+    def preload_indexes(self, machine_type, template_type, field_names):
+        self.indexed.append((machine_type, template_type, list(field_names)))
+        return 0
+
+    def select_best_examples_batch(self, *args, **kwargs):
+        raise AssertionError("warm-up must not run lookups that count as usage")
+
+
+def test_warm_up_preloads_most_used_fields_per_template(monkeypatch, tmp_path):
+    import src.utils.few_shot_enhanced as few_shot_enhanced
+
+    # The warm-up query goes to the embedding client even when the cache has it
+    client = FakeEmbeddings()
+    cached = few_shot_enhanced.CachedEmbeddings(client, "fake-model", cache_path=str(tmp_path / "cache.sqlite3"))
+    cached.embed_query(warmup.WARMUP_QUERY_TEXT)
+    manager = FakeManager(cached)
+    monkeypatch.setattr(warmup, "configure_gemini_client", lambda: True)
+    monkeypatch.setattr(warmup, "get_extraction_llm", lambda: object())
+    monkeypatch.setattr(few_shot_enhanced, "get_few_shot_manager", lambda: manager)
+    monkeypatch.setattr(warmup, "get_most_used_few_shot_fields", lambda limit: [
+        {"machine_type": "filling", "template_type": "default", "field_name": "voltage"},
+        {"machine_type": "sortstar", "template_type": "sortstar", "field_name": "speed"},
+        {"machine_type": "filling", "template_type": "default", "field_name": "fat_check"},
+    ][:limit])
+
+    status = warmup.warm_up(top_fields=3)
+    assert status["state"] == "done" and status["fields"] == 3
+    assert manager.indexed == [("filling", "default", ["voltage", "fat_check"]),
+                               ("sortstar", "sortstar", ["speed"])]
+    assert client.queries == [warmup.WARMUP_QUERY_TEXT] * 2
+
+
+def test_background_warmup_is_opt_in_and_started_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(warmup, "warm_up", lambda: calls.append(1))
+    monkeypatch.setattr(warmup, "_WARMUP_THREAD", None)
+    monkeypatch.setattr(warmup, "WARMUP_ENABLED", False)
+    assert warmup.start_background_warmup() is None
+
+    monkeypatch.setattr(warmup, "WARMUP_ENABLED", True)
+    thread = warmup.start_background_warmup()
+    assert warmup.start_background_warmup() is thread
+    thread.join(timeout=5)
+    assert calls == [1]